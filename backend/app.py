@@ -1,18 +1,25 @@
 import os
-from fastapi import FastAPI, HTTPException, status, Header, Response, Request, UploadFile, File, Body
+import json
+import asyncio
+from fastapi import FastAPI, HTTPException, status, Header, Response, Request, UploadFile, File, Body, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from typing import Optional, List, Tuple, Dict, Any
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Optional, List, Dict, Any
 from hashlib import sha256
 import hmac
 import secrets
 from datetime import datetime, timedelta, timezone
 import re
+import threading
+from collections import OrderedDict
 from fastapi import Form
+from starlette.concurrency import run_in_threadpool
 
 from models import LoginRequest, LoginResponse, AddUserRequest, AddUserResponse, HashPasswordResponse, User, ListUsersResponse, UpdateUserRequest
-from storage import get_user, add_user, get_all_users, update_user, delete_user
-from security import verify_password, hash_password
+from storage import get_user, add_user, get_all_users, update_user, delete_user, add_user_listener, set_password_hash
+from security import verify_password, hash_password, needs_rehash, submit_password_job, password_stats, PasswordBusy
 from models import (
     Client,
     AddClientRequest,
@@ -41,25 +48,35 @@ from storage_image_editor import save_original, process_image, get_metadata, get
 from storage_image_editor import get_pose_landmarks
 # ADD: LUTs
 from models import LUTPreset, ListLUTsResponse, AddLUTRequest, AddLUTResponse, DeleteLUTResponse
-from storage_luts import get_luts_for_user, add_lut, get_lut_by_id, delete_lut
+from storage_luts import get_luts_for_user, add_lut, get_lut_by_id, delete_lut, compiled_for_params
 # NOVO: galeria por evento
 from storage_events import get_event_by_id
-from storage_gallery import list_gallery_for_event, add_images_to_event, apply_lut_for_event_images, delete_event_images, set_event_images_discarded
+from storage_jobs import get_job, request_cancel, resume_jobs
+from storage_cache import cache_stats as csv_cache_stats
+from storage_uploads import stage_upload, discard as discard_upload, UploadTooLarge
+from storage_encoding import get_policy as get_encoding_policy, set_event_policy as set_event_encoding_policy
+from vision import warmup as vision_warmup, vision_stats
+from workers import VISION_WARMUP
+from storage_gallery import list_gallery_for_event, ingest_images, apply_lut_for_event_images, start_apply_lut_job, delete_event_images, set_event_images_discarded, rebuild_face_index, ensure_image_derivative, query_gallery_for_event
 from storage_finance import record_purchase, get_finance_summary, list_finance_purchases
 # ADDED: storage_hierarchy
 from storage_hierarchy import list_all as hierarchy_list_all, add_root as hierarchy_add_root, add_child as hierarchy_add_child, update_node as hierarchy_update_node, delete_node as hierarchy_delete_node
 # ADDED
 from storage_hierarchy import add_category as hierarchy_add_category, remove_category as hierarchy_remove_category
+from storage_hierarchy import subtree_ids as hierarchy_subtree_ids, get_path as hierarchy_get_path, path_names as hierarchy_path_names
 # ADDED: assets & logs
 from storage_assets import list_assets as assets_list, add_asset as assets_add, update_asset as assets_update, delete_asset as assets_delete
 from storage_assets import list_categories as assets_list_categories, add_category as assets_add_category, remove_category as assets_remove_category
-from storage_assets import get_all_assets_flat
+from storage_assets import get_all_assets_flat, get_asset as assets_get, lookup_codes as assets_lookup_codes
+from storage_assets import list_assets_in as assets_list_in, list_subtree_assets as assets_list_subtree, subtree_asset_counts as assets_subtree_counts
+from storage_assets import start_asset_import_job, validate_asset_import, iter_assets_csv, export_assets_xlsx, xlsx_supported
 from storage_logs import append_log, list_logs as logs_list
 from models import Asset, AssetListResponse, AddAssetRequest, UpdateAssetRequest, CategoryListResponse, LogListResponse, LogItem
 # ADDED: verifications
 from storage_verifications import (
     get_custom_lists, add_custom_list, delete_custom_list,
-    get_sessions, get_session, start_session, update_session_status, verify_item_in_session
+    get_sessions, get_session, start_session, update_session_status, verify_item_in_session,
+    verify_batch_in_session, verification_stats, session_progress, VERIFY_BATCH_MAX
 )
 
 # ADD: importar funções de eventos usadas abaixo
@@ -139,6 +156,10 @@ COOKIE_SECURE = os.environ.get("COOKIE_SECURE", "").lower() in ("1", "true", "ye
 COOKIE_SAMESITE = os.environ.get("COOKIE_SAMESITE", "lax").lower()
 COOKIE_DOMAIN = os.environ.get("COOKIE_DOMAIN", "").strip() or None
 SESSION_TTL = int(os.environ.get("SESSION_TTL", "86400"))
+# NOVO: sessões já verificadas ficam em memória (por worker) por até N segundos; alterações
+# de usuário neste worker invalidam na hora, nos outros valem no máximo após esse prazo
+SESSION_CACHE_TTL = int(os.environ.get("SESSION_CACHE_TTL", "60"))
+SESSION_CACHE_MAX = int(os.environ.get("SESSION_CACHE_MAX", "10000"))
 
 LIMIT_BYTES = 50 * 1024 * 1024  # 50 MB por cliente
 
@@ -200,7 +221,25 @@ def _make_session_token(username: str, role: Optional[str]) -> str:
     sig = hmac.new(SESSION_SECRET.encode(), payload.encode(), sha256).hexdigest()
     return f"v1|{username}|{payload_role}|{exp}|{nonce}|{sig}"
 
-def _verify_session_token(token: str) -> Optional[dict]:
+_session_lock = threading.Lock()
+_session_cache: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (válido até, sessão)
+_session_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def _resolve_session(token: str) -> Optional[dict]:
+    """
+    Sessão verificada: {username, role, user, allowed_pages}. Do cache quando possível
+    (sem HMAC nem leitura de usuários); senão valida o token e resolve o usuário.
+    """
+    now = datetime.now(timezone.utc).timestamp()
+    with _session_lock:
+        hit = _session_cache.get(token)
+        if hit is not None:
+            if hit[0] > now:
+                _session_cache.move_to_end(token)
+                _session_stats["hits"] += 1
+                return hit[1]
+            del _session_cache[token]
+        _session_stats["misses"] += 1
     try:
         parts = token.split("|")
         if len(parts) != 6 or parts[0] != "v1":
@@ -211,14 +250,49 @@ def _verify_session_token(token: str) -> Optional[dict]:
         if not hmac.compare_digest(sig, expected_sig):
             return None
         exp = int(exp_str)
-        if exp < int(datetime.now(timezone.utc).timestamp()):
+        if exp < int(now):
             return None
         user = get_user(username)
         if not user:
             return None
-        return {"username": username, "role": role or user.get("role") or ""}
     except Exception:
         return None
+    session = {
+        "username": username,
+        "role": role or user.get("role") or "",
+        "user": user,
+        "allowed_pages": user.get("allowed_pages") or default_allowed_pages(user.get("role")),
+    }
+    if SESSION_CACHE_TTL > 0:
+        with _session_lock:
+            _session_cache[token] = (min(float(exp), now + SESSION_CACHE_TTL), session)
+            while len(_session_cache) > SESSION_CACHE_MAX:
+                _session_cache.popitem(last=False)
+    return session
+
+def _verify_session_token(token: str) -> Optional[dict]:
+    session = _resolve_session(token) if token else None
+    if not session:
+        return None
+    return {"username": session["username"], "role": session["role"]}
+
+def _forget_user_sessions(username: str):
+    """Descarta as sessões em cache do usuário (chamado por storage em update_user/delete_user)."""
+    with _session_lock:
+        stale = [t for t, (_, sess) in _session_cache.items() if sess["username"] == username]
+        for t in stale:
+            del _session_cache[t]
+        _session_stats["invalidations"] += len(stale)
+
+add_user_listener(_forget_user_sessions)
+
+def session_cache_stats() -> Dict[str, Any]:
+    with _session_lock:
+        st = dict(_session_stats)
+        st["entries"] = len(_session_cache)
+    total = st["hits"] + st["misses"]
+    st["hit_ratio"] = round(st["hits"] / total, 4) if total else None
+    return st
 
 def default_allowed_pages(role: Optional[str]) -> List[str]:
     # keys: "home","teste","clients","admin:add-user","users","kanban","events"
@@ -253,11 +327,10 @@ def _require_event_member(request: Request, event_id: int) -> dict:
 
 def _require_page_access(request: Request, page_key: str) -> dict:
     token = request.cookies.get("session")
-    data = _verify_session_token(token or "")
+    data = _resolve_session(token or "") if token else None
     if not data:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado.")
-    user = get_user(data["username"])
-    pages = (user or {}).get("allowed_pages") or default_allowed_pages((user or {}).get("role"))
+    pages = data["allowed_pages"]
     if page_key not in pages:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso restrito.")
     return {"username": data["username"]}
@@ -276,19 +349,38 @@ def token_check():
 
 # ----- Auth -----
 
+def _rehash_password(username: str, password: str, old_hash: str):
+    set_password_hash(username, hash_password(password), old_hash)
+
 @app.post("/auth/login", response_model=LoginResponse)
-def auth_login(payload: LoginRequest, response: Response):
-    user = get_user(payload.username)
+async def auth_login(payload: LoginRequest, response: Response):
+    # leitura de usuários (CSV/SQLite) fora do event loop
+    user = await run_in_threadpool(get_user, payload.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciais inválidas.",
         )
-    if not verify_password(payload.password, user["password_hash"]):
+    # NOVO: hash no executor de senhas (limitado); fila cheia -> 503 imediato
+    try:
+        ok = await asyncio.wrap_future(submit_password_job(verify_password, payload.password, user["password_hash"]))
+    except PasswordBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitos logins simultâneos. Tente novamente em instantes.",
+            headers={"Retry-After": "1"},
+        )
+    if not ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciais inválidas.",
         )
+    if needs_rehash(user["password_hash"]):
+        # esquema/parâmetros antigos: regrava em segundo plano (fila cheia: fica para o próximo login)
+        try:
+            submit_password_job(_rehash_password, user["username"], payload.password, user["password_hash"])
+        except PasswordBusy:
+            pass
     token = _make_session_token(user["username"], user.get("role"))
     response.set_cookie(
         key="session",
@@ -308,11 +400,11 @@ def auth_me(request: Request):
     token = request.cookies.get("session")
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado.")
-    data = _verify_session_token(token)
+    data = _resolve_session(token)
     if not data:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Sessão inválida ou expirada.")
-    user = get_user(data["username"])
-    allowed = (user or {}).get("allowed_pages") or default_allowed_pages((user or {}).get("role"))
+    user = data["user"]
+    allowed = data["allowed_pages"]
     # Include extra user info for UI
     return LoginResponse(
         success=True,
@@ -325,6 +417,10 @@ def auth_me(request: Request):
 
 @app.post("/auth/logout")
 def auth_logout(response: Response, request: Request):
+    token = request.cookies.get("session")
+    if token:
+        with _session_lock:
+            _session_cache.pop(token, None)
     response.delete_cookie(key="session", domain=COOKIE_DOMAIN, path="/")
     return {"success": True}
 
@@ -641,14 +737,18 @@ async def clients_file_upload(client_id: int, request: Request, file: UploadFile
     if not token or not _verify_session_token(token):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado.")
     total = total_client_files_size_bytes(client_id)
-    content = await file.read()
-    new_size = len(content)
-    if total + new_size > LIMIT_BYTES:
+    # NOVO: grava em blocos num temporário e para assim que passar do limite restante
+    try:
+        staged = await stage_upload(file, limit=max(0, LIMIT_BYTES - total))
+    except UploadTooLarge:
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail="Limite de 50MB por cliente excedido."
         )
-    name, size_bytes, url = save_client_file(client_id, file.filename, content)
+    try:
+        name, size_bytes, url = await run_in_threadpool(save_client_file, client_id, file.filename, staged)
+    finally:
+        discard_upload(staged.path)
     return UploadClientFileResponse(
         success=True,
         message="Arquivo anexado com sucesso.",
@@ -895,21 +995,92 @@ def events_gallery_list(event_id: int, request: Request):
     _require_event_member(request, event_id)
     return list_gallery_for_event(event_id)
 
+# NOVO: listagem paginada (cursor) com filtros, ordenação e projeção de campos
+@app.get("/events/{event_id}/gallery/images")
+def events_gallery_images(
+    event_id: int,
+    request: Request,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "upload",
+    order: str = "asc",
+    uploader: Optional[str] = None,
+    discarded: Optional[bool] = None,
+    sharpness_min: Optional[float] = None,
+    sharpness_max: Optional[float] = None,
+    has_edit: Optional[bool] = None,
+    lut_id: Optional[int] = None,
+    uploaded_from: Optional[str] = None,
+    uploaded_to: Optional[str] = None,
+    fields: Optional[str] = None,
+    with_total: bool = False,
+):
+    _require_event_member(request, event_id)
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="order deve ser asc ou desc.")
+    filters = {
+        "uploader": [u.strip() for u in uploader.split(",") if u.strip()] if uploader else None,
+        "discarded": discarded,
+        "sharpness_min": sharpness_min,
+        "sharpness_max": sharpness_max,
+        "has_edit": has_edit,
+        "lut_id": lut_id,
+        "uploaded_from": uploaded_from,
+        "uploaded_to": uploaded_to,
+    }
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        return query_gallery_for_event(event_id, filters, sort, order == "desc", limit, cursor, field_list, with_total)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+# NOVO: política de codificação das saídas do evento (editadas / marca d'água)
+@app.get("/events/{event_id}/gallery/encoding")
+def events_gallery_encoding_get(event_id: int, request: Request):
+    _require_event_member(request, event_id)
+    return get_encoding_policy(event_id)
+
+@app.put("/events/{event_id}/gallery/encoding")
+def events_gallery_encoding_set(event_id: int, payload: dict, request: Request):
+    _require_event_member(request, event_id)
+    try:
+        return set_event_encoding_policy(event_id, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+# NOVO: miniatura/prévia gerada na primeira requisição (fotos anteriores aos derivados)
+@app.get("/events/{event_id}/gallery/{image_id}/{kind}")
+def events_gallery_derivative(event_id: int, image_id: str, kind: str, request: Request, variant: str = "original"):
+    _require_event_member(request, event_id)
+    if kind not in ("thumb", "preview"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tipo de derivado inválido.")
+    path = ensure_image_derivative(event_id, image_id, kind, variant)
+    if not path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Imagem não encontrada.")
+    # endereçado pelo conteúdo: o mesmo caminho nunca muda de conteúdo
+    return FileResponse(path, headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
 @app.post("/events/{event_id}/gallery/upload")
 async def events_gallery_upload(event_id: int, request: Request, files: List[UploadFile] = File(...), sharpness_threshold: Optional[float] = Form(None), price_brl: Optional[float] = Form(None)):
     member = _require_event_member(request, event_id)
-    contents: List[Tuple[str, bytes]] = []
-    for f in files:
-        data = await f.read()
-        contents.append((f.filename, data))
-    # repassa threshold (se none, storage usará padrão)
-    created = add_images_to_event(event_id, member["username"], contents, sharpness_threshold, price_brl)
-    # retorna apenas ids e contagem
-    return {"count": len(created), "image_ids": [c["id"] for c in created]}
+    # NOVO: cada arquivo vai em blocos para um temporário em disco (hash e tamanho calculados na cópia);
+    # a ingestão só move os arquivos e a análise decodifica a partir deles
+    staged = []
+    try:
+        for f in files:
+            staged.append((f.filename, await stage_upload(f)))
+        # repassa threshold (se none, storage usará padrão)
+        # análise roda no pool de processos; a thread do threadpool só aguarda (não bloqueia o event loop)
+        created, stats = await run_in_threadpool(ingest_images, event_id, member["username"], staged, sharpness_threshold, price_brl)
+    finally:
+        for _, item in staged:
+            discard_upload(item.path)
+    # retorna ids, contagem e vazão por etapa
+    return {"count": len(created), "image_ids": [c["id"] for c in created], "stats": stats}
 
 @app.post("/events/{event_id}/gallery/apply-lut")
 def events_gallery_apply_lut(event_id: int, payload: dict, request: Request):
-    _require_event_member(request, event_id)
+    member = _require_event_member(request, event_id)
     image_ids = list(payload.get("image_ids") or [])
     lut_id = payload.get("lut_id")
     params: dict = {}
@@ -918,6 +1089,10 @@ def events_gallery_apply_lut(event_id: int, payload: dict, request: Request):
         if not preset:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="LUT não encontrado.")
         params = dict(preset.get("params") or {})
+    # NOVO: modo assíncrono (lotes grandes) -> retorna job_id imediatamente; progresso em GET /jobs/{id}
+    if payload.get("async"):
+        job = start_apply_lut_job(event_id, image_ids, params, lut_id if lut_id is not None else None, owner=member["username"])
+        return {"job_id": job["id"], "status": job["status"], "total": job["total"]}
     processed = apply_lut_for_event_images(event_id, image_ids, params, lut_id if lut_id is not None else None)
     return {"processed": processed}
 
@@ -933,6 +1108,70 @@ def events_gallery_delete(event_id: int, payload: dict, request: Request):
     deleted = delete_event_images(event_id, image_ids)
     return {"deleted": deleted}
 
+# ----- Jobs em segundo plano -----
+
+def _require_job_access(request: Request, job_id: str) -> dict:
+    job = get_job(job_id, include_items=False)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado.")
+    event_id = (job.get("params") or {}).get("event_id")
+    if event_id is not None:
+        _require_event_member(request, int(event_id))
+    else:
+        data = _verify_session_token(request.cookies.get("session") or "")
+        if not data or data["username"] != job.get("owner"):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso restrito.")
+    return job
+
+@app.get("/jobs/{job_id}")
+def jobs_get(job_id: str, request: Request, include_items: bool = True):
+    _require_job_access(request, job_id)
+    job = get_job(job_id, include_items=include_items)
+    # parâmetros internos (ex.: ajustes completos do LUT) não são expostos
+    job.pop("params", None)
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+def jobs_cancel(job_id: str, request: Request):
+    _require_job_access(request, job_id)
+    job = request_cancel(job_id)
+    job.pop("params", None)
+    return job
+
+@app.on_event("startup")
+def _resume_background_jobs():
+    # jobs interrompidos por reinício continuam de onde pararam
+    resume_jobs()
+
+@app.on_event("startup")
+def _warmup_vision():
+    # modelos de visão carregados no boot (tempo reportado em /vision/stats)
+    if VISION_WARMUP:
+        vision_warmup()
+
+@app.get("/vision/stats")
+def vision_stats_endpoint(request: Request):
+    token = request.cookies.get("session")
+    data = _verify_session_token(token or "")
+    if not data:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado.")
+    return vision_stats()
+
+@app.get("/auth/password/stats")
+def password_stats_endpoint(request: Request):
+    token = request.cookies.get("session")
+    data = _verify_session_token(token or "")
+    if not data:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado.")
+    return password_stats()
+
+# NOVO: recalcular índice de rostos do evento (eventos antigos / manutenção)
+@app.post("/events/{event_id}/gallery/face-index/rebuild")
+def events_gallery_face_index_rebuild(event_id: int, request: Request):
+    _require_event_member(request, event_id)
+    faces = rebuild_face_index(event_id)
+    return {"faces": faces}
+
 # NOVO: marcar/ reverter descarte em massa
 @app.post("/events/{event_id}/gallery/mark-discarded")
 def events_gallery_mark_discarded(event_id: int, payload: dict, request: Request):
@@ -982,7 +1221,8 @@ def public_event_info(event_id: int):
     }
 
 from fastapi import UploadFile, File
-from storage_gallery import face_search_in_event
+from storage_gallery import face_index_pending, face_search_in_event, watermarked_image_path
+from storage_watermark import watermark_cache_stats
 
 @app.post("/public/events/{event_id}/face-search")
 async def public_event_face_search(event_id: int, file: UploadFile = File(...)):
@@ -992,8 +1232,40 @@ async def public_event_face_search(event_id: int, file: UploadFile = File(...)):
     data = await file.read()
     if not data:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Imagem inválida.")
-    matches = face_search_in_event(event_id, data)
-    return {"count": len(matches), "matches": matches}
+    # eventos ainda sem índice de rostos: indexação em segundo plano, o cliente tenta de novo
+    if await run_in_threadpool(face_index_pending, event_id):
+        return {"count": 0, "matches": [], "indexing": True}
+    matches = await run_in_threadpool(face_search_in_event, event_id, data)
+    return {"count": len(matches), "matches": matches, "indexing": False}
+
+# NOVO: versão com marca d'água em tamanho limitado, renderizada sob demanda (cache LRU em disco)
+@app.get("/public/events/{event_id}/gallery/{image_id}/watermarked")
+def public_event_watermarked(event_id: int, image_id: str, size: Optional[int] = None):
+    if not get_event_by_id(event_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Evento não encontrado.")
+    path = watermarked_image_path(event_id, image_id, size)
+    if not path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Imagem não encontrada.")
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=86400"})
+
+@app.get("/gallery/watermark/stats")
+def gallery_watermark_stats(request: Request):
+    token = request.cookies.get("session")
+    data = _verify_session_token(token or "")
+    if not data:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado.")
+    return watermark_cache_stats()
+
+# NOVO: acertos/recargas do cache das tabelas CSV e das sessões verificadas (por processo)
+@app.get("/storage/cache/stats")
+def storage_cache_stats(request: Request):
+    token = request.cookies.get("session")
+    data = _verify_session_token(token or "")
+    if not data:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado.")
+    out = csv_cache_stats()
+    out["sessions"] = session_cache_stats()
+    return out
 
 @app.post("/public/purchase")
 def public_purchase(payload: dict):
@@ -1038,8 +1310,8 @@ async def image_editor_upload(request: Request, file: UploadFile = File(...)):
     data = _verify_session_token(token or "")
     if not data:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado.")
-    content = await file.read()
-    saved = save_original(content, file.filename)
+    staged = await stage_upload(file)
+    saved = await run_in_threadpool(save_original, staged, file.filename)
     return saved
 
 @app.post("/image-editor/process")
@@ -1052,7 +1324,7 @@ def image_editor_process(payload: dict, request: Request):
     if not image_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="image_id obrigatório.")
     params = dict(payload.get("params") or {})
-    out = process_image(image_id, params)
+    out = process_image(image_id, params, compiled_for_params(params))
     return out
 
 @app.get("/image-editor/meta/{image_id}")
@@ -1363,6 +1635,28 @@ def hierarchy_list(request: Request):
         raise HTTPException(status_code=401, detail="Não autenticado.")
     return hierarchy_list_all()
 
+# NOVO: subárvore de um nó pelo índice de caminhos (ids descendentes, caminho e ativos por subárvore)
+@app.get("/hierarchy/{node_id}/subtree")
+def hierarchy_subtree(node_id: str, request: Request, counts: bool = True):
+    token = request.cookies.get("session")
+    if not token or not _verify_session_token(token):
+        raise HTTPException(status_code=401, detail="Não autenticado.")
+    ids = hierarchy_subtree_ids(node_id)
+    if ids is None:
+        raise HTTPException(status_code=404, detail="Nó não encontrado.")
+    out = {
+        "node_id": node_id,
+        "path": hierarchy_get_path(node_id) or [],
+        "path_names": hierarchy_path_names(node_id),
+        "ids": ids,
+        "count": len(ids),
+    }
+    if counts:
+        per_node = assets_subtree_counts(node_id) or {}
+        out["assets"] = per_node.get(node_id, {"own": 0, "total": 0})
+        out["asset_counts"] = per_node
+    return out
+
 # ADDED: categorias (add/remove)
 @app.post("/hierarchy/categories")
 def hierarchy_category_add(request: Request, payload: Dict[str, Any] = Body(...)):
@@ -1458,10 +1752,14 @@ def hierarchy_delete_endpoint(node_id: str, request: Request):
 
 # === Ativos por unidade (protegido por acesso às Unidades) ===
 @app.get("/units/{unit_id}/assets", response_model=AssetListResponse)
-def unit_assets_list(unit_id: str, request: Request, q: Optional[str] = None, sort: Optional[str] = "name_asc"):
+def unit_assets_list(unit_id: str, request: Request, q: Optional[str] = None, sort: Optional[str] = "name_asc", include_sub_units: bool = False):
     _require_page_access(request, "hierarchy")
     if unit_id == "all":
         items = get_all_assets_flat()
+    elif include_sub_units:
+        items = assets_list_subtree(unit_id)
+        if items is None:
+            raise HTTPException(status_code=404, detail="Unidade não encontrada.")
     else:
         items = assets_list(unit_id)
     term = (q or "").strip().lower()
@@ -1509,8 +1807,7 @@ def unit_assets_update(asset_id: int, payload: UpdateAssetRequest, request: Requ
 @app.delete("/assets/{asset_id}")
 def unit_assets_delete(asset_id: int, request: Request):
     user = _require_page_access(request, "hierarchy")
-    all_assets = get_all_assets_flat()
-    asset_to_delete = next((a for a in all_assets if a.get("id") == asset_id), None)
+    asset_to_delete = assets_get(asset_id)
     
     ok = assets_delete(asset_id)
     if not ok:
@@ -1526,6 +1823,62 @@ def unit_assets_delete(asset_id: int, request: Request):
             pass
     return {"success": True}
 
+# NOVO: importação em massa (CSV ou XLSX): job em segundo plano, um lote = uma gravação + um log;
+# progresso em GET /jobs/{id}. dry_run valida o arquivo inteiro sem gravar.
+@app.post("/units/{unit_id}/assets/import")
+async def unit_assets_import(unit_id: str, request: Request, file: UploadFile = File(...), dry_run: bool = Form(False)):
+    user = _require_page_access(request, "hierarchy")
+    filename = file.filename or "ativos.csv"
+    fmt = "xlsx" if filename.lower().endswith(".xlsx") else "csv"
+    if fmt == "xlsx" and not xlsx_supported():
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Importação .xlsx indisponível (instale openpyxl).")
+    staged = await stage_upload(file)
+    try:
+        if dry_run:
+            return await run_in_threadpool(validate_asset_import, staged.path, fmt, unit_id)
+        job = await run_in_threadpool(start_asset_import_job, staged, fmt, unit_id, filename, user["username"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        discard_upload(staged.path)
+    return {"job_id": job["id"], "status": job["status"], "rows": job["rows"], "batches": job["total"]}
+
+@app.get("/units/{unit_id}/assets/export")
+def unit_assets_export(unit_id: str, request: Request, format: str = "csv", include_sub_units: bool = False):
+    _require_page_access(request, "hierarchy")
+    name = "ativos" if unit_id == "all" else f"ativos_{re.sub(r'[^A-Za-z0-9_-]', '_', unit_id)}"
+    if format == "xlsx":
+        if not xlsx_supported():
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Exportação .xlsx indisponível (instale openpyxl).")
+        path = export_assets_xlsx(unit_id, include_sub_units)
+        return FileResponse(path, filename=f"{name}.xlsx", background=BackgroundTask(discard_upload, path),
+                            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    # linhas geradas sob demanda (lista completa nunca é montada)
+    return StreamingResponse(iter_assets_csv(unit_id, include_sub_units=include_sub_units), media_type="text/csv; charset=utf-8",
+                             headers={"Content-Disposition": f'attachment; filename="{name}.csv"'})
+
+# NOVO: qual ativo é esta etiqueta? (RFID, QR, código do item ou id) pelos índices da tabela de ativos
+@app.get("/assets/lookup")
+def assets_lookup(code: str, request: Request):
+    _require_page_access(request, "hierarchy")
+    hit = assets_lookup_codes([code]).get(code.strip())
+    if not hit:
+        raise HTTPException(status_code=404, detail="Ativo não encontrado.")
+    return {"code": code.strip(), **hit}
+
+@app.post("/assets/lookup")
+def assets_lookup_bulk(request: Request, payload: Dict[str, Any] = Body(...)):
+    _require_page_access(request, "hierarchy")
+    codes = payload.get("codes")
+    if not isinstance(codes, list):
+        raise HTTPException(status_code=400, detail="Lista de códigos (codes) obrigatória.")
+    try:
+        results = assets_lookup_codes(codes)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    missing = [c for c, hit in results.items() if hit is None]
+    return {"found": len(results) - len(missing), "missing": missing, "results": results}
+
 # Categorias de ativos (separadas das de Unidades)
 @app.get("/asset-categories", response_model=CategoryListResponse)
 def asset_categories_list(request: Request):
@@ -1604,38 +1957,14 @@ def verification_start_session(request: Request, payload: Dict[str, Any] = Body(
     
     assets_to_verify = []
     if session_type == "unit":
-        from storage_hierarchy import list_all as hierarchy_list_all
-        from storage_assets import get_all_assets_flat
-
-        all_nodes = hierarchy_list_all().get("nodes", [])
-        
-        def get_all_subunit_ids(start_id: str, nodes: List[Dict]) -> List[str]:
-            id_map = {n['id']: n for n in nodes}
-            children_map = {}
-            for n in nodes:
-                if n.get('parentId'):
-                    if n['parentId'] not in children_map:
-                        children_map[n['parentId']] = []
-                    children_map[n['parentId']].append(n['id'])
-
-            sub_ids = []
-            q = [start_id]
-            visited = {start_id}
-            while q:
-                curr_id = q.pop(0)
-                sub_ids.append(curr_id)
-                for child_id in children_map.get(curr_id, []):
-                    if child_id not in visited:
-                        visited.add(child_id)
-                        q.append(child_id)
-            return sub_ids
-
+        # subunidades pelo índice de caminhos da hierarquia; ativos pelo índice unit_id
         unit_ids_to_check = [target_id]
         if include_sub_units:
-            unit_ids_to_check = get_all_subunit_ids(target_id, all_nodes)
-
-        all_assets = get_all_assets_flat()
-        assets_to_verify = [a for a in all_assets if a.get("unit_id") in unit_ids_to_check]
+            unit_ids_to_check = hierarchy_subtree_ids(target_id) or [target_id]
+        assets_to_verify = assets_list_in(unit_ids_to_check)
+        paths = {uid: hierarchy_path_names(uid) for uid in unit_ids_to_check}
+        for a in assets_to_verify:
+            a["unit_path"] = paths.get(a.get("unit_id"), "")
 
     elif session_type == "custom":
         # Lógica para listas personalizadas (se necessário)
@@ -1669,6 +1998,101 @@ def verification_verify_item(session_id: str, request: Request, payload: Dict[st
     print(f"--- Item encontrado: {verified_item['name']} ---")
     return {"item": verified_item}
 
+# NOVO: lote de leituras de leitor RFID/QR (milhares por chamada); leituras repetidas do mesmo
+# código dentro de VERIFY_DEDUP_SECONDS são descartadas e o lote vira uma linha no diário
+@app.post("/verifications/sessions/{session_id}/verify-batch")
+def verification_verify_batch(session_id: str, request: Request, payload: Dict[str, Any] = Body(...)):
+    _require_page_access(request, "hierarchy")
+    reads = payload.get("reads")
+    if not isinstance(reads, list):
+        raise HTTPException(status_code=400, detail="Lista de leituras (reads) obrigatória.")
+    try:
+        result = verify_batch_in_session(session_id, reads)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada ou não está ativa.")
+    return result
+
+# NOVO: canal contínuo para leitores: autorização uma única vez na conexão; as leituras recebidas
+# são agrupadas por até VERIFY_STREAM_FLUSH_MS e cada lote devolve resultado + progresso por unidade
+VERIFY_STREAM_FLUSH_MS = int(os.environ.get("VERIFY_STREAM_FLUSH_MS", "100"))
+
+def _stream_reads(message: str) -> List[Any]:
+    """Texto recebido -> leituras: JSON {"reads": [...]}, {"code", "quantity"}, lista, ou um código por linha."""
+    text = message.strip()
+    if text[:1] in ("{", "["):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            return list(data.get("reads") or []) if "reads" in data else [data]
+    return [line for line in text.splitlines() if line.strip()]
+
+@app.websocket("/verifications/sessions/{session_id}/stream")
+async def verification_stream(websocket: WebSocket, session_id: str):
+    origin = websocket.headers.get("origin", "")
+    if origin and not ((frontend_url and origin == frontend_url) or re.fullmatch(frontend_origin_regex, origin)):
+        await websocket.close(code=1008)
+        return
+    token = websocket.cookies.get("session")
+    data = _resolve_session(token or "") if token else None
+    if not data or "hierarchy" not in data["allowed_pages"]:
+        await websocket.close(code=1008)
+        return
+    progress = await run_in_threadpool(session_progress, session_id)
+    if not progress or progress["status"] != "active":
+        await websocket.close(code=1008, reason="Sessão não encontrada ou não está ativa.")
+        return
+    await websocket.accept()
+    await websocket.send_json({"type": "progress", **progress})
+
+    loop = asyncio.get_running_loop()
+    pending: List[Any] = []
+    deadline = 0.0
+
+    async def flush(reply: bool = True) -> bool:
+        batch = pending[:VERIFY_BATCH_MAX]
+        del pending[:VERIFY_BATCH_MAX]
+        result = await run_in_threadpool(verify_batch_in_session, session_id, batch)
+        if result is None:
+            if reply:
+                await websocket.send_json({"type": "closed", "detail": "Sessão encerrada."})
+                await websocket.close(code=1000)
+            return False
+        if reply:
+            await websocket.send_json({"type": "result", "reads": len(batch), **result})
+        return True
+
+    try:
+        while True:
+            timeout = max(0.0, deadline - loop.time()) if pending else None
+            try:
+                message = await asyncio.wait_for(websocket.receive_text(), timeout)
+            except asyncio.TimeoutError:
+                if not await flush():
+                    return
+                continue
+            if not pending:
+                deadline = loop.time() + VERIFY_STREAM_FLUSH_MS / 1000.0
+            pending.extend(_stream_reads(message))
+            while len(pending) >= VERIFY_BATCH_MAX:
+                if not await flush():
+                    return
+    except WebSocketDisconnect:
+        # leituras já recebidas não se perdem com a queda da conexão
+        while pending:
+            if not await flush(reply=False):
+                break
+
+@app.get("/verifications/stats")
+def verification_stats_endpoint(request: Request):
+    _require_page_access(request, "hierarchy")
+    return verification_stats()
+
 @app.post("/verifications/sessions/{session_id}/finish")
 def verification_finish_session(session_id: str, request: Request):
     user = _require_page_access(request, "hierarchy")
@@ -0,0 +1,65 @@
+"""
+Cadeia completa de ajustes (_apply_adjustments) com e sem OpenCV.
+
+Sem cv2, saturation/vibrance usam o HSV vetorizado em NumPy; com cv2, o
+cvtColor de 8 bits. Mede o tempo por preset em tamanhos representativos e a
+diferença entre os dois caminhos (níveis 0..255).
+
+Uso:
+    python benchmarks/bench_adjustments.py
+    python benchmarks/bench_adjustments.py --sizes 1920x1080,4000x3000,6000x4000 --repeat 3
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import storage_image_editor as editor  # noqa: E402
+from bench_compiled_lut import PRESETS, _synthetic  # noqa: E402
+
+def _best_of(fn, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return out, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1920x1080,4000x3000")
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    cv2_mod = editor.cv2
+    if cv2_mod is None:
+        print("aviso: OpenCV não instalado; apenas o caminho NumPy será medido")
+    print(f"{'tamanho':>10} {'preset':>20} {'cv2 s':>8} {'numpy s':>8} {'máx dif':>8} {'média dif':>9}")
+    for size in [s for s in args.sizes.split(",") if s.strip()]:
+        w, h = (int(v) for v in size.lower().split("x"))
+        img = _synthetic(w, h)
+        for name, params in PRESETS.items():
+            with_cv2 = None
+            t_cv2 = float("nan")
+            if cv2_mod is not None:
+                editor.cv2 = cv2_mod
+                with_cv2, t_cv2 = _best_of(lambda: np.asarray(editor._apply_adjustments(img, params)), args.repeat)
+            editor.cv2 = None
+            try:
+                without, t_np = _best_of(lambda: np.asarray(editor._apply_adjustments(img, params)), args.repeat)
+            finally:
+                editor.cv2 = cv2_mod
+            if with_cv2 is not None:
+                diff = np.abs(with_cv2.astype(np.int16) - without.astype(np.int16))
+                max_d, mean_d = f"{int(diff.max())}", f"{float(diff.mean()):.3f}"
+            else:
+                max_d, mean_d = "-", "-"
+            print(f"{size:>10} {name:>20} {t_cv2:>8.3f} {t_np:>8.3f} {max_d:>8} {mean_d:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Importação em massa de ativos: add_asset linha a linha x job de importação em lotes
+(storage_assets.start_asset_import_job), e exportação em streaming (iter_assets_csv).
+
+Copia o backend para uma pasta temporária (assets.csv, hierarquia, logs e jobs reais não são
+tocados), gera uma planilha CSV com --rows linhas (algumas inválidas de propósito) e, para
+cada STORAGE_BACKEND:
+  - mede --per-row chamadas de add_asset (o caminho da API antes) e extrapola para --rows;
+  - roda o job de importação e acompanha o progresso como GET /jobs/{id};
+  - confere ativos gravados, linhas rejeitadas e um registro de log por lote;
+  - exporta tudo em CSV e mede o pico de memória da geração (tracemalloc).
+
+Uso:
+    python benchmarks/bench_asset_import.py
+    python benchmarks/bench_asset_import.py --rows 20000 --batch 1000
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def _child(args):
+    sys.path.insert(0, os.getcwd())
+    import storage_assets as sa
+    import storage_jobs
+    import storage_logs
+    import storage_hierarchy
+    unit = storage_hierarchy.list_all()["nodes"][0]["id"]
+    out = {}
+
+    t0 = time.perf_counter()
+    for i in range(args.per_row):
+        sa.add_asset(unit, {"name": f"Manual {i}", "rfid_code": f"MAN{i:08d}", "quantity": 1}, "bench")
+    out["per_row_s"] = (time.perf_counter() - t0) / args.per_row
+
+    path = os.path.join(os.getcwd(), "planilha.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(["Nome", "RFID", "QR", "Código", "Quantidade", "Unidade"])
+        for i in range(args.rows):
+            if i % 1000 == 999:
+                w.writerow(["", f"E2{i:010X}", "", "", "1", "un"])  # sem nome
+            elif i % 1000 == 998:
+                w.writerow([f"Ativo {i}", "E2%010X" % (i - 1), "", "", "1", "un"])  # RFID repetido
+            else:
+                w.writerow([f"Ativo {i}", f"E2{i:010X}", f"QR-{i}", f"IT{i % 300}", "1,5" if i % 2 else "2", "un"])
+    size = os.path.getsize(path)
+    staged = sa.StagedUpload(path, size, "")
+    t0 = time.perf_counter()
+    job = sa.start_asset_import_job(staged, "csv", unit, "planilha.csv", "bench")
+    progress = []
+    while True:
+        j = storage_jobs.get_job(job["id"], include_items=False)
+        progress.append(j["progress"])
+        if j["status"] in storage_jobs.FINAL_STATUSES:
+            break
+        time.sleep(0.05)
+    out["import_s"] = time.perf_counter() - t0
+    items = storage_jobs.get_job(job["id"])["items"]
+    out["status"] = j["status"]
+    out["batches"] = len(items)
+    out["inserted"] = sum(it["result"]["inserted"] for it in items)
+    out["rejected"] = sum(it["result"]["rejected"] for it in items)
+    out["progress_samples"] = len(set(progress))
+    out["import_logs"] = len(storage_logs.list_logs(None, None, None, "asset:import", None))
+    # custo de add_asset com a tabela já cheia (cresce com o tamanho da tabela)
+    t0 = time.perf_counter()
+    for i in range(args.per_row):
+        sa.add_asset(unit, {"name": f"Depois {i}", "rfid_code": f"DEP{i:08d}", "quantity": 1}, "bench")
+    out["per_row_full_s"] = (time.perf_counter() - t0) / args.per_row
+    out["assets_total"] = len(sa.get_all_assets_flat())  # também deixa o cache da tabela carregado
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    exported = 0
+    for chunk in sa.iter_assets_csv("all"):
+        exported += chunk.count("\n")
+    out["export_s"] = time.perf_counter() - t0
+    out["export_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+    tracemalloc.stop()
+    out["exported_rows"] = exported - 1
+    print(json.dumps(out))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--per-row", type=int, default=100, help="chamadas de add_asset medidas")
+    parser.add_argument("--backends", default="csv,sqlite")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args)
+        return
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        with tempfile.TemporaryDirectory() as folder:
+            work = os.path.join(folder, "backend")
+            shutil.copytree(BACKEND, work, ignore=shutil.ignore_patterns("media", "benchmarks", "__pycache__", "*.db*"))
+            os.makedirs(os.path.join(work, "media"))
+            shutil.copytree(os.path.join(BACKEND, "media", "hierarchy"), os.path.join(work, "media", "hierarchy"))
+            env = dict(os.environ, STORAGE_BACKEND=backend, STORAGE_DB_PATH=os.path.join(folder, "storage.db"),
+                       ASSET_IMPORT_BATCH=str(args.batch))
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", "--rows", str(args.rows), "--per-row", str(args.per_row)]
+            r = json.loads(subprocess.run(cmd, cwd=work, env=env, check=True, capture_output=True).stdout.decode().strip().splitlines()[-1])
+        # add_asset custa ~O(n) por linha (next_id + recarga da tabela), então linha a linha é ~quadrático:
+        # estimativa pela média do custo com a tabela vazia e cheia
+        estimate = args.rows * (r["per_row_s"] + r["per_row_full_s"]) / 2
+        print(f"\n[{backend}] {args.rows} linhas, lotes de {args.batch}")
+        print(f"  add_asset linha a linha: {1000 * r['per_row_s']:.1f} ms/linha (tabela vazia), {1000 * r['per_row_full_s']:.1f} ms/linha "
+              f"(cheia) -> ~{estimate:.0f} s para o arquivo")
+        print(f"  job de importação: {r['import_s']:.1f} s, {r['status']}, {r['batches']} lotes, {r['inserted']} gravados, "
+              f"{r['rejected']} rejeitados, {r['import_logs']} registros de log, {r['progress_samples']} leituras de progresso distintas")
+        print(f"  exportação CSV: {r['exported_rows']} linhas ({r['assets_total']} ativos) em {r['export_s']:.2f} s, pico {r['export_peak_mb']:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Resolução etiqueta -> ativo: varredura de get_all_assets_flat() x índices (storage_assets.lookup_codes).
+
+Copia o backend para uma pasta temporária (o assets.csv real não é tocado), gera --assets
+ativos com RFID/QR/código do item e, para cada STORAGE_BACKEND, mede:
+  - varredura: get_all_assets_flat() + busca linear por código (o que as rotas faziam);
+  - índice, um código por chamada (GET /assets/lookup);
+  - índice, --bulk códigos por chamada (POST /assets/lookup).
+Também confere que as duas abordagens devolvem os mesmos ativos (inclusive com o código
+em minúsculas) e que o índice acompanha update/delete.
+
+Uso:
+    python benchmarks/bench_asset_lookup.py
+    python benchmarks/bench_asset_lookup.py --assets 50000 --bulk 5000
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import subprocess
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def _child(args):
+    sys.path.insert(0, os.getcwd())
+    import storage_assets as sa
+    rng = random.Random(1)
+    codes = [rng.choice((f"E2{i:010X}", f"QR-{i}", f"IT{i:06d}")) for i in (rng.randrange(args.assets) for _ in range(args.bulk))]
+
+    def scan(code):
+        c = code.lower()
+        for a in sa.get_all_assets_flat():
+            if c in (a["rfid_code"].lower(), a["qr_code"].lower(), a["item_code"].lower()):
+                return a
+        return None
+
+    out = {}
+    sa.lookup_codes(codes[:1])  # carga inicial / criação das tabelas fora da medição
+    n = min(args.scan, len(codes))
+    t0 = time.perf_counter()
+    expected = [scan(c) for c in codes[:n]]
+    out["scan_ms"] = 1000 * (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    single = [sa.lookup_codes([c])[c] for c in codes[:n]]
+    out["single_ms"] = 1000 * (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    bulk = sa.lookup_codes([c.lower() for c in codes])
+    out["bulk_ms"] = 1000 * (time.perf_counter() - t0)
+    out["same"] = all((s or {}).get("asset") == e for s, e in zip(single, expected)) and \
+        all((bulk[c.lower()] or {}).get("asset") == e for c, e in zip(codes[:n], expected))
+    # índice acompanha alterações
+    victim = single[0]["asset"]
+    sa.update_asset(victim["id"], {"rfid_code": "NOVO-RFID"})
+    moved = sa.lookup_codes(["novo-rfid"])["novo-rfid"]
+    sa.delete_asset(victim["id"])
+    gone = sa.lookup_codes(["NOVO-RFID", str(victim["id"])])
+    out["maintained"] = bool(moved and moved["asset"]["id"] == victim["id"]) and not any(gone.values())
+    print(json.dumps(out))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=20000)
+    parser.add_argument("--bulk", type=int, default=2000)
+    parser.add_argument("--scan", type=int, default=50, help="códigos resolvidos um a um (varredura e índice)")
+    parser.add_argument("--backends", default="csv,sqlite")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args)
+        return
+    print(f"{args.assets} ativos; {args.scan} códigos um a um; lote de {args.bulk}")
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        with tempfile.TemporaryDirectory() as folder:
+            work = os.path.join(folder, "backend")
+            shutil.copytree(BACKEND, work, ignore=shutil.ignore_patterns("media", "benchmarks", "__pycache__", "*.db*"))
+            os.makedirs(os.path.join(work, "media", "assets"))
+            fields = ["id", "unit_id", "name", "description", "qr_code", "rfid_code", "item_code", "category", "notes",
+                      "photo_path", "quantity", "unit", "created_at", "updated_at", "created_by"]
+            with open(os.path.join(work, "media", "assets", "assets.csv"), "w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(f, fieldnames=fields)
+                w.writeheader()
+                for i in range(args.assets):
+                    w.writerow({"id": i + 1, "unit_id": f"loc_{i % 50}", "name": f"Ativo {i}", "description": "", "qr_code": f"QR-{i}",
+                                "rfid_code": f"E2{i:010X}", "item_code": f"IT{i:06d}", "category": "", "notes": "", "photo_path": "",
+                                "quantity": "1", "unit": "", "created_at": "2024-01-01T00:00:00", "updated_at": "2024-01-01T00:00:00", "created_by": "bench"})
+            env = dict(os.environ, STORAGE_BACKEND=backend, STORAGE_DB_PATH=os.path.join(folder, "storage.db"))
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", "--assets", str(args.assets), "--bulk", str(args.bulk), "--scan", str(args.scan)]
+            r = json.loads(subprocess.run(cmd, cwd=work, env=env, check=True, capture_output=True).stdout.decode().strip().splitlines()[-1])
+        print(f"[{backend}] varredura {r['scan_ms']:.2f} ms/código | índice {r['single_ms']:.3f} ms/código | "
+              f"lote {r['bulk_ms']:.1f} ms ({1000 * r['bulk_ms'] / args.bulk:.1f} µs/código) | "
+              f"resultados iguais: {r['same']} | índice atualizado: {r['maintained']}")
+
+if __name__ == "__main__":
+    main()
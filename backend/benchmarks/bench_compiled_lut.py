@@ -0,0 +1,91 @@
+"""
+Equivalência numérica e desempenho do preset compilado (LUT 1D/3D) contra a
+cadeia de ajustes em float (_apply_adjustments sem 'compiled').
+
+Para cada preset mede a diferença por pixel (máxima, média e % de pixels
+diferentes, em níveis de 0..255) e o tempo dos dois caminhos.
+- LUT 1D (só ajustes por canal, ligada por padrão): tem de ser idêntica (sai com código 1 se não for);
+  a tabela é a mesma cadeia em float32 avaliada nos 256 níveis.
+- LUT 3D (shadows/highlights, saturation/vibrance): só com LUT_COMPILE_3D=1. Medido em 1200x900
+  (grade 33 e 65): sombras/realces até 1 nível em ~1.5% dos pixels; saturation/vibrance até 10-14
+  níveis, média ~0.6-0.8, ~40% dos pixels, e sem ganho de tempo. A grade mais densa não reduz o erro:
+  a diferença vem do HSV de 8 bits do OpenCV no caminho em float. Por isso não há tolerância
+  padrão para a 3D; --max-mean/--max-abs aplicam um limite explícito quando informados.
+
+Uso:
+    python benchmarks/bench_compiled_lut.py
+    python benchmarks/bench_compiled_lut.py --size 4000x3000 --grid 65 --image caminho/foto.jpg
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from storage_image_editor import _apply_adjustments, compile_adjustments  # noqa: E402
+
+PRESETS = {
+    "exposicao+gamma": {"exposure": 0.4, "gamma": 1.2, "brightness": 8},
+    "curva+temperatura": {"curves_strength": 0.35, "temperature": 25, "contrast": 12},
+    "vinheta (1d)": {"exposure": -0.2, "contrast": 20, "vignette": 0.5},
+    "saturacao": {"saturation": 30, "vibrance": 15, "contrast": 10},
+    "sombras/realces": {"shadows": 40, "highlights": 30, "gamma": 1.1},
+    "completo": {"exposure": 0.3, "gamma": 1.1, "brightness": 5, "shadows": 25, "highlights": 20,
+                 "curves_strength": 0.3, "temperature": 15, "saturation": 20, "vibrance": 10,
+                 "contrast": 15, "vignette": 0.4},
+}
+
+def _synthetic(w: int, h: int, seed: int = 0) -> Image.Image:
+    """Gradientes suaves + ruído: cobre todo o cubo RGB como uma foto real."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    r = 127.5 + 127.5 * np.sin(xx / w * 6.0 + yy / h * 2.0)
+    g = 127.5 + 127.5 * np.cos(yy / h * 5.0 - xx / w)
+    b = 255.0 * (xx + yy) / float(w + h)
+    arr = np.stack([r, g, b], axis=-1) + rng.normal(0, 12, (h, w, 3))
+    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="2000x1500")
+    parser.add_argument("--image", default="")
+    parser.add_argument("--grid", type=int, default=33)
+    parser.add_argument("--max-mean", type=float, default=None, help="limite da média para a LUT 3D (sem limite se omitido)")
+    parser.add_argument("--max-abs", type=int, default=None, help="limite do máximo para a LUT 3D (sem limite se omitido)")
+    args = parser.parse_args()
+
+    if args.image:
+        img = Image.open(args.image).convert("RGB")
+    else:
+        w, h = (int(v) for v in args.size.lower().split("x"))
+        img = _synthetic(w, h)
+    print(f"imagem {img.width}x{img.height}, grade 3D {args.grid}")
+    print(f"{'preset':>20} {'tipo':>4} {'máx':>4} {'média':>7} {'%dif':>6} {'float s':>8} {'comp s':>7} {'compilar s':>10}")
+
+    failed = False
+    for name, params in PRESETS.items():
+        ref, t_ref = _timed(lambda: np.asarray(_apply_adjustments(img, params)))
+        compiled, t_compile = _timed(lambda: compile_adjustments(params, size=args.grid))
+        out, t_lut = _timed(lambda: np.asarray(_apply_adjustments(img, params, compiled)))
+        diff = np.abs(ref.astype(np.int16) - out.astype(np.int16))
+        max_d, mean_d, pct = int(diff.max()), float(diff.mean()), 100.0 * float((diff > 0).mean())
+        if compiled.kind == "1d":
+            ok = max_d == 0
+        else:
+            ok = (args.max_mean is None or mean_d <= args.max_mean) and (args.max_abs is None or max_d <= args.max_abs)
+        failed = failed or not ok
+        flag = "" if ok else "  <-- FORA DA TOLERÂNCIA"
+        print(f"{name:>20} {compiled.kind:>4} {max_d:>4} {mean_d:>7.3f} {pct:>6.2f} {t_ref:>8.3f} {t_lut:>7.3f} {t_compile:>10.4f}{flag}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
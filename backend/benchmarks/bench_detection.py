@@ -0,0 +1,145 @@
+"""
+Precisão x latência da detecção de rostos (e pose) por resolução do proxy.
+
+Para cada DETECT_MAX_PIXELS candidato detecta rostos numa cópia reduzida,
+converte as caixas para a resolução original e compara com os rótulos
+(IoU >= --iou). Reporta recall, precisão e latência média/p95 por imagem. Com
+MediaPipe instalado, também o erro médio dos landmarks da pose (em % da
+diagonal) contra a detecção em resolução cheia.
+
+Rótulos (JSON):
+    {"images": [{"path": "media/.../foto.jpg", "faces": [[x, y, w, h], ...]}, ...]}
+Caminhos relativos são resolvidos a partir de backend/.
+
+Uso:
+    # gera rótulos iniciais a partir da detecção em resolução cheia (revisar à mão)
+    python benchmarks/bench_detection.py --make-labels labels.json --images "media/events/*/gallery/raw/*/*"
+    # compara tamanhos de proxy (0 = resolução cheia); --upscale simula originais maiores
+    python benchmarks/bench_detection.py --labels labels.json --proxies 0,4000000,2000000,1000000,500000 --upscale 2
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND)
+
+import vision  # noqa: E402
+
+def _load(path: str, upscale: float) -> np.ndarray:
+    img = Image.open(path if os.path.isabs(path) else os.path.join(BACKEND, path)).convert("RGB")
+    if upscale != 1.0:
+        img = img.resize((int(img.width * upscale), int(img.height * upscale)), Image.LANCZOS)
+    return np.asarray(img)
+
+def _iou(a, b) -> float:
+    ax0, ay0, aw, ah = a
+    bx0, by0, bw, bh = b
+    ix = max(0, min(ax0 + aw, bx0 + bw) - max(ax0, bx0))
+    iy = max(0, min(ay0 + ah, by0 + bh) - max(ay0, by0))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+def _match(pred, truth, thr):
+    """Casamento guloso por IoU; retorna verdadeiros positivos."""
+    used = set()
+    tp = 0
+    for p in sorted(pred, key=lambda f: f[2] * f[3], reverse=True):
+        best, best_j = 0.0, None
+        for j, t in enumerate(truth):
+            if j in used:
+                continue
+            v = _iou(p, t)
+            if v > best:
+                best, best_j = v, j
+        if best_j is not None and best >= thr:
+            used.add(best_j)
+            tp += 1
+    return tp
+
+def _make_labels(pattern: str, out_path: str):
+    paths = sorted(p for p in glob.glob(os.path.join(BACKEND, pattern)) if os.path.isfile(p))
+    images = []
+    for p in paths:
+        try:
+            faces = vision.detect_faces(_load(p, 1.0), max_pixels=0)
+        except Exception:
+            continue
+        images.append({"path": os.path.relpath(p, BACKEND).replace(os.sep, "/"), "faces": [list(f) for f in faces]})
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"images": images}, f, indent=1)
+    print(f"{len(images)} imagens rotuladas em {out_path} (revise os rótulos antes de usar)")
+
+def _pose_points(arr, max_pixels):
+    lms = vision.detect_pose(arr, max_pixels=max_pixels)
+    if not lms:
+        return None
+    return np.array([[lm.x, lm.y] for lm in lms.landmark], dtype=np.float64)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default="")
+    parser.add_argument("--make-labels", default="")
+    parser.add_argument("--images", default="media/events/*/gallery/raw/*/*")
+    parser.add_argument("--proxies", default="0,4000000,2000000,1000000,500000")
+    parser.add_argument("--upscale", type=float, default=1.0)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--limit", type=int, default=0)
+    args = parser.parse_args()
+
+    if vision.cv2 is None:
+        print("OpenCV não instalado: nada a medir")
+        return
+    if args.make_labels:
+        _make_labels(args.images, args.make_labels)
+        return
+    if not args.labels:
+        parser.error("informe --labels (ou gere com --make-labels)")
+
+    with open(args.labels, "r", encoding="utf-8") as f:
+        samples = json.load(f).get("images") or []
+    if args.limit:
+        samples = samples[:args.limit]
+    proxies = [int(p) for p in args.proxies.split(",") if p.strip()]
+    vision.warmup()
+
+    print(f"{len(samples)} imagens, upscale {args.upscale}x, IoU >= {args.iou}")
+    print(f"{'proxy px':>10} {'recall':>7} {'precisão':>9} {'média ms':>9} {'p95 ms':>8} {'pose err %':>10}")
+    ref_pose = {}
+    for proxy in proxies:
+        tp = n_pred = n_true = 0
+        lat = []
+        pose_err = []
+        for i, sample in enumerate(samples):
+            arr = _load(sample["path"], args.upscale)
+            truth = [[v * args.upscale for v in f] for f in sample.get("faces") or []]
+            t0 = time.perf_counter()
+            pred = vision.detect_faces(arr, max_pixels=proxy)
+            lat.append(time.perf_counter() - t0)
+            tp += _match(pred, truth, args.iou)
+            n_pred += len(pred)
+            n_true += len(truth)
+            if vision.mp is not None:
+                if i not in ref_pose:
+                    ref_pose[i] = _pose_points(arr, 0)
+                pts = _pose_points(arr, proxy)
+                if ref_pose[i] is not None and pts is not None:
+                    diag = np.hypot(arr.shape[0], arr.shape[1])
+                    d = np.hypot((pts[:, 0] - ref_pose[i][:, 0]) * arr.shape[1], (pts[:, 1] - ref_pose[i][:, 1]) * arr.shape[0])
+                    pose_err.append(100.0 * float(d.mean()) / diag)
+        recall = tp / n_true if n_true else 1.0
+        precision = tp / n_pred if n_pred else 1.0
+        ms = np.asarray(lat) * 1000.0
+        perr = f"{np.mean(pose_err):.2f}" if pose_err else "-"
+        label = "cheia" if proxy <= 0 else str(proxy)
+        print(f"{label:>10} {recall:>7.3f} {precision:>9.3f} {ms.mean():>9.1f} {np.percentile(ms, 95):>8.1f} {perr:>10}")
+
+if __name__ == "__main__":
+    main()
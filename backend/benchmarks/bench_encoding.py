@@ -0,0 +1,85 @@
+"""
+Tempo de codificação e tamanho das saídas por formato (storage_encoding.encode).
+
+Para cada configuração (formato, qualidade, subamostragem, progressivo) codifica as
+imagens, mede tempo médio, tamanho médio, bits por pixel e o PSNR contra a imagem
+de origem (PNG = sem perdas). Útil para escolher a política 'edited'/'watermark'/'preview'.
+
+Uso:
+    python benchmarks/bench_encoding.py
+    python benchmarks/bench_encoding.py --images "media/events/*/gallery/raw/*/*" --limit 10
+    python benchmarks/bench_encoding.py --size 4000x3000 --specs "png;jpeg:90:4:4:4;webp:85"
+"""
+import io
+import os
+import sys
+import glob
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND)
+
+from storage_encoding import encode, normalize_spec, source_metadata  # noqa: E402
+from bench_compiled_lut import _synthetic  # noqa: E402
+
+DEFAULT_SPECS = "png;jpeg:90:4:4:4;jpeg:90:4:2:0;jpeg:85:4:2:0:p;jpeg:82:4:2:0:p;webp:90;webp:80"
+
+def _parse_spec(text: str):
+    """formato[:qualidade[:subamostragem[:p]]] -> spec (p = progressivo)."""
+    parts = text.strip().split(":")
+    spec = {"format": parts[0], "progressive": parts[-1] == "p"}
+    if len(parts) > 1:
+        spec["quality"] = int(parts[1])
+    if len(parts) >= 5:
+        spec["subsampling"] = ":".join(parts[2:5])
+    return normalize_spec(spec, {"format": "jpeg", "quality": 90, "subsampling": "4:2:0", "progressive": False})
+
+def _psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = float(np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2))
+    return float("inf") if mse == 0 else 10.0 * np.log10(255.0 ** 2 / mse)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="media/events/*/gallery/raw/*/*")
+    parser.add_argument("--limit", type=int, default=8)
+    parser.add_argument("--size", default="", help="usa uma imagem sintética LxA em vez de --images")
+    parser.add_argument("--specs", default=DEFAULT_SPECS)
+    args = parser.parse_args()
+
+    samples = []
+    if args.size:
+        w, h = (int(v) for v in args.size.lower().split("x"))
+        samples.append((_synthetic(w, h), {}))
+    else:
+        for p in sorted(glob.glob(os.path.join(BACKEND, args.images)))[:args.limit]:
+            try:
+                with Image.open(p) as src:
+                    samples.append((src.convert("RGB"), source_metadata(src)))
+            except Exception:
+                continue
+    if not samples:
+        print("nenhuma imagem encontrada")
+        return
+    pixels = sum(img.width * img.height for img, _ in samples)
+    print(f"{len(samples)} imagens, {pixels / 1e6:.1f} MP no total")
+    print(f"{'spec':>22} {'ms/img':>8} {'KB/img':>8} {'bits/px':>8} {'PSNR dB':>8}")
+    for text in [t for t in args.specs.split(";") if t.strip()]:
+        spec = _parse_spec(text)
+        total_t, total_b, psnrs = 0.0, 0, []
+        for img, meta in samples:
+            t0 = time.perf_counter()
+            data = encode(img, spec, meta)
+            total_t += time.perf_counter() - t0
+            total_b += len(data)
+            back = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+            psnrs.append(_psnr(np.asarray(img), back))
+        n = len(samples)
+        psnr = np.mean([p for p in psnrs if np.isfinite(p)]) if any(np.isfinite(p) for p in psnrs) else float("inf")
+        print(f"{text:>22} {1000 * total_t / n:>8.1f} {total_b / n / 1024:>8.1f} {8.0 * total_b / pixels:>8.2f} {psnr:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark da busca facial: varredura exata x IVF (aproximado + rerank exato).
+
+Mede recall@k (em relação à varredura exata) e latência p50/p99 por consulta
+em bases sintéticas de 10k/100k/1M vetores.
+
+Uso:
+    python benchmarks/bench_face_ann.py
+    python benchmarks/bench_face_ann.py --sizes 10000,100000 --dim 4096 --nprobe 4,8,16
+
+Observação: 1M vetores na dimensão real (4096) ocupam ~16 GB; por padrão o
+benchmark usa --dim 256, que preserva o comportamento relativo dos dois backends.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from storage_face_ann import IVFIndex, exact_search  # noqa: E402
+
+
+def _synthetic(n: int, dim: int, clusters: int, latent: int = 48, seed: int = 0) -> np.ndarray:
+    """
+    Vetores L2-normalizados agrupados (várias fotos da mesma pessoa). Patches de
+    rosto têm posto efetivo baixo (eigenfaces), então os grupos vivem num subespaço
+    latente pequeno mergulhado em 'dim' dimensões, mais ruído isotrópico.
+    """
+    rng = np.random.default_rng(seed)
+    basis = (rng.standard_normal((latent, dim)) / np.sqrt(latent)).astype(np.float32)
+    centers = rng.standard_normal((clusters, latent)).astype(np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    chunk = 100_000
+    for start in range(0, n, chunk):
+        m = min(chunk, n - start)
+        who = rng.integers(0, clusters, size=m)
+        z = centers[who] + 0.35 * rng.standard_normal((m, latent)).astype(np.float32)
+        block = z @ basis + 0.05 * rng.standard_normal((m, dim)).astype(np.float32)
+        out[start:start + m] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return out
+
+
+def _queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    base = vectors[rng.choice(vectors.shape[0], size=count, replace=False)]
+    q = base + 0.02 * rng.standard_normal(base.shape).astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def _percentiles(samples):
+    arr = np.asarray(samples) * 1000.0
+    return float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", default="8,16,32,64")
+    parser.add_argument("--rerank", type=int, default=512)
+    parser.add_argument("--pca-dim", type=int, default=64)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    nprobes = [int(s) for s in args.nprobe.split(",") if s.strip()]
+    threshold = -1.0  # sem limiar: compara rankings completos
+
+    print(f"{'N':>9} {'backend':>14} {'recall@k':>9} {'p50 ms':>9} {'p99 ms':>9} {'build s':>9}")
+    for n in sizes:
+        vectors = _synthetic(n, args.dim, clusters=max(10, n // 20))
+        queries = _queries(vectors, args.queries)
+
+        truth = []
+        lat = []
+        for q in queries:
+            t0 = time.perf_counter()
+            rows, _ = exact_search(vectors, q, threshold, top_k=args.k)
+            lat.append(time.perf_counter() - t0)
+            truth.append(set(rows.tolist()))
+        p50, p99 = _percentiles(lat)
+        print(f"{n:>9} {'exact':>14} {1.0:>9.3f} {p50:>9.2f} {p99:>9.2f} {'-':>9}")
+
+        t0 = time.perf_counter()
+        ann = IVFIndex.train(vectors, pca_dim=args.pca_dim)
+        build = time.perf_counter() - t0
+        for nprobe in nprobes:
+            hits = 0
+            lat = []
+            for q, expected in zip(queries, truth):
+                t0 = time.perf_counter()
+                rows, _ = ann.search(vectors, q, threshold, top_k=args.k, nprobe=nprobe, rerank=args.rerank)
+                lat.append(time.perf_counter() - t0)
+                hits += len(expected & set(rows.tolist()))
+            p50, p99 = _percentiles(lat)
+            recall = hits / float(args.k * len(queries))
+            print(f"{n:>9} {f'ivf/np={nprobe}':>14} {recall:>9.3f} {p50:>9.2f} {p99:>9.2f} {build:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Subárvore da hierarquia: BFS sobre a lista de nós + filtro de ativos por lista (o que
+POST /verifications/sessions/start fazia) x índice de caminhos (storage_hierarchy.subtree_ids)
++ consultas pelo índice unit_id (storage_assets.list_assets_in / subtree_asset_counts).
+
+Copia o backend para uma pasta temporária (hierarchy.json e assets.csv reais não são tocados),
+gera uma árvore com --nodes nós (--fanout filhos por nó) e --assets ativos espalhados nela e,
+para cada STORAGE_BACKEND, mede:
+  - BFS antigo (id_map/children_map a cada chamada, list.pop(0), `unit_id in lista`);
+  - subtree_ids + list_assets_in (GET /units/{id}/assets?include_sub_units=true);
+  - contagem de ativos por subárvore de cada nó (GET /hierarchy/{id}/subtree);
+  - add_child com a árvore cheia (antes: releitura do JSON + varredura recursiva por alteração).
+Confere que as duas abordagens devolvem os mesmos ativos.
+
+Uso:
+    python benchmarks/bench_hierarchy_subtree.py
+    python benchmarks/bench_hierarchy_subtree.py --nodes 20000 --assets 50000
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def _tree(count: int, fanout: int):
+    roots, flat, level = [], [], []
+    for i in range(count):
+        node = {"id": f"loc_{i}", "name": f"Unidade {i}", "children": [], "parentId": None}
+        if i < fanout:
+            roots.append(node)
+        else:
+            parent = flat[(i - fanout) // fanout]
+            node["parentId"] = parent["id"]
+            parent["children"].append(node)
+        flat.append(node)
+    return roots, flat
+
+def _legacy_subtree(start_id, nodes, all_assets):
+    """Implementação anterior (sobre a lista completa de nós, que a rota nem montava)."""
+    children_map = {}
+    for n in nodes:
+        if n.get("parentId"):
+            children_map.setdefault(n["parentId"], []).append(n["id"])
+    sub_ids, q, visited = [], [start_id], {start_id}
+    while q:
+        curr_id = q.pop(0)
+        sub_ids.append(curr_id)
+        for child_id in children_map.get(curr_id, []):
+            if child_id not in visited:
+                visited.add(child_id)
+                q.append(child_id)
+    return [a for a in all_assets if a.get("unit_id") in sub_ids]
+
+def _child(args):
+    sys.path.insert(0, os.getcwd())
+    import storage_hierarchy as h
+    import storage_assets as sa
+    _, flat = _tree(args.nodes, args.fanout)
+    targets = [f"loc_{i}" for i in range(0, min(args.nodes, args.fanout * 4))]
+    out = {}
+    sa.list_subtree_assets(targets[0])  # carga inicial fora da medição
+
+    t0 = time.perf_counter()
+    for t in targets:
+        legacy = _legacy_subtree(t, flat, sa.get_all_assets_flat())
+    out["legacy_ms"] = 1000 * (time.perf_counter() - t0) / len(targets)
+    t0 = time.perf_counter()
+    for t in targets:
+        new = sa.list_subtree_assets(t)
+    out["indexed_ms"] = 1000 * (time.perf_counter() - t0) / len(targets)
+    out["same"] = sorted(a["id"] for a in legacy) == sorted(a["id"] for a in new)
+    out["subtree_assets"] = len(new)
+    out["subtree_nodes"] = len(h.subtree_ids(targets[-1]))
+
+    t0 = time.perf_counter()
+    counts = sa.subtree_asset_counts(targets[0])
+    out["counts_ms"] = 1000 * (time.perf_counter() - t0)
+    out["counts_ok"] = counts[targets[0]]["total"] == len(sa.list_subtree_assets(targets[0]))
+
+    t0 = time.perf_counter()
+    for i in range(args.adds):
+        h.add_child(f"loc_{i}", f"Nova {i}", None, None, None, [{"name": "bench"}])
+    out["add_ms"] = 1000 * (time.perf_counter() - t0) / args.adds
+    print(json.dumps(out))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--assets", type=int, default=20000)
+    parser.add_argument("--adds", type=int, default=20, help="add_child medidos")
+    parser.add_argument("--backends", default="csv,sqlite")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args)
+        return
+    print(f"{args.nodes} nós ({args.fanout} filhos por nó), {args.assets} ativos")
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        with tempfile.TemporaryDirectory() as folder:
+            work = os.path.join(folder, "backend")
+            shutil.copytree(BACKEND, work, ignore=shutil.ignore_patterns("media", "benchmarks", "__pycache__", "*.db*"))
+            os.makedirs(os.path.join(work, "media", "assets"))
+            os.makedirs(os.path.join(work, "media", "hierarchy"))
+            roots, _ = _tree(args.nodes, args.fanout)
+            with open(os.path.join(work, "media", "hierarchy", "hierarchy.json"), "w", encoding="utf-8") as f:
+                json.dump({"nodes": roots, "categories": []}, f, ensure_ascii=False, indent=2)
+            fields = ["id", "unit_id", "name", "description", "qr_code", "rfid_code", "item_code", "category", "notes",
+                      "photo_path", "quantity", "unit", "created_at", "updated_at", "created_by"]
+            with open(os.path.join(work, "media", "assets", "assets.csv"), "w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(f, fieldnames=fields)
+                w.writeheader()
+                for i in range(args.assets):
+                    w.writerow({"id": i + 1, "unit_id": f"loc_{(i * 7) % args.nodes}", "name": f"Ativo {i}", "description": "", "qr_code": "",
+                                "rfid_code": f"E2{i:010X}", "item_code": "", "category": "", "notes": "", "photo_path": "",
+                                "quantity": "1", "unit": "", "created_at": "2024-01-01T00:00:00", "updated_at": "2024-01-01T00:00:00", "created_by": "bench"})
+            env = dict(os.environ, STORAGE_BACKEND=backend, STORAGE_DB_PATH=os.path.join(folder, "storage.db"))
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", "--nodes", str(args.nodes), "--fanout", str(args.fanout),
+                   "--assets", str(args.assets), "--adds", str(args.adds)]
+            r = json.loads(subprocess.run(cmd, cwd=work, env=env, check=True, capture_output=True).stdout.decode().strip().splitlines()[-1])
+        print(f"[{backend}] subárvore + ativos: BFS antigo {r['legacy_ms']:.1f} ms | índice {r['indexed_ms']:.2f} ms "
+              f"(ex.: {r['subtree_nodes']} nós, {r['subtree_assets']} ativos) | mesmos ativos: {r['same']}")
+        print(f"  contagem por subárvore (todos os nós de uma raiz): {r['counts_ms']:.1f} ms, total confere: {r['counts_ok']} | "
+              f"add_child: {r['add_ms']:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Logins por segundo por núcleo para cada esquema de hash de senha (security.py).
+
+Para cada configuração mede o tempo de uma verificação (1 thread = logins/s por núcleo)
+e a vazão com --workers threads (hashlib libera o GIL, então escala com os núcleos).
+No fim simula uma rajada de logins no executor de senhas (submit_password_job) com a
+configuração do ambiente (PASSWORD_SCHEME, PASSWORD_WORKERS, PASSWORD_QUEUE_MAX): quantos
+foram aceitos, quantos recusados (503 na API) e a latência dos aceitos.
+
+Uso:
+    python benchmarks/bench_password_hash.py
+    python benchmarks/bench_password_hash.py --schemes "pbkdf2:310000;scrypt:16384:8:1;scrypt:32768:8:1" --workers 4
+    PASSWORD_QUEUE_MAX=8 python benchmarks/bench_password_hash.py --burst 200
+"""
+import os
+import sys
+import time
+import secrets
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import security  # noqa: E402
+
+DEFAULT_SCHEMES = "pbkdf2:310000;pbkdf2:600000;scrypt:16384:8:1;scrypt:32768:8:1"
+
+def _hasher(text: str):
+    """'pbkdf2:<iter>' ou 'scrypt:<n>:<r>:<p>' -> função(senha, salt)."""
+    parts = text.strip().split(":")
+    if parts[0] == "pbkdf2":
+        iterations = int(parts[1])
+        return lambda pw, salt: security._pbkdf2_sha256(pw, salt, iterations)
+    if parts[0] == "scrypt":
+        n, r, p = (int(v) for v in parts[1:4])
+        return lambda pw, salt: security._scrypt(pw, salt, n, r, p)
+    raise ValueError(f"esquema desconhecido: {text}")
+
+def _throughput(fn, workers: int, seconds: float) -> float:
+    salt = secrets.token_bytes(16)
+    deadline = time.perf_counter() + seconds
+    counts = [0] * workers
+
+    def loop(i: int):
+        while time.perf_counter() < deadline:
+            fn("senha de teste", salt)
+            counts[i] += 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for i in range(workers):
+            ex.submit(loop, i)
+    return sum(counts) / (time.perf_counter() - t0)
+
+def _burst(count: int):
+    stored = security.hash_password("senha de teste")
+    accepted, rejected = [], 0
+    t0 = time.perf_counter()
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            fut = security.submit_password_job(security.verify_password, "senha de teste", stored)
+            fut.add_done_callback(lambda _f, s=start: accepted.append(time.perf_counter() - s))
+        except security.PasswordBusy:
+            rejected += 1
+    while len(accepted) < count - rejected:
+        time.sleep(0.01)
+    total = time.perf_counter() - t0
+    lat = sorted(accepted)
+    p95 = 1000.0 * lat[min(len(lat) - 1, int(0.95 * len(lat)))] if lat else float("nan")
+    print(f"\nrajada de {count} logins ({security.PASSWORD_SCHEME}, {security.PASSWORD_WORKERS} workers, fila {security.PASSWORD_QUEUE_MAX}):")
+    print(f"  aceitos {len(accepted)}, recusados {rejected}, p95 dos aceitos {p95:.0f} ms, total {total:.2f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schemes", default=DEFAULT_SCHEMES)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--burst", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} núcleos; vazão com {args.workers} threads")
+    print(f"{'esquema':>22} {'ms/login':>9} {'logins/s/núcleo':>16} {'logins/s':>9}")
+    for text in [t for t in args.schemes.split(";") if t.strip()]:
+        fn = _hasher(text)
+        per_core = _throughput(fn, 1, args.seconds)
+        total = _throughput(fn, args.workers, args.seconds) if args.workers > 1 else per_core
+        print(f"{text:>22} {1000.0 / per_core:>9.1f} {per_core:>16.1f} {total:>9.1f}")
+    if args.burst:
+        _burst(args.burst)
+
+if __name__ == "__main__":
+    main()
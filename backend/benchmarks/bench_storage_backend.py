@@ -0,0 +1,160 @@
+"""
+Latência das operações de cadastro sob carga concorrente: STORAGE_BACKEND=csv x sqlite.
+
+Cria uma base sintética (usuários, eventos, clientes) numa pasta temporária, e para cada
+backend sobe --procs processos (como workers do uvicorn) com --threads threads cada,
+executando uma mistura de leituras típicas de requisição (get_user da sessão,
+get_event_by_id da checagem de membro, get_events_for_user) e gravações
+(update_event, add_client). Reporta ops/s e p50/p95/p99 por operação.
+
+Uso:
+    python benchmarks/bench_storage_backend.py
+    python benchmarks/bench_storage_backend.py --users 2000 --events 5000 --procs 4 --threads 8 --seconds 10
+    python benchmarks/bench_storage_backend.py --write-ratio 0.2
+
+Os CSVs reais não são tocados (USERS/EVENTS/CLIENTS_CSV_PATH e STORAGE_DB_PATH apontam
+para a pasta temporária). Com o backend csv, gravações de processos diferentes podem se
+perder (não há trava entre processos) — o benchmark conta os registros no final.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+OPS = ("get_user", "get_event_by_id", "get_events_for_user", "update_event", "add_client")
+
+def _seed(folder: str, users: int, events: int):
+    sys.path.insert(0, BACKEND)
+    from storage import CSV_FIELDS as USER_FIELDS
+    from storage_events import CSV_FIELDS as EVENT_FIELDS
+    from storage_clients import CSV_FIELDS as CLIENT_FIELDS
+    rng = random.Random(0)
+    with open(os.path.join(folder, "users.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=USER_FIELDS)
+        w.writeheader()
+        for i in range(users):
+            w.writerow({"username": f"user{i}@example.com", "password_hash": "x" * 97, "role": "user", "full_name": f"Usuário {i}", "allowed_pages": "events,gallery"})
+    with open(os.path.join(folder, "events.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=EVENT_FIELDS)
+        w.writeheader()
+        for i in range(1, events + 1):
+            members = [f"user{rng.randrange(users)}@example.com" for _ in range(3)]
+            w.writerow({"id": str(i), "name": f"Evento {i}", "description": "x" * 80, "start_date": "2024-01-01", "end_date": "2024-01-02",
+                        "owner_username": f"user{rng.randrange(users)}@example.com", "photographers_json": json.dumps(members), "created_at": "2024-01-01T00:00:00"})
+    with open(os.path.join(folder, "clients.csv"), "w", newline="", encoding="utf-8") as f:
+        csv.DictWriter(f, fieldnames=CLIENT_FIELDS).writeheader()
+
+def _worker(args):
+    """Processo filho: roda threads até o prazo e imprime as amostras em JSON."""
+    sys.path.insert(0, BACKEND)
+    import storage
+    import storage_events
+    import storage_clients
+    deadline = time.time() + args.seconds
+    samples = {op: [] for op in OPS}
+    lock = threading.Lock()
+
+    def run(tid: int):
+        rng = random.Random(os.getpid() * 1000 + tid)
+        local = {op: [] for op in OPS}
+        while time.time() < deadline:
+            if rng.random() < args.write_ratio:
+                op = "update_event" if rng.random() < 0.7 else "add_client"
+            else:
+                op = ("get_user", "get_event_by_id", "get_events_for_user")[rng.randrange(3)]
+            t0 = time.perf_counter()
+            if op == "get_user":
+                storage.get_user(f"user{rng.randrange(args.users)}@example.com")
+            elif op == "get_event_by_id":
+                storage_events.get_event_by_id(rng.randint(1, args.events))
+            elif op == "get_events_for_user":
+                storage_events.get_events_for_user(f"user{rng.randrange(args.users)}@example.com")
+            elif op == "update_event":
+                storage_events.update_event(rng.randint(1, args.events), description=f"bench {rng.random()}")
+            else:
+                storage_clients.add_client(f"Cliente {os.getpid()}-{tid}", "000", "Rua", "0")
+            local[op].append(time.perf_counter() - t0)
+        with lock:
+            for op, v in local.items():
+                samples[op].extend(v)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(json.dumps(samples))
+
+def _pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return 1000.0 * values[min(len(values) - 1, int(p * len(values)))]
+
+def _run_backend(backend: str, args) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        _seed(folder, args.users, args.events)
+        env = dict(os.environ)
+        env.update({
+            "STORAGE_BACKEND": backend,
+            "STORAGE_DB_PATH": os.path.join(folder, "storage.db"),
+            "USERS_CSV_PATH": os.path.join(folder, "users.csv"),
+            "EVENTS_CSV_PATH": os.path.join(folder, "events.csv"),
+            "CLIENTS_CSV_PATH": os.path.join(folder, "clients.csv"),
+        })
+        if backend == "sqlite":
+            # importação única antes da carga (não entra na medição)
+            subprocess.run([sys.executable, os.path.join(BACKEND, "storage_db.py"), "import", "users", "events", "clients"],
+                           env=env, check=True, stdout=subprocess.DEVNULL)
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", "--users", str(args.users), "--events", str(args.events),
+               "--threads", str(args.threads), "--seconds", str(args.seconds), "--write-ratio", str(args.write_ratio)]
+        procs = [subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE) for _ in range(args.procs)]
+        merged = {op: [] for op in OPS}
+        for p in procs:
+            out, _ = p.communicate()
+            for op, v in json.loads(out.decode("utf-8")).items():
+                merged[op].extend(v)
+        with open(os.path.join(folder, "clients.csv"), newline="", encoding="utf-8") as f:
+            clients_csv = sum(1 for _ in csv.DictReader(f))
+        if backend == "sqlite":
+            import sqlite3
+            conn = sqlite3.connect(env["STORAGE_DB_PATH"])
+            clients_saved = conn.execute('SELECT COUNT(*) FROM "clients"').fetchone()[0]
+            conn.close()
+        else:
+            clients_saved = clients_csv
+    total = sum(len(v) for v in merged.values())
+    print(f"\n[{backend}] {args.procs} proc x {args.threads} threads, {args.seconds}s: {total / args.seconds:.0f} ops/s")
+    print(f"{'operação':>20} {'n':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for op in OPS:
+        v = merged[op]
+        print(f"{op:>20} {len(v):>7} {_pct(v, 0.5):>8.2f} {_pct(v, 0.95):>8.2f} {_pct(v, 0.99):>8.2f}")
+    print(f"add_client: {len(merged['add_client'])} chamadas, {clients_saved} clientes gravados")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="csv,sqlite")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--procs", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _worker(args)
+        return
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        _run_backend(backend, args)
+
+if __name__ == "__main__":
+    main()
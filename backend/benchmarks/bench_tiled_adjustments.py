@@ -0,0 +1,60 @@
+"""
+Cadeia de ajustes em faixas (ADJUST_MEMORY_MB) x imagem inteira.
+
+Verifica que a saída em faixas é bit a bit idêntica à da imagem inteira (uma
+única faixa) para vários presets e tetos de memória, e mede o pico de memória
+alocada pelo NumPy (tracemalloc) e o tempo. Sai com código 1 se houver diferença.
+
+Uso:
+    python benchmarks/bench_tiled_adjustments.py
+    python benchmarks/bench_tiled_adjustments.py --size 8192x5464 --budgets 64,256
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import storage_image_editor as editor  # noqa: E402
+from bench_compiled_lut import PRESETS, _synthetic  # noqa: E402
+
+def _run(img, params, budget_mb):
+    editor.ADJUST_MEMORY_MB = budget_mb
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = np.asarray(editor._apply_adjustments(img, params))
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak / (1024 * 1024)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="4000x3000")
+    parser.add_argument("--budgets", default="8,32,128")
+    args = parser.parse_args()
+
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    img = _synthetic(w, h)
+    budgets = [float(b) for b in args.budgets.split(",") if b.strip()]
+    whole_mb = 1e9  # sem teto: uma única faixa = caminho da imagem inteira
+    print(f"imagem {w}x{h} ({w * h / 1e6:.1f} MP)")
+    print(f"{'preset':>20} {'teto MB':>8} {'pico MB':>8} {'tempo s':>8} {'idêntico':>9}")
+
+    failed = False
+    for name, params in PRESETS.items():
+        ref, t_ref, peak_ref = _run(img, params, whole_mb)
+        print(f"{name:>20} {'inteira':>8} {peak_ref:>8.0f} {t_ref:>8.3f} {'-':>9}")
+        for budget in budgets:
+            out, t, peak = _run(img, params, budget)
+            same = bool(np.array_equal(ref, out))
+            failed = failed or not same
+            print(f"{'':>20} {budget:>8.0f} {peak:>8.0f} {t:>8.3f} {'sim' if same else 'NÃO':>9}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
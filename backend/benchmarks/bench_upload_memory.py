@@ -0,0 +1,74 @@
+"""
+Pico de memória do recebimento de uploads: leitura inteira (await f.read()) x streaming
+em blocos para disco (storage_uploads.stage_upload).
+
+Gera --files arquivos de --mb MB cada, monta UploadFiles como o multipart do Starlette
+(SpooledTemporaryFile) e mede com tracemalloc o pico ao receber o lote inteiro, como faz
+POST /events/{id}/gallery/upload. Confere também que o sha256 calculado na cópia bate
+com o do arquivo gravado.
+
+Uso:
+    python benchmarks/bench_upload_memory.py
+    python benchmarks/bench_upload_memory.py --files 50 --mb 8
+    UPLOAD_CHUNK_BYTES=262144 python benchmarks/bench_upload_memory.py
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import UploadFile  # noqa: E402
+import storage_uploads  # noqa: E402
+from storage_derivatives import content_key  # noqa: E402
+
+def _uploads(count: int, size: int):
+    block = os.urandom(1 << 20)
+    files = []
+    for i in range(count):
+        spool = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+        left = size
+        while left > 0:
+            spool.write(block[:min(left, len(block))])
+            left -= len(block)
+        spool.seek(0)
+        files.append(UploadFile(spool, filename=f"foto_{i}.jpg"))
+    return files
+
+async def _read_all(files):
+    return [(f.filename, await f.read()) for f in files]
+
+async def _stage_all(files):
+    return [(f.filename, await storage_uploads.stage_upload(f)) for f in files]
+
+def _measure(label: str, fn, files):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = asyncio.run(fn(files))
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>12}: pico {peak / (1 << 20):8.1f} MB, {elapsed:.2f} s")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--mb", type=float, default=5.0)
+    args = parser.parse_args()
+    size = int(args.mb * (1 << 20))
+
+    with tempfile.TemporaryDirectory() as folder:
+        storage_uploads.UPLOAD_TMP_DIR = folder
+        print(f"{args.files} arquivos x {args.mb} MB, bloco {storage_uploads.UPLOAD_CHUNK_BYTES} bytes")
+        _measure("read()", _read_all, _uploads(args.files, size))
+        staged = _measure("streaming", _stage_all, _uploads(args.files, size))
+        ok = all(s.size == size and s.sha256 == content_key(path=s.path) for _, s in staged)
+        print(f"tamanho e sha256 conferem: {ok}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Vazão da verificação de ativos por leitura de tags (storage_verifications).
+
+Monta numa pasta temporária um sessions.json com --history sessões antigas e uma sessão
+ativa com --assets ativos, e compara:
+  - por leitura (antes): carrega o JSON inteiro, busca linear e regrava o arquivo a cada tag;
+  - em lote (agora): POST verify-batch -> verify_batch_in_session com --batch leituras,
+    mapa código -> ativo em memória e uma linha no diário por lote.
+Depois sobe --procs processos gravando lotes na mesma sessão (como workers do uvicorn) e
+confere que a soma das quantidades verificadas bate com o total de leituras aceitas.
+
+Uso:
+    python benchmarks/bench_verification.py
+    python benchmarks/bench_verification.py --history 500 --assets 5000 --batch 2000 --procs 4
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND)
+
+import storage_verifications as sv  # noqa: E402
+
+def _point_to(folder: str):
+    sv.VERIFICATIONS_DIR = folder
+    sv.SESSIONS_PATH = os.path.join(folder, "sessions.json")
+    sv.LISTS_PATH = os.path.join(folder, "lists.json")
+    sv.JOURNAL_PATH = os.path.join(folder, "sessions.journal")
+    sv.LOCK_PATH = os.path.join(folder, "sessions.lock")
+    sv._loaded_sig = None
+
+def _assets(count: int, prefix: str):
+    return [{"id": i, "name": f"Ativo {i}", "item_code": f"{prefix}IC{i}", "qr_code": f"{prefix}QR{i}", "rfid_code": f"{prefix}E2{i:08d}",
+             "unit_id": "loc_bench", "quantity": 1} for i in range(count)]
+
+def _seed(folder: str, history: int, assets: int) -> str:
+    _point_to(folder)
+    old = [{"id": f"session_old{i}", "user": "bench", "type": "unit", "name": f"Antiga {i}", "target_id": "loc_bench",
+            "include_sub_units": False, "status": "finished", "start_time": "2024-01-01T00:00:00", "end_time": "2024-01-01T01:00:00",
+            "assets": [dict(a, expected_quantity=1, verified_quantity=1, verified=True) for a in _assets(assets // 4, f"H{i}")]}
+           for i in range(history)]
+    with open(sv.SESSIONS_PATH, "w", encoding="utf-8") as f:
+        json.dump({"sessions": old}, f, ensure_ascii=False, indent=2)
+    return sv.start_session("bench", "unit", "Bench", False, "loc_bench", _assets(assets, ""))["id"]
+
+def _legacy_verify(session_id: str, code: str):
+    """Implementação anterior: JSON inteiro por leitura."""
+    with open(sv.SESSIONS_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    session = next((s for s in data["sessions"] if s.get("id") == session_id), None)
+    code_lower = code.lower()
+    for asset in session["assets"]:
+        if code_lower in [(asset.get("item_code") or "").lower(), (asset.get("qr_code") or "").lower(), (asset.get("rfid_code") or "").lower()]:
+            asset["verified_quantity"] += 1
+            break
+    with open(sv.SESSIONS_PATH, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def _reads(rng: random.Random, assets: int, count: int, prefix: str = ""):
+    # ~30% de releituras imediatas (tag parada no campo do leitor)
+    out = []
+    for _ in range(count):
+        if out and rng.random() < 0.3:
+            out.append(out[-1])
+        else:
+            out.append(f"{prefix}E2{rng.randrange(assets):08d}")
+    return out
+
+def _child(args):
+    _point_to(args.folder)
+    rng = random.Random(os.getpid())
+    accepted = 0
+    for _ in range(args.rounds):
+        accepted += sv.verify_batch_in_session(args.session, _reads(rng, args.assets, args.batch))["accepted"]
+    print(accepted)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, default=100)
+    parser.add_argument("--assets", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--procs", type=int, default=2)
+    parser.add_argument("--legacy-reads", type=int, default=20)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    parser.add_argument("--session", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args)
+        return
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as folder:
+        sid = _seed(folder, args.history, args.assets)
+        sv.compact_sessions()
+        size_mb = os.path.getsize(sv.SESSIONS_PATH) / (1 << 20)
+        print(f"sessions.json {size_mb:.1f} MB ({args.history} sessões antigas), sessão ativa com {args.assets} ativos")
+
+        reads = _reads(rng, args.assets, args.legacy_reads)
+        t0 = time.perf_counter()
+        for code in reads:
+            _legacy_verify(sid, code)
+        legacy = len(reads) / (time.perf_counter() - t0)
+        print(f"{'por leitura (antes)':>22}: {legacy:10.0f} leituras/s")
+
+        sid = sv.start_session("bench", "unit", "Bench 2", False, "loc_bench", _assets(args.assets, ""))["id"]
+        t0 = time.perf_counter()
+        total = 0
+        for _ in range(args.rounds):
+            r = sv.verify_batch_in_session(sid, _reads(rng, args.assets, args.batch))
+            total += args.batch
+        batched = total / (time.perf_counter() - t0)
+        st = sv.verification_stats()
+        print(f"{'em lote':>22}: {batched:10.0f} leituras/s ({args.batch}/lote; duplicadas descartadas: {st['duplicates']})")
+
+        sid = sv.start_session("bench", "unit", "Bench 3", False, "loc_bench", _assets(args.assets, ""))["id"]
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", "--folder", folder, "--session", sid,
+               "--assets", str(args.assets), "--batch", str(args.batch), "--rounds", str(args.rounds)]
+        t0 = time.perf_counter()
+        procs = [subprocess.Popen(cmd, stdout=subprocess.PIPE) for _ in range(args.procs)]
+        accepted = sum(int(p.communicate()[0].decode().strip()) for p in procs)
+        elapsed = time.perf_counter() - t0
+        sv._loaded_sig = None
+        counted = sum(a["verified_quantity"] for a in sv.get_session(sid)["assets"])
+        print(f"{args.procs} processos: {args.procs * args.rounds * args.batch / elapsed:.0f} leituras/s; "
+              f"aceitas {accepted}, somadas na sessão {counted:.0f} -> {'ok' if accepted == counted else 'DIVERGENTE'}")
+        print(f"diário {os.path.getsize(sv.JOURNAL_PATH) / 1024:.0f} KB, compactações {sv.verification_stats()['compactions']}")
+
+if __name__ == "__main__":
+    main()
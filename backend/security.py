@@ -1,17 +1,46 @@
+import os
+import time
 import hashlib
 import hmac
 import secrets
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# NOVO: esquema dos hashes novos ("pbkdf2_sha256" ou "scrypt"); hashes antigos continuam
+# válidos e são regravados no esquema/parâmetros atuais no próximo login (needs_rehash)
+PASSWORD_SCHEME = (os.environ.get("PASSWORD_SCHEME", "pbkdf2_sha256") or "pbkdf2_sha256").strip().lower()
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", "310000"))
+SCRYPT_N = int(os.environ.get("SCRYPT_N", "16384"))
+SCRYPT_R = int(os.environ.get("SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("SCRYPT_P", "1"))
+
+# NOVO: executor dedicado ao hashing de senha (não ocupa o threadpool das demais rotas);
+# acima de PASSWORD_QUEUE_MAX jobs (em execução + na fila) o pedido é recusado na hora
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", "0") or 0) or (os.cpu_count() or 1)
+PASSWORD_QUEUE_MAX = int(os.environ.get("PASSWORD_QUEUE_MAX", "0") or 0) or 4 * PASSWORD_WORKERS
 
 
 def _pbkdf2_sha256(password: str, salt: bytes, iterations: int = 310_000) -> bytes:
     return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
 
 
-def hash_password(password: str, iterations: int = 310_000) -> str:
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # memória do scrypt ~ 128 * n * r bytes (16 MB com n=16384, r=8)
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=32, maxmem=256 * n * r * p + (1 << 20))
+
+
+def hash_password(password: str, iterations: Optional[int] = None) -> str:
     """
-    Retorna um hash no formato: pbkdf2_sha256$<iterations>$<salt_hex>$<hash_hex>
+    Hash no esquema configurado:
+    pbkdf2_sha256$<iterations>$<salt_hex>$<hash_hex> ou scrypt$<n>$<r>$<p>$<salt_hex>$<hash_hex>.
+    iterations força PBKDF2 com essa contagem.
     """
     salt = secrets.token_bytes(16)
+    if iterations is None and PASSWORD_SCHEME == "scrypt":
+        dk = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${dk.hex()}"
+    iterations = iterations or PBKDF2_ITERATIONS
     dk = _pbkdf2_sha256(password, salt, iterations)
     return f"pbkdf2_sha256${iterations}${salt.hex()}${dk.hex()}"
 
@@ -21,13 +50,84 @@ def verify_password(password: str, stored: str) -> bool:
     Verifica senha utilizando comparação em tempo constante.
     """
     try:
-        scheme, iters_str, salt_hex, hash_hex = stored.split("$", 3)
-        if scheme != "pbkdf2_sha256":
+        scheme, rest = stored.split("$", 1)
+        if scheme == "pbkdf2_sha256":
+            iters_str, salt_hex, hash_hex = rest.split("$", 2)
+            candidate = _pbkdf2_sha256(password, bytes.fromhex(salt_hex), int(iters_str))
+        elif scheme == "scrypt":
+            n, r, p, salt_hex, hash_hex = rest.split("$", 4)
+            candidate = _scrypt(password, bytes.fromhex(salt_hex), int(n), int(r), int(p))
+        else:
             return False
-        iterations = int(iters_str)
-        salt = bytes.fromhex(salt_hex)
-        expected = bytes.fromhex(hash_hex)
-        candidate = _pbkdf2_sha256(password, salt, iterations)
-        return hmac.compare_digest(candidate, expected)
+        return hmac.compare_digest(candidate, bytes.fromhex(hash_hex))
     except Exception:
-        return False
\ No newline at end of file
+        return False
+
+
+def needs_rehash(stored: str) -> bool:
+    """True se o hash não está no esquema/parâmetros atuais (regravar após login bem-sucedido)."""
+    parts = (stored or "").split("$")
+    if PASSWORD_SCHEME == "scrypt":
+        return not (len(parts) == 6 and parts[0] == "scrypt" and parts[1:4] == [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)])
+    return not (len(parts) == 4 and parts[0] == "pbkdf2_sha256" and parts[1] == str(PBKDF2_ITERATIONS))
+
+
+class PasswordBusy(Exception):
+    """Fila de hashing de senha cheia (a API responde 503)."""
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_pending = 0
+_stats: Dict[str, Any] = {"accepted": 0, "rejected": 0, "seconds": []}
+_SAMPLES = 512
+
+
+def submit_password_job(fn: Callable[..., Any], *args: Any) -> Future:
+    """
+    Executa fn(*args) no executor de senhas (hashlib libera o GIL durante o hash).
+    PasswordBusy se já houver PASSWORD_QUEUE_MAX jobs pendentes.
+    """
+    global _executor, _pending
+    with _lock:
+        if _pending >= PASSWORD_QUEUE_MAX:
+            _stats["rejected"] += 1
+            raise PasswordBusy()
+        _pending += 1
+        _stats["accepted"] += 1
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password")
+
+    def run():
+        global _pending
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - t0
+            with _lock:
+                _pending -= 1
+                samples = _stats["seconds"]
+                samples.append(elapsed)
+                if len(samples) > _SAMPLES:
+                    del samples[0]
+
+    return _executor.submit(run)
+
+
+def password_stats() -> Dict[str, Any]:
+    with _lock:
+        samples = sorted(_stats["seconds"])
+        return {
+            "scheme": PASSWORD_SCHEME,
+            "workers": PASSWORD_WORKERS,
+            "queue_max": PASSWORD_QUEUE_MAX,
+            "pending": _pending,
+            "accepted": _stats["accepted"],
+            "rejected": _stats["rejected"],
+            "hash_ms": {
+                "samples": len(samples),
+                "avg": round(1000.0 * sum(samples) / len(samples), 2) if samples else None,
+                "p95": round(1000.0 * samples[min(len(samples) - 1, int(0.95 * len(samples)))], 2) if samples else None,
+            },
+        }
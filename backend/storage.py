@@ -1,9 +1,10 @@
 import csv
 import os
 import base64
-from typing import Optional, Dict, List
+from typing import Callable, Optional, Dict, List
 
 from security import hash_password
+from storage_db import open_table
 
 USERS_CSV_PATH = os.environ.get(
     "USERS_CSV_PATH",
@@ -59,6 +60,27 @@ def _ensure_csv():
                 writer.writerow(new_row)
 
 
+# NOVO: tabela do backend configurado (CSV com cache ou SQLite, ver storage_db);
+# caminho lido na hora por causa de USERS_CSV_PATH
+_users = open_table("users", lambda: USERS_CSV_PATH, CSV_FIELDS, key="username", ensure=_ensure_csv)
+
+
+# NOVO: chamados com o username depois de update_user/delete_user (ex.: cache de sessões da API)
+_user_listeners: List[Callable[[str], None]] = []
+
+
+def add_user_listener(fn: Callable[[str], None]):
+    _user_listeners.append(fn)
+
+
+def _notify_user_changed(username: str):
+    for fn in list(_user_listeners):
+        try:
+            fn(username)
+        except Exception:
+            pass
+
+
 def _safe_filename(name: str) -> str:
     return "".join(ch if ch.isalnum() or ch in ("-", "_") else "_" for ch in name)
 
@@ -104,50 +126,30 @@ def _serialize_pages(pages: Optional[List[str]]) -> str:
     return ",".join(sorted(set(pages)))
 
 
+def _user_out(row: Dict[str, str]) -> Dict[str, str]:
+    return {
+        "username": row.get("username", ""),
+        "password_hash": row.get("password_hash", ""),
+        "role": row.get("role", ""),
+        "full_name": row.get("full_name", ""),
+        "profile_photo_path": row.get("profile_photo_path", ""),
+        "allowed_pages": _parse_pages(row.get("allowed_pages", "")),
+        # ADDED: extras
+        "cpf": row.get("cpf", "") or "",
+        "birth_date": row.get("birth_date", "") or "",
+        "rg": row.get("rg", "") or "",
+        "admission_date": row.get("admission_date", "") or "",
+        "sector": row.get("sector", "") or "",
+    }
+
+
 def get_user(username: str) -> Optional[Dict[str, str]]:
-    _ensure_csv()
-    with open(USERS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("username") == username:
-                return {
-                    "username": row.get("username", ""),
-                    "password_hash": row.get("password_hash", ""),
-                    "role": row.get("role", ""),
-                    "full_name": row.get("full_name", ""),
-                    "profile_photo_path": row.get("profile_photo_path", ""),
-                    "allowed_pages": _parse_pages(row.get("allowed_pages", "")),
-                    # ADDED: extras
-                    "cpf": row.get("cpf", "") or "",
-                    "birth_date": row.get("birth_date", "") or "",
-                    "rg": row.get("rg", "") or "",
-                    "admission_date": row.get("admission_date", "") or "",
-                    "sector": row.get("sector", "") or "",
-                }
-    return None
+    row = _users.get(username)
+    return _user_out(row) if row is not None else None
 
 
 def get_all_users() -> List[Dict[str, str]]:
-    _ensure_csv()
-    out: List[Dict[str, str]] = []
-    with open(USERS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            out.append({
-                "username": row.get("username", ""),
-                "password_hash": row.get("password_hash", ""),
-                "role": row.get("role", ""),
-                "full_name": row.get("full_name", ""),
-                "profile_photo_path": row.get("profile_photo_path", ""),
-                "allowed_pages": _parse_pages(row.get("allowed_pages", "")),
-                # ADDED: extras
-                "cpf": row.get("cpf", "") or "",
-                "birth_date": row.get("birth_date", "") or "",
-                "rg": row.get("rg", "") or "",
-                "admission_date": row.get("admission_date", "") or "",
-                "sector": row.get("sector", "") or "",
-            })
-    return out
+    return [_user_out(row) for row in _users.rows()]
 
 
 def add_user(username: str, password: str, role: str, full_name: str, profile_photo_base64: Optional[str] = None, allowed_pages: Optional[List[str]] = None,
@@ -155,15 +157,15 @@ def add_user(username: str, password: str, role: str, full_name: str, profile_ph
     """
     Adiciona usuário com a senha HASHEADA. Inclui campos opcionais (cpf, nascimento, rg, admissão, setor).
     """
-    _ensure_csv()
     existing = get_user(username)
     if existing:
         raise ValueError("Usuário já existe.")
     password_hash = hash_password(password)
     photo_path = _save_profile_photo(username, profile_photo_base64)
-    with open(USERS_CSV_PATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writerow({
+    with _users.transaction():
+        if _users.get(username) is not None:
+            raise ValueError("Usuário já existe.")
+        _users.insert({
             "username": username,
             "password_hash": password_hash,
             "role": role,
@@ -184,61 +186,50 @@ def update_user(username: str, full_name: Optional[str] = None, role: Optional[s
     """
     Atualiza dados do usuário, incluindo campos opcionais (cpf, nascimento, rg, admissão, setor).
     """
-    _ensure_csv()
-    updated = None
-    rows = []
-    with open(USERS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("username") == username:
-                if full_name is not None:
-                    row["full_name"] = full_name
-                if role is not None:
-                    row["role"] = role
-                if password is not None and password.strip():
-                    row["password_hash"] = hash_password(password)
-                if profile_photo_base64 is not None:
-                    photo_path = _save_profile_photo(username, profile_photo_base64)
-                    row["profile_photo_path"] = photo_path or ""
-                if allowed_pages is not None:
-                    row["allowed_pages"] = _serialize_pages(allowed_pages)
-                # ADDED: extras
-                if cpf is not None:
-                    row["cpf"] = cpf.strip()
-                if birth_date is not None:
-                    row["birth_date"] = birth_date.strip()
-                if rg is not None:
-                    row["rg"] = rg.strip()
-                if admission_date is not None:
-                    row["admission_date"] = admission_date.strip()
-                if sector is not None:
-                    row["sector"] = sector.strip()
-
-                updated = {
-                    "username": row.get("username", ""),
-                    "password_hash": row.get("password_hash", ""),
-                    "role": row.get("role", ""),
-                    "full_name": row.get("full_name", ""),
-                    "profile_photo_path": row.get("profile_photo_path", ""),
-                    "allowed_pages": _parse_pages(row.get("allowed_pages", "")),
-                    "cpf": row.get("cpf", "") or "",
-                    "birth_date": row.get("birth_date", "") or "",
-                    "rg": row.get("rg", "") or "",
-                    "admission_date": row.get("admission_date", "") or "",
-                    "sector": row.get("sector", "") or "",
-                }
-            rows.append(row)
-
-    if updated is None:
-        return None
-
-    with open(USERS_CSV_PATH, "w", newline="", encoding="utf-8") as fw:
-        writer = csv.DictWriter(fw, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
-
-    return updated
+    # hash fora da transação (caro de propósito)
+    password_hash = hash_password(password) if password is not None and password.strip() else None
+    with _users.transaction():
+        row = _users.get(username)
+        if row is None:
+            return None
+        if full_name is not None:
+            row["full_name"] = full_name
+        if role is not None:
+            row["role"] = role
+        if password_hash is not None:
+            row["password_hash"] = password_hash
+        if profile_photo_base64 is not None:
+            photo_path = _save_profile_photo(username, profile_photo_base64)
+            row["profile_photo_path"] = photo_path or ""
+        if allowed_pages is not None:
+            row["allowed_pages"] = _serialize_pages(allowed_pages)
+        # ADDED: extras
+        if cpf is not None:
+            row["cpf"] = cpf.strip()
+        if birth_date is not None:
+            row["birth_date"] = birth_date.strip()
+        if rg is not None:
+            row["rg"] = rg.strip()
+        if admission_date is not None:
+            row["admission_date"] = admission_date.strip()
+        if sector is not None:
+            row["sector"] = sector.strip()
+        _users.put(row)
+    _notify_user_changed(username)
+    return _user_out(row)
+
+
+def set_password_hash(username: str, password_hash: str, expected_hash: str) -> bool:
+    """
+    Troca o hash da senha só se o atual ainda for expected_hash (rehash após login:
+    não sobrescreve uma senha alterada nesse meio-tempo). Mesma senha: sessões seguem válidas.
+    """
+    with _users.transaction():
+        row = _users.get(username)
+        if row is None or row.get("password_hash") != expected_hash:
+            return False
+        row["password_hash"] = password_hash
+        return _users.put(row)
 
 
 def delete_user(username: str) -> bool:
@@ -246,21 +237,7 @@ def delete_user(username: str) -> bool:
     Remove usuário do CSV. Não remove a foto de perfil para manter cache estático simples.
     Retorna True se removido; False se não encontrado.
     """
-    _ensure_csv()
-    rows = []
-    removed = False
-    with open(USERS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("username") == username:
-                removed = True
-                continue
-            rows.append(row)
-    if not removed:
-        return False
-    with open(USERS_CSV_PATH, "w", newline="", encoding="utf-8") as fw:
-        writer = csv.DictWriter(fw, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
-    return True
\ No newline at end of file
+    removed = _users.delete(username)
+    if removed:
+        _notify_user_changed(username)
+    return removed
@@ -1,12 +1,29 @@
 import os
+import io
 import csv
+import uuid
 import base64
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from datetime import datetime
 
+from storage_db import open_table
+from storage_hierarchy import node_ids, subtree_ids, subtree_counts
+from storage_jobs import JobContext, create_job, register_handler, submit_job
+from storage_logs import append_log
+from storage_uploads import UPLOAD_TMP_DIR, StagedUpload, commit_upload
+
+try:
+    import openpyxl  # opcional: importação/exportação .xlsx
+except ImportError:  # pragma: no cover
+    openpyxl = None
+
 ASSETS_DIR = os.path.join(os.path.dirname(__file__), "media", "assets")
 ASSETS_CSV = os.path.join(ASSETS_DIR, "assets.csv")
 CATS_JSON = os.path.join(ASSETS_DIR, "asset_categories.txt")
+# planilhas recebidas ficam aqui até o job de importação terminar (retomável após reinício);
+# junto dos uploads temporários, fora de media/ (não são servidas em /static)
+IMPORTS_DIR = os.path.join(UPLOAD_TMP_DIR, "asset_imports")
+ASSET_IMPORT_BATCH = max(1, int(os.environ.get("ASSET_IMPORT_BATCH", "500")))
 
 ASSET_FIELDS = [
     "id",
@@ -67,19 +84,11 @@ def _ensure_store():
         with open(CATS_JSON, "w", encoding="utf-8") as f:
             f.write("")
 
-def _next_id() -> int:
-    _ensure_store()
-    max_id = 0
-    with open(ASSETS_CSV, "r", newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            try:
-                rid = int(row.get("id", "0") or 0)
-                if rid > max_id:
-                    max_id = rid
-            except Exception:
-                pass
-    return max_id + 1
+# NOVO: tabela do backend configurado (CSV com cache ou SQLite, ver storage_db), por id, por unidade
+# e pelos códigos das etiquetas (sem diferenciar maiúsculas); os índices acompanham add/update/delete
+TAG_FIELDS = ("rfid_code", "qr_code", "item_code")
+_assets = open_table("assets", ASSETS_CSV, ASSET_FIELDS, key="id", indexes=("unit_id",) + TAG_FIELDS, ensure=_ensure_store, nocase=TAG_FIELDS)
+ASSET_LOOKUP_MAX = int(os.environ.get("ASSET_LOOKUP_MAX", "5000"))
 
 def _safe_filename(name: str) -> str:
     return "".join(ch if ch.isalnum() or ch in ("-", "_", ".", " ") else "_" for ch in name).strip().replace(" ", "_")
@@ -103,7 +112,7 @@ def save_photo_base64(unit_id: str, photo_base64: Optional[str]) -> Optional[str
                     ext = "png"
             except Exception:
                 ext = "png"
-        fname = _safe_filename(f"asset_{unit_id}_{_next_id()}") + f".{ext}"
+        fname = _safe_filename(f"asset_{unit_id}_{_assets.next_id()}") + f".{ext}"
         full_path = os.path.join(ASSETS_DIR, str(unit_id), fname)
         with open(full_path, "wb") as imgf:
             imgf.write(base64.b64decode(data_part))
@@ -112,97 +121,115 @@ def save_photo_base64(unit_id: str, photo_base64: Optional[str]) -> Optional[str
     except Exception:
         return None
 
+def _asset_out(row: Dict[str, str]) -> Dict[str, Any]:
+    qty_raw = row.get("quantity", "")
+    try:
+        qty = float(qty_raw) if str(qty_raw).strip() != "" else None
+    except Exception:
+        qty = None
+    return {
+        "id": int(row.get("id", "0") or 0),
+        "unit_id": row.get("unit_id"),
+        "name": row.get("name", ""),
+        "description": row.get("description", ""),
+        "qr_code": row.get("qr_code", "") or "",
+        "rfid_code": row.get("rfid_code", "") or "",
+        "item_code": row.get("item_code", "") or "",
+        "category": row.get("category", "") or "",
+        "notes": row.get("notes", "") or "",
+        "photo_path": row.get("photo_path", "") or "",
+        "quantity": qty,
+        "unit": row.get("unit", "") or "",
+        "created_at": row.get("created_at", "") or "",
+        "updated_at": row.get("updated_at", "") or "",
+        "created_by": row.get("created_by", "") or "",
+    }
+
 def list_assets(unit_id: str) -> List[Dict[str, Any]]:
-    _ensure_store()
-    out: List[Dict[str, Any]] = []
-    with open(ASSETS_CSV, "r", newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            if str(row.get("unit_id") or "") == str(unit_id):
-                qty_raw = row.get("quantity", "")
-                try:
-                    qty = float(qty_raw) if str(qty_raw).strip() != "" else None
-                except Exception:
-                    qty = None
-                out.append({
-                    "id": int(row.get("id", "0") or 0),
-                    "unit_id": row.get("unit_id"),
-                    "name": row.get("name", ""),
-                    "description": row.get("description", ""),
-                    "qr_code": row.get("qr_code", "") or "",
-                    "rfid_code": row.get("rfid_code", "") or "",
-                    "item_code": row.get("item_code", "") or "",
-                    "category": row.get("category", "") or "",
-                    "notes": row.get("notes", "") or "",
-                    "photo_path": row.get("photo_path", "") or "",
-                    "quantity": qty,
-                    "unit": row.get("unit", "") or "",
-                    "created_at": row.get("created_at", "") or "",
-                    "updated_at": row.get("updated_at", "") or "",
-                    "created_by": row.get("created_by", "") or "",
-                })
-    return out
+    return [_asset_out(row) for row in _assets.find("unit_id", str(unit_id))]
 
 def get_all_assets_flat() -> List[Dict[str, Any]]:
-    _ensure_store()
-    out: List[Dict[str, Any]] = []
-    with open(ASSETS_CSV, "r", newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            qty_raw = row.get("quantity", "")
-            try:
-                qty = float(qty_raw) if str(qty_raw).strip() != "" else None
-            except Exception:
-                qty = None
-            out.append({
-                "id": int(row.get("id", "0") or 0),
-                "unit_id": row.get("unit_id"),
-                "name": row.get("name", ""),
-                "description": row.get("description", ""),
-                "qr_code": row.get("qr_code", "") or "",
-                "rfid_code": row.get("rfid_code", "") or "",
-                "item_code": row.get("item_code", "") or "",
-                "category": row.get("category", "") or "",
-                "notes": row.get("notes", "") or "",
-                "photo_path": row.get("photo_path", "") or "",
-                "quantity": qty,
-                "unit": row.get("unit", "") or "",
-                "created_at": row.get("created_at", "") or "",
-                "updated_at": row.get("updated_at", "") or "",
-                "created_by": row.get("created_by", "") or "",
-            })
-    return out
+    return [_asset_out(row) for row in _assets.rows()]
+
+def list_assets_in(unit_ids: List[str]) -> List[Dict[str, Any]]:
+    """Ativos de várias unidades numa consulta pelo índice unit_id (na ordem de unit_ids)."""
+    hits = _assets.find_many("unit_id", unit_ids)
+    return [_asset_out(row) for uid in unit_ids for row in hits.get(str(uid), [])]
+
+def list_subtree_assets(unit_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Ativos da unidade e de todas as subunidades; None se a unidade não existe."""
+    ids = subtree_ids(unit_id)
+    return list_assets_in(ids) if ids is not None else None
+
+def subtree_asset_counts(unit_id: str) -> Optional[Dict[str, Dict[str, int]]]:
+    """{id: {"own", "total"}} de ativos para cada nó da subárvore de unit_id (contagem pelo índice)."""
+    ids = subtree_ids(unit_id)
+    if ids is None:
+        return None
+    return subtree_counts(unit_id, _assets.count_many("unit_id", ids))
+
+def get_asset(asset_id: int) -> Optional[Dict[str, Any]]:
+    row = _assets.get(int(asset_id))
+    return _asset_out(row) if row is not None else None
+
+def lookup_codes(codes: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Resolve códigos de etiqueta -> ativo, pelos índices (RFID, depois QR, depois código do item;
+    por último o id numérico). {código: {"field", "asset", "matches"} ou None}.
+    """
+    if len(codes) > ASSET_LOOKUP_MAX:
+        raise ValueError(f"Máximo de {ASSET_LOOKUP_MAX} códigos por consulta.")
+    wanted = list(dict.fromkeys(str(c or "").strip() for c in codes))
+    wanted = [c for c in wanted if c]
+    found: Dict[str, Optional[Dict[str, Any]]] = {c: None for c in wanted}
+    left = list(wanted)
+    for field in TAG_FIELDS:
+        if not left:
+            break
+        hits = _assets.find_many(field, left)
+        rest = []
+        for c in left:
+            rows = hits.get(c.lower())
+            if rows:
+                found[c] = {"field": field, "asset": _asset_out(rows[0]), "matches": len(rows)}
+            else:
+                rest.append(c)
+        left = rest
+    for c in left:
+        if c.isdigit():
+            row = _assets.get(int(c))
+            if row is not None:
+                found[c] = {"field": "id", "asset": _asset_out(row), "matches": 1}
+    return found
 
 def add_asset(unit_id: str, payload: Dict[str, Any], username: str) -> Dict[str, Any]:
-    _ensure_store()
-    aid = _next_id()
     now = datetime.utcnow().isoformat()
-    photo_path = save_photo_base64(unit_id, payload.get("photo_base64"))
     try:
         qty = float(payload.get("quantity")) if payload.get("quantity") is not None else None
     except Exception:
         qty = None
     unit = str(payload.get("unit") or "").strip()
-    row = {
-        "id": str(aid),
-        "unit_id": str(unit_id),
-        "name": str(payload.get("name") or "").strip(),
-        "description": str(payload.get("description") or "").strip(),
-        "qr_code": str(payload.get("qr_code") or "").strip(),
-        "rfid_code": str(payload.get("rfid_code") or "").strip(),
-        "item_code": str(payload.get("item_code") or "").strip(),
-        "category": str(payload.get("category") or "").strip(),
-        "notes": str(payload.get("notes") or "").strip(),
-        "photo_path": photo_path or "",
-        "quantity": "" if qty is None else str(qty),
-        "unit": unit,
-        "created_at": now,
-        "updated_at": now,
-        "created_by": username,
-    }
-    with open(ASSETS_CSV, "a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=ASSET_FIELDS)
-        w.writerow(row)
+    with _assets.transaction():
+        aid = _assets.next_id()
+        photo_path = save_photo_base64(unit_id, payload.get("photo_base64"))
+        row = {
+            "id": str(aid),
+            "unit_id": str(unit_id),
+            "name": str(payload.get("name") or "").strip(),
+            "description": str(payload.get("description") or "").strip(),
+            "qr_code": str(payload.get("qr_code") or "").strip(),
+            "rfid_code": str(payload.get("rfid_code") or "").strip(),
+            "item_code": str(payload.get("item_code") or "").strip(),
+            "category": str(payload.get("category") or "").strip(),
+            "notes": str(payload.get("notes") or "").strip(),
+            "photo_path": photo_path or "",
+            "quantity": "" if qty is None else str(qty),
+            "unit": unit,
+            "created_at": now,
+            "updated_at": now,
+            "created_by": username,
+        }
+        _assets.insert(row)
     return {
         **row,
         "id": aid,
@@ -210,78 +237,48 @@ def add_asset(unit_id: str, payload: Dict[str, Any], username: str) -> Dict[str,
     }
 
 def update_asset(asset_id: int, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    _ensure_store()
-    updated = None
-    rows = []
     now = datetime.utcnow().isoformat()
-    with open(ASSETS_CSV, "r", newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            if int(row.get("id", "0") or 0) == int(asset_id):
-                unit_id = row.get("unit_id", "")
-                photo_path = row.get("photo_path", "") or ""
-                if payload.get("photo_base64") is not None:
-                    new_photo = save_photo_base64(unit_id, payload.get("photo_base64"))
-                    if new_photo:
-                        photo_path = new_photo
-                try:
-                    qty = float(payload.get("quantity")) if payload.get("quantity") is not None else None
-                except Exception:
-                    qty = None
-                new_unit = str(payload.get("unit")) if payload.get("unit") is not None else row.get("unit", "")
-                new_row = {
-                    "id": row.get("id"),
-                    "unit_id": row.get("unit_id"),
-                    "name": str(payload.get("name") if payload.get("name") is not None else row.get("name", "")).strip(),
-                    "description": str(payload.get("description") if payload.get("description") is not None else row.get("description", "")).strip(),
-                    "qr_code": str(payload.get("qr_code") if payload.get("qr_code") is not None else row.get("qr_code", "")).strip(),
-                    "rfid_code": str(payload.get("rfid_code") if payload.get("rfid_code") is not None else row.get("rfid_code", "")).strip(),
-                    "item_code": str(payload.get("item_code") if payload.get("item_code") is not None else row.get("item_code", "")).strip(),
-                    "category": str(payload.get("category") if payload.get("category") is not None else row.get("category", "")).strip(),
-                    "notes": str(payload.get("notes") if payload.get("notes") is not None else row.get("notes", "")).strip(),
-                    "photo_path": photo_path,
-                    "quantity": "" if qty is None else str(qty),
-                    "unit": new_unit,
-                    "created_at": row.get("created_at", ""),
-                    "updated_at": now,
-                    "created_by": row.get("created_by", ""),
-                }
-                rows.append(new_row)
-                updated = {
-                    **new_row,
-                    "id": int(new_row["id"]),
-                    "quantity": qty,
-                }
-            else:
-                rows.append(row)
-    if updated is None:
-        return None
-    with open(ASSETS_CSV, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=ASSET_FIELDS)
-        w.writeheader()
-        for row in rows:
-            w.writerow(row)
-    return updated
+    with _assets.transaction():
+        row = _assets.get(int(asset_id))
+        if row is None:
+            return None
+        unit_id = row.get("unit_id", "")
+        photo_path = row.get("photo_path", "") or ""
+        if payload.get("photo_base64") is not None:
+            new_photo = save_photo_base64(unit_id, payload.get("photo_base64"))
+            if new_photo:
+                photo_path = new_photo
+        try:
+            qty = float(payload.get("quantity")) if payload.get("quantity") is not None else None
+        except Exception:
+            qty = None
+        new_unit = str(payload.get("unit")) if payload.get("unit") is not None else row.get("unit", "")
+        new_row = {
+            "id": row.get("id"),
+            "unit_id": row.get("unit_id"),
+            "name": str(payload.get("name") if payload.get("name") is not None else row.get("name", "")).strip(),
+            "description": str(payload.get("description") if payload.get("description") is not None else row.get("description", "")).strip(),
+            "qr_code": str(payload.get("qr_code") if payload.get("qr_code") is not None else row.get("qr_code", "")).strip(),
+            "rfid_code": str(payload.get("rfid_code") if payload.get("rfid_code") is not None else row.get("rfid_code", "")).strip(),
+            "item_code": str(payload.get("item_code") if payload.get("item_code") is not None else row.get("item_code", "")).strip(),
+            "category": str(payload.get("category") if payload.get("category") is not None else row.get("category", "")).strip(),
+            "notes": str(payload.get("notes") if payload.get("notes") is not None else row.get("notes", "")).strip(),
+            "photo_path": photo_path,
+            "quantity": "" if qty is None else str(qty),
+            "unit": new_unit,
+            "created_at": row.get("created_at", ""),
+            "updated_at": now,
+            "created_by": row.get("created_by", ""),
+        }
+        _assets.put(new_row)
+    return {
+        **new_row,
+        "id": int(new_row["id"]),
+        "quantity": qty,
+    }
 
 def delete_asset(asset_id: int) -> bool:
-    _ensure_store()
-    rows = []
-    removed = False
-    with open(ASSETS_CSV, "r", newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            if int(row.get("id", "0") or 0) == int(asset_id):
-                removed = True
-                continue
-            rows.append(row)
-    if not removed:
-        return False
-    with open(ASSETS_CSV, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=ASSET_FIELDS)
-        w.writeheader()
-        for row in rows:
-            w.writerow(row)
-    return True
+    return _assets.delete(int(asset_id))
 
 def list_categories() -> List[str]:
     _ensure_store()
@@ -310,4 +307,240 @@ def remove_category(name: str) -> List[str]:
     new_cats = [c for c in cats if c.lower() != nm.lower()]
     with open(CATS_JSON, "w", encoding="utf-8") as f:
         f.write("\n".join(new_cats))
-    return new_cats
\ No newline at end of file
+    return new_cats
+
+
+# --- Importação / exportação em massa ---
+
+IMPORT_COLUMNS = ("name", "description", "qr_code", "rfid_code", "item_code", "category", "notes", "quantity", "unit", "unit_id")
+# cabeçalhos aceitos além dos nomes das colunas
+_HEADER_ALIASES = {
+    "nome": "name", "descricao": "description", "descrição": "description", "qr": "qr_code", "rfid": "rfid_code",
+    "codigo": "item_code", "código": "item_code", "categoria": "category", "observacoes": "notes",
+    "observações": "notes", "quantidade": "quantity", "unidade": "unit", "local": "unit_id",
+}
+_MAX_ERRORS_PER_BATCH = 50
+
+def xlsx_supported() -> bool:
+    return openpyxl is not None
+
+def _header(values: List[Any]) -> List[str]:
+    names = []
+    for v in values:
+        h = str(v or "").strip().lower()
+        names.append(_HEADER_ALIASES.get(h, h))
+    if "name" not in names:
+        raise ValueError("Coluna obrigatória ausente: name (nome).")
+    return names
+
+def _read_import_rows(path: str, fmt: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """(nº da linha na planilha, valores por coluna), lidos em streaming; linhas vazias são puladas."""
+    if fmt == "xlsx":
+        if openpyxl is None:
+            raise ValueError("Importação .xlsx requer o pacote openpyxl.")
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = _header(list(next(rows, None) or []))
+            for n, values in enumerate(rows, start=2):
+                row = {h: ("" if v is None else str(v)).strip() for h, v in zip(header, values) if h}
+                if any(row.values()):
+                    yield n, row
+        finally:
+            wb.close()
+        return
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = _header(next(reader, None) or [])
+        for values in reader:
+            row = {h: v.strip() for h, v in zip(header, values) if h}
+            if any(row.values()):
+                yield reader.line_num, row
+
+def _unit_ids() -> set:
+    return node_ids()
+
+def _validate_batch(rows: List[Tuple[int, Dict[str, str]]], unit_id: str, units: set, seen: set) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+    """
+    Linhas da planilha -> (linhas prontas para gravar, erros {"row", "error"}).
+    RFID/QR não podem repetir códigos já cadastrados nem de linhas anteriores do arquivo.
+    """
+    existing: Dict[str, set] = {}
+    for field in ("rfid_code", "qr_code"):
+        codes = [v[field] for _, v in rows if v.get(field)]
+        existing[field] = set(_assets.find_many(field, codes)) if codes else set()
+    valid: List[Dict[str, str]] = []
+    errors: List[Dict[str, Any]] = []
+    for n, v in rows:
+        name = v.get("name", "")
+        if not name:
+            errors.append({"row": n, "error": "Nome obrigatório."})
+            continue
+        qty_raw = v.get("quantity", "").replace(",", ".")
+        try:
+            qty = float(qty_raw) if qty_raw else None
+        except ValueError:
+            errors.append({"row": n, "error": f"Quantidade inválida: {v.get('quantity')}."})
+            continue
+        target = v.get("unit_id") or unit_id
+        if target not in units:
+            errors.append({"row": n, "error": f"Unidade não encontrada: {target}."})
+            continue
+        dup = next((f for f in ("rfid_code", "qr_code") if v.get(f) and (v[f].lower() in existing[f] or (f, v[f].lower()) in seen)), None)
+        if dup:
+            errors.append({"row": n, "error": f"{dup} já cadastrado: {v[dup]}."})
+            continue
+        for f in ("rfid_code", "qr_code"):
+            if v.get(f):
+                seen.add((f, v[f].lower()))
+        valid.append({
+            "unit_id": target,
+            "name": name,
+            "description": v.get("description", ""),
+            "qr_code": v.get("qr_code", ""),
+            "rfid_code": v.get("rfid_code", ""),
+            "item_code": v.get("item_code", ""),
+            "category": v.get("category", ""),
+            "notes": v.get("notes", ""),
+            "photo_path": "",
+            "quantity": "" if qty is None else str(qty),
+            "unit": v.get("unit", ""),
+        })
+    return valid, errors
+
+def _batches(path: str, fmt: str) -> Iterator[List[Tuple[int, Dict[str, str]]]]:
+    batch: List[Tuple[int, Dict[str, str]]] = []
+    for item in _read_import_rows(path, fmt):
+        batch.append(item)
+        if len(batch) >= ASSET_IMPORT_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def validate_asset_import(path: str, fmt: str, unit_id: str) -> Dict[str, Any]:
+    """Simulação (dry run): valida o arquivo inteiro sem gravar."""
+    units, seen = _unit_ids(), set()
+    rows = valid = 0
+    errors: List[Dict[str, Any]] = []
+    for batch in _batches(path, fmt):
+        ok, errs = _validate_batch(batch, str(unit_id), units, seen)
+        rows += len(batch)
+        valid += len(ok)
+        errors.extend(errs[:max(0, 100 - len(errors))])
+    return {"rows": rows, "valid": valid, "rejected": rows - valid, "errors": errors}
+
+def _import_assets_job(job: Dict[str, Any], items: List[Dict[str, Any]], ctx: JobContext):
+    """
+    Handler de jobs 'import_assets': um item por lote de ASSET_IMPORT_BATCH linhas. Cada lote é validado,
+    recebe ids de uma vez e é gravado numa única escrita, com um registro no log. Lotes já concluídos
+    (retomada após reinício) são pulados. Dentro da transação, antes de gravar, o item guarda o
+    resultado previsto (primeiro id + carimbo created_at): se o processo cair entre a gravação e o
+    item_done, a retomada encontra as linhas e só conclui o item, sem regravar o lote.
+    """
+    params = job.get("params") or {}
+    path, fmt, unit_id = params["path"], params["format"], str(params["unit_id"])
+    username, filename = params.get("username") or "", params.get("filename") or ""
+    pending = {it["seq"]: it.get("result") for it in items}
+    units, seen = _unit_ids(), set()
+    for seq, batch in enumerate(_batches(path, fmt)):
+        if seq not in pending:
+            continue
+        if ctx.is_cancelled():
+            return
+        lines = f"linhas {batch[0][0]}-{batch[-1][0]}"
+        planned = pending[seq]
+        if planned and planned.get("stamp") and _batch_written(planned, username):
+            result = {k: v for k, v in planned.items() if k != "stamp"}
+            append_log(username, "asset:import", unit_id, None,
+                       f"Importação {filename}: {result['inserted']} ativos ({lines}), {result['rejected']} rejeitadas")
+            ctx.item_done(seq, result)
+            continue
+        valid, errors = _validate_batch(batch, unit_id, units, seen)
+        now = datetime.utcnow().isoformat()
+        result = {"inserted": len(valid), "first_id": None, "last_id": None,
+                  "rejected": len(errors), "errors": errors[:_MAX_ERRORS_PER_BATCH]}
+        if valid:
+            with _assets.transaction():
+                first_id = _assets.next_id()
+                result.update(first_id=first_id, last_id=first_id + len(valid) - 1)
+                for i, row in enumerate(valid):
+                    row.update({"id": str(first_id + i), "created_at": now, "updated_at": now, "created_by": username})
+                ctx.item_checkpoint(seq, {**result, "stamp": now})
+                _assets.insert_many(valid)
+        append_log(username, "asset:import", unit_id, None,
+                   f"Importação {filename}: {len(valid)} ativos ({lines}), {len(errors)} rejeitadas")
+        ctx.item_done(seq, result)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _batch_written(planned: Dict[str, Any], username: str) -> bool:
+    """O lote do checkpoint já está na tabela? (primeiro id previsto com o mesmo carimbo e autor)"""
+    row = _assets.get(int(planned.get("first_id") or 0))
+    return bool(row) and row.get("created_at") == planned["stamp"] and (row.get("created_by") or "") == username
+
+register_handler("import_assets", _import_assets_job)
+
+def start_asset_import_job(staged: StagedUpload, fmt: str, unit_id: str, filename: str, username: str) -> Dict[str, Any]:
+    """Guarda o arquivo, conta as linhas (valida o cabeçalho) e dispara o job. Retorna o job + nº de linhas."""
+    os.makedirs(IMPORTS_DIR, exist_ok=True)
+    path = os.path.join(IMPORTS_DIR, f"{uuid.uuid4().hex}.{fmt}")
+    commit_upload(staged, path)
+    try:
+        rows = sum(1 for _ in _read_import_rows(path, fmt))
+    except Exception:
+        os.remove(path)
+        raise
+    batches = (rows + ASSET_IMPORT_BATCH - 1) // ASSET_IMPORT_BATCH
+    params = {"path": path, "format": fmt, "unit_id": str(unit_id), "filename": filename, "username": username}
+    job = create_job("import_assets", params, [f"{i * ASSET_IMPORT_BATCH + 1}-{min(rows, (i + 1) * ASSET_IMPORT_BATCH)}" for i in range(batches)], owner=username)
+    if batches:
+        submit_job(job["id"])
+    else:
+        os.remove(path)
+    return {**job, "rows": rows}
+
+def _export_rows(unit_id: str, include_sub_units: bool = False) -> Iterator[Dict[str, str]]:
+    if unit_id == "all":
+        return _assets.iter_rows()
+    if include_sub_units:
+        return (row for uid in (subtree_ids(unit_id) or []) for row in _assets.iter_rows("unit_id", uid))
+    return _assets.iter_rows("unit_id", str(unit_id))
+
+def iter_assets_csv(unit_id: str, chunk_rows: int = 500, include_sub_units: bool = False) -> Iterator[str]:
+    """CSV dos ativos da unidade ('all' = todos; include_sub_units = subárvore) em pedaços, sem montar a lista inteira."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=ASSET_FIELDS, extrasaction="ignore")
+    buf.write("\ufeff")  # BOM: acentos corretos ao abrir no Excel
+    writer.writeheader()
+    n = 0
+    for row in _export_rows(unit_id, include_sub_units):
+        writer.writerow(row)
+        n += 1
+        if n % chunk_rows == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def export_assets_xlsx(unit_id: str, include_sub_units: bool = False) -> str:
+    """Planilha .xlsx (modo write_only, linha a linha) num arquivo temporário; quem chama remove."""
+    if openpyxl is None:
+        raise ValueError("Exportação .xlsx requer o pacote openpyxl.")
+    os.makedirs(IMPORTS_DIR, exist_ok=True)
+    path = os.path.join(IMPORTS_DIR, f"export_{uuid.uuid4().hex}.xlsx")
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("ativos")
+    ws.append(ASSET_FIELDS)
+    for row in _export_rows(unit_id, include_sub_units):
+        ws.append([row.get(f, "") for f in ASSET_FIELDS])
+    wb.save(path)
+    return path
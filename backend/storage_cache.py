@@ -0,0 +1,232 @@
+import csv
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+# Cache em memória das tabelas CSV (usuários, eventos, clientes, ...).
+# Cada tabela fica parseada por processo, indexada pela chave primária e por chaves
+# secundárias declaradas. A validade é conferida por (mtime_ns, tamanho) do arquivo a cada
+# acesso — edições externas são vistas — e as gravações (insert/put/delete) invalidam.
+# As linhas devolvidas são cópias: quem chama pode alterá-las livremente.
+# A mesma interface é implementada em SQLite por storage_db.SqliteTable (STORAGE_BACKEND).
+
+_registry: Dict[str, "CsvTable"] = {}
+_registry_lock = threading.Lock()
+
+class CsvTable:
+    def __init__(self, name: str, path: Union[str, Callable[[], str]], fields: List[str], key: Optional[str] = None,
+                 indexes: Tuple[str, ...] = (), ensure: Optional[Callable[[], None]] = None, nocase: Tuple[str, ...] = ()):
+        """
+        name: nome nas métricas; path: caminho do CSV (ou função, para caminhos configuráveis);
+        fields: colunas gravadas; key: coluna da chave primária; indexes: colunas com busca
+        por valor (find); ensure: cria/migra o arquivo antes de recarregar/gravar (ex.: _ensure_csv);
+        nocase: colunas de indexes comparadas sem diferenciar maiúsculas/minúsculas.
+        """
+        self.name = name
+        self._path = path
+        self.fields = list(fields)
+        self.key = key
+        self.indexes = tuple(indexes)
+        self.nocase = frozenset(nocase)
+        self._ensure = ensure
+        self._lock = threading.Lock()
+        # gravações: ler-modificar-regravar sob um lock reentrante (só dentro deste processo)
+        self._write_lock = threading.RLock()
+        self._sig: Optional[Tuple[str, int, int]] = None
+        self._rows: List[Dict[str, str]] = []
+        self._by_key: Dict[str, Dict[str, str]] = {}
+        self._by_index: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "load_seconds": 0.0}
+        register(self)
+
+    @property
+    def path(self) -> str:
+        return self._path() if callable(self._path) else self._path
+
+    def _signature(self, path: str) -> Optional[Tuple[str, int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (path, st.st_mtime_ns, st.st_size)
+
+    def _current(self) -> Tuple[List[Dict[str, str]], Dict[str, Dict[str, str]], Dict[str, Dict[str, List[Dict[str, str]]]]]:
+        path = self.path
+        sig = self._signature(path)
+        with self._lock:
+            if sig is not None and sig == self._sig:
+                self.stats["hits"] += 1
+                return self._rows, self._by_key, self._by_index
+            t0 = time.perf_counter()
+            if self._ensure is not None:
+                self._ensure()
+                sig = self._signature(path)
+            rows: List[Dict[str, str]] = []
+            if sig is not None:
+                with open(path, "r", newline="", encoding="utf-8") as f:
+                    rows = list(csv.DictReader(f))
+            by_key: Dict[str, Dict[str, str]] = {}
+            if self.key:
+                for r in rows:
+                    # primeira ocorrência vence (mesma semântica da varredura linear)
+                    by_key.setdefault(r.get(self.key) or "", r)
+            by_index: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+            for field in self.indexes:
+                idx: Dict[str, List[Dict[str, str]]] = {}
+                fold = field in self.nocase
+                for r in rows:
+                    value = r.get(field) or ""
+                    idx.setdefault(value.lower() if fold else value, []).append(r)
+                by_index[field] = idx
+            self._rows, self._by_key, self._by_index, self._sig = rows, by_key, by_index, sig
+            self.stats["misses"] += 1
+            self.stats["load_seconds"] += time.perf_counter() - t0
+            return rows, by_key, by_index
+
+    def rows(self) -> List[Dict[str, str]]:
+        """Todas as linhas (cópias), na ordem do arquivo."""
+        rows, _, _ = self._current()
+        return [dict(r) for r in rows]
+
+    def get(self, key: Any) -> Optional[Dict[str, str]]:
+        """Linha pela chave primária (comparada como texto) ou None."""
+        _, by_key, _ = self._current()
+        row = by_key.get(str(key))
+        return dict(row) if row is not None else None
+
+    def _index_value(self, field: str, value: Any) -> str:
+        return str(value).lower() if field in self.nocase else str(value)
+
+    def find(self, field: str, value: Any) -> List[Dict[str, str]]:
+        """Linhas com field == value (coluna declarada em indexes)."""
+        _, _, by_index = self._current()
+        return [dict(r) for r in by_index[field].get(self._index_value(field, value), [])]
+
+    def find_many(self, field: str, values: List[Any]) -> Dict[str, List[Dict[str, str]]]:
+        """find para vários valores de uma vez: {valor (minúsculo se nocase): linhas}; sem entrada se não houver."""
+        _, _, by_index = self._current()
+        idx = by_index[field]
+        out: Dict[str, List[Dict[str, str]]] = {}
+        for value in values:
+            v = self._index_value(field, value)
+            if v in idx and v not in out:
+                out[v] = [dict(r) for r in idx[v]]
+        return out
+
+    def count_many(self, field: str, values: List[Any]) -> Dict[str, int]:
+        """Quantas linhas para cada valor (só pelo índice, sem copiar linhas); sem entrada se zero."""
+        _, _, by_index = self._current()
+        idx = by_index[field]
+        out: Dict[str, int] = {}
+        for value in values:
+            v = self._index_value(field, value)
+            if v in idx:
+                out[v] = len(idx[v])
+        return out
+
+    def iter_rows(self, field: Optional[str] = None, value: Any = None) -> Iterator[Dict[str, str]]:
+        """Linhas (cópias, uma a uma) de todo o arquivo ou só as com field == value (coluna de indexes)."""
+        rows, _, by_index = self._current()
+        if field is not None:
+            rows = by_index[field].get(self._index_value(field, value), [])
+        # a lista é substituída (não alterada) numa recarga: iterar é seguro
+        for r in rows:
+            yield dict(r)
+
+    def invalidate(self):
+        """Descarta o cache (chamar depois de gravar o arquivo)."""
+        with self._lock:
+            self._sig = None
+            self.stats["invalidations"] += 1
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self.stats)
+            st["rows"] = len(self._rows)
+        total = st["hits"] + st["misses"]
+        st["hit_ratio"] = round(st["hits"] / total, 4) if total else None
+        st["load_seconds"] = round(st["load_seconds"], 4)
+        st["backend"] = "csv"
+        return st
+
+    # ---------- gravação ----------
+
+    @contextmanager
+    def transaction(self):
+        """Agrupa leituras e gravações (ex.: next_id + insert) sem intercalar outras gravações."""
+        with self._write_lock:
+            yield self
+
+    def next_id(self) -> int:
+        max_id = 0
+        for row in self.rows():
+            try:
+                max_id = max(max_id, int(row.get("id", "0") or 0))
+            except Exception:
+                continue
+        return max_id + 1
+
+    def insert(self, row: Dict[str, Any]):
+        with self._write_lock:
+            if self._ensure is not None:
+                self._ensure()
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=self.fields, extrasaction="ignore").writerow(row)
+            self.invalidate()
+
+    def insert_many(self, rows: List[Dict[str, Any]]):
+        """Acrescenta várias linhas numa única abertura do arquivo."""
+        with self._write_lock:
+            if self._ensure is not None:
+                self._ensure()
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=self.fields, extrasaction="ignore").writerows(rows)
+            self.invalidate()
+
+    def put(self, row: Dict[str, Any]) -> bool:
+        """Substitui a linha com a mesma chave. False se não existir."""
+        with self._write_lock:
+            key = str(row[self.key])
+            rows = self.rows()
+            found = False
+            for i, r in enumerate(rows):
+                if r.get(self.key) == key:
+                    rows[i] = row
+                    found = True
+            if found:
+                self._rewrite(rows)
+            return found
+
+    def delete(self, key: Any) -> bool:
+        with self._write_lock:
+            rows = self.rows()
+            kept = [r for r in rows if r.get(self.key) != str(key)]
+            if len(kept) == len(rows):
+                return False
+            self._rewrite(kept)
+            return True
+
+    def _rewrite(self, rows: List[Dict[str, Any]]):
+        # arquivo completo num temporário + os.replace (leitores nunca veem meia gravação)
+        path = self.path
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as fw:
+            writer = csv.DictWriter(fw, fieldnames=self.fields, extrasaction="ignore")
+            writer.writeheader()
+            for r in rows:
+                writer.writerow(r)
+        os.replace(tmp, path)
+        self.invalidate()
+
+def register(table: Any):
+    """Registra uma tabela (CsvTable ou storage_db.SqliteTable) em cache_stats()."""
+    with _registry_lock:
+        _registry[table.name] = table
+
+def cache_stats() -> Dict[str, Any]:
+    """Acertos/recargas (CSV) ou consultas (SQLite) por tabela neste processo."""
+    with _registry_lock:
+        tables = list(_registry.values())
+    return {"pid": os.getpid(), "tables": {t.name: t.stats_snapshot() for t in tables}}
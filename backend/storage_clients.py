@@ -2,7 +2,10 @@ import csv
 import os
 import base64
 import time
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, List, Tuple, Union
+
+from storage_db import open_table
+from storage_uploads import StagedUpload, commit_upload
 
 CLIENTS_CSV_PATH = os.environ.get(
     "CLIENTS_CSV_PATH",
@@ -78,19 +81,8 @@ def _safe_filename(name: str) -> str:
     return "".join(ch if ch.isalnum() or ch in ("-", "_", ".", " ") else "_" for ch in name).strip().replace(" ", "_")
 
 
-def _next_id() -> int:
-    _ensure_csv()
-    max_id = 0
-    with open(CLIENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                rid = int(row.get("id", "0") or "0")
-                if rid > max_id:
-                    max_id = rid
-            except Exception:
-                continue
-    return max_id + 1
+# NOVO: tabela do backend configurado (CSV com cache ou SQLite, ver storage_db)
+_clients = open_table("clients", lambda: CLIENTS_CSV_PATH, CSV_FIELDS, key="id", ensure=_ensure_csv)
 
 
 def _save_profile_photo(basename_hint: str, photo_base64: Optional[str]) -> Optional[str]:
@@ -122,28 +114,7 @@ def _save_profile_photo(basename_hint: str, photo_base64: Optional[str]) -> Opti
 
 
 def get_all_clients() -> List[Dict[str, str]]:
-    _ensure_csv()
-    result: List[Dict[str, str]] = []
-    with open(CLIENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            result.append({
-                "id": row.get("id", ""),
-                "full_name": row.get("full_name", ""),
-                "doc": row.get("doc", ""),
-                "address": row.get("address", ""),
-                "phone": row.get("phone", ""),
-                "profile_photo_path": row.get("profile_photo_path", ""),
-                "pix_key": row.get("pix_key", ""),
-                "bank_data": row.get("bank_data", ""),
-                "municipal_registration": row.get("municipal_registration", ""),
-                "state_registration": row.get("state_registration", ""),
-                "corporate_name": row.get("corporate_name", ""),
-                "trade_name": row.get("trade_name", ""),
-                "notes": row.get("notes", ""),
-                "email": row.get("email", ""),
-            })
-    return result
+    return [{f: row.get(f, "") for f in CSV_FIELDS} for row in _clients.rows()]
 
 
 def add_client(
@@ -161,12 +132,10 @@ def add_client(
     notes: Optional[str] = None,
     email: Optional[str] = None,
 ) -> Dict[str, str]:
-    _ensure_csv()
-    client_id = _next_id()
-    photo_path = _save_profile_photo(f"client_{client_id}", profile_photo_base64)
-    with open(CLIENTS_CSV_PATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writerow({
+    with _clients.transaction():
+        client_id = _clients.next_id()
+        photo_path = _save_profile_photo(f"client_{client_id}", profile_photo_base64)
+        _clients.insert({
             "id": str(client_id),
             "full_name": full_name,
             "doc": doc,
@@ -216,55 +185,42 @@ def update_client(
     notes: Optional[str] = None,
     email: Optional[str] = None,
 ) -> Optional[Dict[str, str]]:
-    _ensure_csv()
-    updated = None
-    rows = []
-    with open(CLIENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("id") == str(client_id):
-                old_photo_rel = row.get("profile_photo_path", "")
-                new_photo_path = old_photo_rel
-                if profile_photo_base64:
-                    new_photo_path = _save_profile_photo(f"client_{client_id}", profile_photo_base64) or old_photo_rel
-                    # remove foto antiga se diferente
-                    if old_photo_rel and new_photo_path and old_photo_rel != new_photo_path:
-                        try:
-                            if old_photo_rel.startswith("static/"):
-                                rel = old_photo_rel[len("static/"):]
-                                old_abs = os.path.join(MEDIA_ROOT, rel.replace("/", os.sep))
-                                if os.path.isfile(old_abs):
-                                    os.remove(old_abs)
-                        except Exception:
-                            pass
-                new_row = {
-                    "id": str(client_id),
-                    "full_name": full_name if full_name is not None else row.get("full_name", ""),
-                    "doc": doc if doc is not None else row.get("doc", ""),
-                    "address": address if address is not None else row.get("address", ""),
-                    "phone": phone if phone is not None else row.get("phone", ""),
-                    "profile_photo_path": new_photo_path or "",
-                    "pix_key": pix_key if pix_key is not None else row.get("pix_key", ""),
-                    "bank_data": bank_data if bank_data is not None else row.get("bank_data", ""),
-                    "municipal_registration": municipal_registration if municipal_registration is not None else row.get("municipal_registration", ""),
-                    "state_registration": state_registration if state_registration is not None else row.get("state_registration", ""),
-                    "corporate_name": corporate_name if corporate_name is not None else row.get("corporate_name", ""),
-                    "trade_name": trade_name if trade_name is not None else row.get("trade_name", ""),
-                    "notes": notes if notes is not None else row.get("notes", ""),
-                    "email": email if email is not None else row.get("email", ""),
-                }
-                rows.append(new_row)
-                updated = new_row
-            else:
-                rows.append(row)
-    if updated is None:
-        return None
-    with open(CLIENTS_CSV_PATH, "w", newline="", encoding="utf-8") as fw:
-        writer = csv.DictWriter(fw, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
-    return updated
+    with _clients.transaction():
+        row = _clients.get(client_id)
+        if row is None:
+            return None
+        old_photo_rel = row.get("profile_photo_path", "")
+        new_photo_path = old_photo_rel
+        if profile_photo_base64:
+            new_photo_path = _save_profile_photo(f"client_{client_id}", profile_photo_base64) or old_photo_rel
+            # remove foto antiga se diferente
+            if old_photo_rel and new_photo_path and old_photo_rel != new_photo_path:
+                try:
+                    if old_photo_rel.startswith("static/"):
+                        rel = old_photo_rel[len("static/"):]
+                        old_abs = os.path.join(MEDIA_ROOT, rel.replace("/", os.sep))
+                        if os.path.isfile(old_abs):
+                            os.remove(old_abs)
+                except Exception:
+                    pass
+        new_row = {
+            "id": str(client_id),
+            "full_name": full_name if full_name is not None else row.get("full_name", ""),
+            "doc": doc if doc is not None else row.get("doc", ""),
+            "address": address if address is not None else row.get("address", ""),
+            "phone": phone if phone is not None else row.get("phone", ""),
+            "profile_photo_path": new_photo_path or "",
+            "pix_key": pix_key if pix_key is not None else row.get("pix_key", ""),
+            "bank_data": bank_data if bank_data is not None else row.get("bank_data", ""),
+            "municipal_registration": municipal_registration if municipal_registration is not None else row.get("municipal_registration", ""),
+            "state_registration": state_registration if state_registration is not None else row.get("state_registration", ""),
+            "corporate_name": corporate_name if corporate_name is not None else row.get("corporate_name", ""),
+            "trade_name": trade_name if trade_name is not None else row.get("trade_name", ""),
+            "notes": notes if notes is not None else row.get("notes", ""),
+            "email": email if email is not None else row.get("email", ""),
+        }
+        _clients.put(new_row)
+    return new_row
 
 
 # ---------- Anexos por cliente (limite 50 MB por cliente) ----------
@@ -303,15 +259,19 @@ def total_client_files_size_bytes(client_id: int) -> int:
     return total
 
 
-def save_client_file(client_id: int, filename: str, content: bytes) -> Tuple[str, int, str]:
+def save_client_file(client_id: int, filename: str, content: Union[bytes, StagedUpload]) -> Tuple[str, int, str]:
     """
     Salva um arquivo para o cliente e retorna (name, size_bytes, static_url).
+    content pode ser os bytes ou um upload já gravado em disco (movido sem cópia).
     """
     base_dir = _client_files_dir(client_id)
     safe_name = _safe_filename(filename)
     full_path = os.path.join(base_dir, safe_name)
-    with open(full_path, "wb") as f:
-        f.write(content)
+    if isinstance(content, StagedUpload):
+        commit_upload(content, full_path)
+    else:
+        with open(full_path, "wb") as f:
+            f.write(content)
     rel_path_from_media = os.path.relpath(full_path, MEDIA_ROOT)
     return safe_name, os.path.getsize(full_path), f"static/{rel_path_from_media.replace(os.sep, '/')}"
 
@@ -328,23 +288,8 @@ def delete_client_file(client_id: int, filename: str) -> bool:
 
 def delete_client(client_id: int) -> bool:
     """Remove cliente do CSV e apaga diretórios de mídia relacionados."""
-    _ensure_csv()
-    rows = []
-    removed = False
-    with open(CLIENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("id") == str(client_id):
-                removed = True
-                continue
-            rows.append(row)
-    if not removed:
+    if not _clients.delete(client_id):
         return False
-    with open(CLIENTS_CSV_PATH, "w", newline="", encoding="utf-8") as fw:
-        writer = csv.DictWriter(fw, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
     try:
         # Apagar pasta de anexos e foto se existirem
         files_dir = os.path.join(MEDIA_CLIENTS_FILES_DIR, str(client_id))
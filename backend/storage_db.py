@@ -0,0 +1,339 @@
+import os
+import csv
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from storage_cache import CsvTable, register
+
+# Backend das tabelas cadastrais (usuários, eventos, clientes, serviços, gastos, ativos, ...):
+# - csv (padrão): arquivos CSV com cache em memória (storage_cache.CsvTable)
+# - sqlite: um banco SQLite em WAL (STORAGE_DB_PATH), mesma interface, gravações atômicas
+#   e seguras entre processos. Na primeira abertura cada tabela é importada do CSV existente.
+# Ferramentas: python storage_db.py import|export [tabelas...] (ver main()).
+
+STORAGE_BACKEND = (os.environ.get("STORAGE_BACKEND", "csv") or "csv").strip().lower()
+STORAGE_DB_PATH = os.environ.get(
+    "STORAGE_DB_PATH",
+    os.path.join(os.path.dirname(__file__), "storage.db"),
+)
+
+# especificação de cada tabela aberta (para as ferramentas de importação/exportação)
+_specs: Dict[str, Dict[str, Any]] = {}
+
+_local = threading.local()
+_init_lock = threading.Lock()
+
+def _connection() -> sqlite3.Connection:
+    """Conexão da thread atual (uma por thread de cada worker; refeita após fork)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "pid", None) == os.getpid() and getattr(_local, "path", None) == STORAGE_DB_PATH:
+        return conn
+    os.makedirs(os.path.dirname(os.path.abspath(STORAGE_DB_PATH)), exist_ok=True)
+    conn = sqlite3.connect(STORAGE_DB_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn, _local.pid, _local.path, _local.depth = conn, os.getpid(), STORAGE_DB_PATH, 0
+    return conn
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """BEGIN IMMEDIATE na conexão da thread; reentrante (só o nível externo faz COMMIT)."""
+    conn = _connection()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        _local.depth = 0
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+class SqliteTable:
+    """Mesma interface de storage_cache.CsvTable, sobre uma tabela SQLite (valores TEXT, como no CSV)."""
+
+    def __init__(self, name: str, path: Union[str, Callable[[], str]], fields: List[str], key: Optional[str] = None,
+                 indexes: Tuple[str, ...] = (), ensure: Optional[Callable[[], None]] = None, nocase: Tuple[str, ...] = ()):
+        self.name = name
+        self._path = path
+        self.fields = list(fields)
+        self.key = key
+        self.indexes = tuple(indexes)
+        self.nocase = frozenset(nocase)
+        self._ensure = ensure
+        self._ready_for: Optional[str] = None
+        self._stats_lock = threading.Lock()
+        self.stats = {"queries": 0, "writes": 0, "query_seconds": 0.0, "imported_rows": 0}
+        register(self)
+
+    @property
+    def path(self) -> str:
+        return self._path() if callable(self._path) else self._path
+
+    def _ready(self) -> sqlite3.Connection:
+        conn = _connection()
+        if self._ready_for == STORAGE_DB_PATH:
+            return conn
+        with _init_lock:
+            if self._ready_for != STORAGE_DB_PATH:
+                self._create(conn)
+                self._ready_for = STORAGE_DB_PATH
+        return conn
+
+    def _create(self, conn: sqlite3.Connection):
+        t = _q(self.name)
+        with transaction():
+            conn.execute("CREATE TABLE IF NOT EXISTS _storage_meta (name TEXT PRIMARY KEY, source TEXT, imported_at TEXT, rows INTEGER)")
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (self.name,)).fetchone()
+            if not exists:
+                cols = ", ".join(f"{_q(f)} TEXT NOT NULL DEFAULT ''" for f in self.fields)
+                conn.execute(f"CREATE TABLE {t} (_seq INTEGER PRIMARY KEY AUTOINCREMENT, {cols})")
+            else:
+                # campos novos (mesma migração suave que os _ensure_csv fazem no CSV)
+                have = {r["name"] for r in conn.execute(f"PRAGMA table_info({t})")}
+                for f in self.fields:
+                    if f not in have:
+                        conn.execute(f"ALTER TABLE {t} ADD COLUMN {_q(f)} TEXT NOT NULL DEFAULT ''")
+            if self.key:
+                conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {_q('ux_' + self.name + '_' + self.key)} ON {t}({_q(self.key)})")
+            for f in self.indexes:
+                if f in self.nocase:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {_q('ixn_' + self.name + '_' + f)} ON {t}({_q(f)} COLLATE NOCASE)")
+                else:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {_q('ix_' + self.name + '_' + f)} ON {t}({_q(f)})")
+            if not conn.execute("SELECT 1 FROM _storage_meta WHERE name=?", (self.name,)).fetchone():
+                # importação única a partir do CSV atual (o arquivo é mantido, para comparar/voltar)
+                self.import_csv(conn)
+
+    def import_csv(self, conn: Optional[sqlite3.Connection] = None, replace: bool = False) -> int:
+        """Copia as linhas do CSV para a tabela. replace: apaga o conteúdo atual antes."""
+        conn = conn or self._ready()
+        path = self.path
+        rows: List[Dict[str, str]] = []
+        if os.path.isfile(path):
+            if self._ensure is not None:
+                self._ensure()
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+        cols = ", ".join(_q(f) for f in self.fields)
+        marks = ", ".join("?" for _ in self.fields)
+        with transaction():
+            if replace:
+                conn.execute(f"DELETE FROM {_q(self.name)}")
+            # chave repetida no CSV: a primeira ocorrência vence (como na leitura do CSV)
+            cur = conn.executemany(
+                f"INSERT OR IGNORE INTO {_q(self.name)} ({cols}) VALUES ({marks})",
+                [tuple((r.get(f) or "") for f in self.fields) for r in rows],
+            )
+            count = cur.rowcount if cur.rowcount >= 0 else len(rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO _storage_meta (name, source, imported_at, rows) VALUES (?, ?, ?, ?)",
+                (self.name, path, datetime.utcnow().isoformat(), count),
+            )
+        with self._stats_lock:
+            self.stats["imported_rows"] += count
+        return count
+
+    def export_csv(self, path: Optional[str] = None) -> int:
+        """Grava a tabela como CSV (cabeçalho = fields). Retorna o número de linhas."""
+        path = path or self.path
+        rows = self.rows()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as fw:
+            writer = csv.DictWriter(fw, fieldnames=self.fields, extrasaction="ignore")
+            writer.writeheader()
+            for r in rows:
+                writer.writerow(r)
+        os.replace(tmp, path)
+        return len(rows)
+
+    def _select(self, where: str = "", params: Tuple[Any, ...] = (), limit: Optional[int] = None) -> List[Dict[str, str]]:
+        conn = self._ready()
+        cols = ", ".join(_q(f) for f in self.fields)
+        sql = f"SELECT {cols} FROM {_q(self.name)}{where} ORDER BY _seq"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        t0 = time.perf_counter()
+        out = [dict(r) for r in conn.execute(sql, params)]
+        with self._stats_lock:
+            self.stats["queries"] += 1
+            self.stats["query_seconds"] += time.perf_counter() - t0
+        return out
+
+    def rows(self) -> List[Dict[str, str]]:
+        return self._select()
+
+    def get(self, key: Any) -> Optional[Dict[str, str]]:
+        found = self._select(f" WHERE {_q(self.key)} = ?", (str(key),), limit=1)
+        return found[0] if found else None
+
+    def _col(self, field: str) -> str:
+        # mesma collation do índice, para o SQLite usá-lo
+        return f"{_q(field)} COLLATE NOCASE" if field in self.nocase else _q(field)
+
+    def find(self, field: str, value: Any) -> List[Dict[str, str]]:
+        return self._select(f" WHERE {self._col(field)} = ?", (str(value),))
+
+    def find_many(self, field: str, values: List[Any]) -> Dict[str, List[Dict[str, str]]]:
+        fold = field in self.nocase
+        wanted = list(dict.fromkeys(str(v).lower() if fold else str(v) for v in values))
+        out: Dict[str, List[Dict[str, str]]] = {}
+        # em blocos, abaixo do limite de parâmetros do SQLite
+        for i in range(0, len(wanted), 500):
+            chunk = wanted[i:i + 500]
+            marks = ", ".join("?" for _ in chunk)
+            for r in self._select(f" WHERE {self._col(field)} IN ({marks})", tuple(chunk)):
+                v = r.get(field) or ""
+                out.setdefault(v.lower() if fold else v, []).append(r)
+        return out
+
+    def count_many(self, field: str, values: List[Any]) -> Dict[str, int]:
+        fold = field in self.nocase
+        wanted = list(dict.fromkeys(str(v).lower() if fold else str(v) for v in values))
+        out: Dict[str, int] = {}
+        for i in range(0, len(wanted), 500):
+            chunk = wanted[i:i + 500]
+            marks = ", ".join("?" for _ in chunk)
+            col = self._col(field)
+            sql = f"SELECT {_q(field)}, COUNT(*) FROM {_q(self.name)} WHERE {col} IN ({marks}) GROUP BY {col}"
+            for v, n in self._ready().execute(sql, tuple(chunk)).fetchall():
+                key = (v or "").lower() if fold else (v or "")
+                out[key] = out.get(key, 0) + n
+            with self._stats_lock:
+                self.stats["queries"] += 1
+        return out
+
+    def iter_rows(self, field: Optional[str] = None, value: Any = None, page: int = 1000) -> Iterator[Dict[str, str]]:
+        # páginas por _seq: cada página é uma consulta curta (sem cursor aberto entre threads)
+        last = 0
+        cond = f" AND {self._col(field)} = ?" if field is not None else ""
+        extra = (str(value),) if field is not None else ()
+        while True:
+            conn = self._ready()
+            cols = ", ".join(_q(f) for f in self.fields)
+            sql = f"SELECT _seq, {cols} FROM {_q(self.name)} WHERE _seq > ?{cond} ORDER BY _seq LIMIT {int(page)}"
+            batch = conn.execute(sql, (last,) + extra).fetchall()
+            with self._stats_lock:
+                self.stats["queries"] += 1
+            for r in batch:
+                row = dict(r)
+                last = row.pop("_seq")
+                yield row
+            if len(batch) < page:
+                return
+
+    def invalidate(self):
+        # sem cache próprio: cada leitura consulta o banco
+        pass
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            st = dict(self.stats)
+        st["query_seconds"] = round(st["query_seconds"], 4)
+        st["backend"] = "sqlite"
+        return st
+
+    @contextmanager
+    def transaction(self):
+        self._ready()
+        with transaction():
+            yield self
+
+    def next_id(self) -> int:
+        conn = self._ready()
+        row = conn.execute(f"SELECT COALESCE(MAX(CAST(id AS INTEGER)), 0) + 1 FROM {_q(self.name)}").fetchone()
+        return int(row[0])
+
+    def _write(self, sql: str, params: Tuple[Any, ...]) -> int:
+        conn = self._ready()
+        with transaction():
+            cur = conn.execute(sql, params)
+        with self._stats_lock:
+            self.stats["writes"] += 1
+        return cur.rowcount
+
+    def insert(self, row: Dict[str, Any]):
+        cols = ", ".join(_q(f) for f in self.fields)
+        marks = ", ".join("?" for _ in self.fields)
+        self._write(f"INSERT INTO {_q(self.name)} ({cols}) VALUES ({marks})", tuple(_text(row.get(f)) for f in self.fields))
+
+    def insert_many(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        conn = self._ready()
+        cols = ", ".join(_q(f) for f in self.fields)
+        marks = ", ".join("?" for _ in self.fields)
+        with transaction():
+            conn.executemany(f"INSERT INTO {_q(self.name)} ({cols}) VALUES ({marks})",
+                             [tuple(_text(r.get(f)) for f in self.fields) for r in rows])
+        with self._stats_lock:
+            self.stats["writes"] += 1
+
+    def put(self, row: Dict[str, Any]) -> bool:
+        sets = ", ".join(f"{_q(f)} = ?" for f in self.fields)
+        params = tuple(_text(row.get(f)) for f in self.fields) + (str(row[self.key]),)
+        return self._write(f"UPDATE {_q(self.name)} SET {sets} WHERE {_q(self.key)} = ?", params) > 0
+
+    def delete(self, key: Any) -> bool:
+        return self._write(f"DELETE FROM {_q(self.name)} WHERE {_q(self.key)} = ?", (str(key),)) > 0
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+def open_table(name: str, path: Union[str, Callable[[], str]], fields: List[str], key: Optional[str] = None,
+               indexes: Tuple[str, ...] = (), ensure: Optional[Callable[[], None]] = None, nocase: Tuple[str, ...] = ()):
+    """Tabela do backend configurado (STORAGE_BACKEND=csv|sqlite), com a interface de CsvTable."""
+    _specs[name] = {"path": path, "fields": list(fields), "key": key, "indexes": tuple(indexes), "ensure": ensure, "nocase": tuple(nocase)}
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteTable(name, path, fields, key=key, indexes=indexes, ensure=ensure, nocase=nocase)
+    return CsvTable(name, path, fields, key=key, indexes=indexes, ensure=ensure, nocase=nocase)
+
+def _load_specs() -> Dict[str, Dict[str, Any]]:
+    # importar os módulos registra as tabelas (em storage_db._specs, não no __main__ do script)
+    import storage, storage_events, storage_clients, storage_services  # noqa: F401
+    import storage_expenses, storage_assets, storage_client_services, storage_projects  # noqa: F401
+    import storage_db
+    return storage_db._specs
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Importa os CSVs para o SQLite (STORAGE_DB_PATH) ou exporta de volta.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("tables", nargs="*", help="padrão: todas")
+    parser.add_argument("--out", default="", help="export: pasta de destino (padrão: sobrescreve os CSVs de origem)")
+    args = parser.parse_args(argv)
+    specs = _load_specs()
+    names = args.tables or sorted(specs)
+    for name in names:
+        if name not in specs:
+            parser.error(f"tabela desconhecida: {name}")
+        spec = specs[name]
+        table = SqliteTable(name, spec["path"], spec["fields"], key=spec["key"], indexes=spec["indexes"], ensure=spec["ensure"], nocase=spec["nocase"])
+        if args.command == "import":
+            # a criação já importa se a tabela for nova; aqui sempre substitui pelo CSV atual
+            n = table.import_csv(replace=True)
+            print(f"{name}: {n} linhas importadas de {table.path}")
+        else:
+            dest = os.path.join(args.out, os.path.basename(table.path)) if args.out else table.path
+            n = table.export_csv(dest)
+            print(f"{name}: {n} linhas exportadas para {dest}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import hashlib
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+# Derivados (miniatura / prévia) das fotos da galeria.
+# Endereçados pelo conteúdo: media/derivatives/<hh>/<sha256>_<lado>.<ext>, onde sha256 é o hash
+# do arquivo de origem e <lado> o tamanho máximo do maior lado. Mesmo conteúdo -> mesmo arquivo;
+# uma nova versão (ex.: reedição com outro LUT) tem outro hash e nunca reaproveita o derivado antigo.
+
+MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
+DERIVATIVES_DIR = os.path.join(MEDIA_DIR, "derivatives")
+
+# lado máximo (px) de cada tipo de derivado
+DERIVATIVE_SIZES: Dict[str, int] = {
+    "thumb": int(os.environ.get("DERIVATIVE_THUMB_SIZE", "256")),
+    "preview": int(os.environ.get("DERIVATIVE_PREVIEW_SIZE", "1024")),
+}
+# "webp" ou "jpeg"
+DERIVATIVE_FORMAT = (os.environ.get("DERIVATIVE_FORMAT", "webp") or "webp").strip().lower()
+DERIVATIVE_QUALITY = int(os.environ.get("DERIVATIVE_QUALITY", "80"))
+
+_EXT = {"webp": "webp", "jpeg": "jpg"}
+_ORIENTATION_TAG = 0x0112
+# orientação EXIF -> transposição para a orientação de exibição
+_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+def content_key(data: Optional[bytes] = None, path: Optional[str] = None) -> str:
+    """sha256 (hex) dos bytes informados ou do arquivo (lido em blocos)."""
+    h = hashlib.sha256()
+    if data is not None:
+        h.update(data)
+    else:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def _fmt() -> str:
+    return DERIVATIVE_FORMAT if DERIVATIVE_FORMAT in _EXT else "jpeg"
+
+def derivative_rel(key: str, kind: str) -> str:
+    """Caminho relativo (a partir de backend/) do derivado 'kind' para o conteúdo 'key'."""
+    side = DERIVATIVE_SIZES[kind]
+    return f"media/derivatives/{key[:2]}/{key}_{side}.{_EXT[_fmt()]}"
+
+def _abs(rel: str) -> str:
+    return os.path.join(os.path.dirname(__file__), rel)
+
+def _save(img: Image.Image, abs_out: str):
+    os.makedirs(os.path.dirname(abs_out), exist_ok=True)
+    # grava em arquivo temporário e renomeia: workers gerando o mesmo conteúdo não se atrapalham
+    tmp = f"{abs_out}.{os.getpid()}.tmp"
+    if _fmt() == "webp":
+        img.save(tmp, format="WEBP", quality=DERIVATIVE_QUALITY, method=4)
+    else:
+        img.save(tmp, format="JPEG", quality=DERIVATIVE_QUALITY, optimize=True, progressive=True)
+    os.replace(tmp, abs_out)
+
+def generate_derivatives(img: Image.Image, key: str, orientation: int = 1) -> Dict[str, Any]:
+    """
+    Gera os derivados que ainda não existem a partir da imagem já decodificada.
+    orientation: tag EXIF do original (os derivados saem na orientação de exibição,
+    como o navegador mostra o original). Retorna {"key", "thumb", "preview"} (caminhos relativos).
+    """
+    entry: Dict[str, Any] = {"key": key}
+    missing = []
+    for kind in DERIVATIVE_SIZES:
+        rel = derivative_rel(key, kind)
+        entry[kind] = rel
+        if not os.path.isfile(_abs(rel)):
+            missing.append(kind)
+    if not missing:
+        return entry
+    src = img if img.mode in ("RGB", "L") else img.convert("RGB")
+    # do maior para o menor: cada derivado é reduzido a partir do anterior
+    for kind in sorted(missing, key=lambda k: DERIVATIVE_SIZES[k], reverse=True):
+        side = DERIVATIVE_SIZES[kind]
+        scale = min(1.0, side / float(max(src.width, src.height)))
+        size = (max(1, int(round(src.width * scale))), max(1, int(round(src.height * scale))))
+        src = src.resize(size, Image.LANCZOS, reducing_gap=3.0) if scale < 1.0 else src
+        _save(display_oriented(src, orientation), _abs(entry[kind]))
+    return entry
+
+def exif_orientation(img: Image.Image) -> int:
+    try:
+        return int(img.getexif().get(_ORIENTATION_TAG, 1) or 1)
+    except Exception:
+        return 1
+
+def display_oriented(img: Image.Image, orientation: int) -> Image.Image:
+    """Aplica a orientação EXIF (a imagem sai como o navegador exibiria o original)."""
+    op = _TRANSPOSE.get(orientation)
+    return img.transpose(op) if op is not None else img
+
+def ensure_derivatives(abs_path: str, key: Optional[str] = None) -> Dict[str, Any]:
+    """Derivados de um arquivo em disco (decodifica só se algum estiver faltando)."""
+    key = key or content_key(path=abs_path)
+    if all(os.path.isfile(_abs(derivative_rel(key, k))) for k in DERIVATIVE_SIZES):
+        return {"key": key, **{k: derivative_rel(key, k) for k in DERIVATIVE_SIZES}}
+    with Image.open(abs_path) as src:
+        orientation = exif_orientation(src)
+        # JPEG: decodifica já reduzido (DCT) quando a prévia é bem menor que o original
+        side = max(DERIVATIVE_SIZES.values())
+        src.draft("RGB", (side, side))
+        return generate_derivatives(src.convert("RGB"), key, orientation)
+
+def derivatives_current(entry: Optional[Dict[str, Any]]) -> bool:
+    """True se a entrada do índice aponta para derivados da configuração atual."""
+    if not entry or not entry.get("key"):
+        return False
+    return all(entry.get(k) == derivative_rel(entry["key"], k) for k in DERIVATIVE_SIZES)
+
+def remove_derivatives(entry: Optional[Dict[str, Any]]):
+    """Remove do disco os arquivos de uma entrada {"key", "thumb", "preview"}."""
+    if not entry:
+        return
+    for kind, rel in entry.items():
+        if kind == "key" or not rel:
+            continue
+        try:
+            abs_path = _abs(rel)
+            if os.path.isfile(abs_path):
+                os.remove(abs_path)
+        except Exception:
+            pass
@@ -0,0 +1,179 @@
+import io
+import os
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+# Política de codificação das imagens geradas, por tipo de saída:
+# - edited: editadas da galeria (apply-lut)
+# - watermark: versões com marca d'água da busca pública
+# - preview: prévias do editor de imagens
+# Padrões globais (ENCODE_POLICY em JSON sobrescreve) + política por evento em
+# media/events/{id}/encoding.json (só as chaves informadas).
+
+MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
+EVENTS_BASE = os.path.join(MEDIA_DIR, "events")
+
+ENCODE_KINDS = ("edited", "watermark", "preview")
+FORMATS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+SUBSAMPLINGS = ("4:4:4", "4:2:2", "4:2:0")
+
+_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    # entrega ao comprador: sem subamostragem de cor
+    "edited": {"format": "jpeg", "quality": 90, "subsampling": "4:4:4", "progressive": True},
+    "watermark": {
+        "format": (os.environ.get("WATERMARK_FORMAT", "jpeg") or "jpeg").strip().lower(),
+        "quality": int(os.environ.get("WATERMARK_QUALITY", "82")),
+        "subsampling": "4:2:0",
+        "progressive": True,
+    },
+    "preview": {"format": "jpeg", "quality": 85, "subsampling": "4:2:0", "progressive": False},
+}
+
+_cache_lock = threading.Lock()
+_event_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}  # event_id -> (mtime, política do arquivo)
+
+def normalize_spec(spec: Dict[str, Any], base: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Valida/completa uma especificação {format, quality, subsampling, progressive}. ValueError se inválida."""
+    out = dict(base or _DEFAULTS["edited"])
+    for k, v in (spec or {}).items():
+        if k not in ("format", "quality", "subsampling", "progressive"):
+            raise ValueError(f"Opção de codificação desconhecida: {k}")
+        out[k] = v
+    fmt = str(out["format"]).strip().lower()
+    fmt = "jpeg" if fmt == "jpg" else fmt
+    if fmt not in FORMATS:
+        raise ValueError("Formato deve ser jpeg, webp ou png.")
+    try:
+        quality = int(out["quality"])
+    except Exception:
+        raise ValueError("Qualidade inválida.")
+    if not 1 <= quality <= 100:
+        raise ValueError("Qualidade deve estar entre 1 e 100.")
+    if str(out["subsampling"]) not in SUBSAMPLINGS:
+        raise ValueError("Subamostragem deve ser 4:4:4, 4:2:2 ou 4:2:0.")
+    return {"format": fmt, "quality": quality, "subsampling": str(out["subsampling"]), "progressive": bool(out["progressive"])}
+
+def _global_policy() -> Dict[str, Dict[str, Any]]:
+    policy = {k: dict(v) for k, v in _DEFAULTS.items()}
+    raw = os.environ.get("ENCODE_POLICY", "").strip()
+    if raw:
+        try:
+            overrides = json.loads(raw)
+            for kind in ENCODE_KINDS:
+                if isinstance(overrides.get(kind), dict):
+                    policy[kind] = normalize_spec(overrides[kind], policy[kind])
+        except Exception:
+            pass
+    for kind in ENCODE_KINDS:
+        try:
+            policy[kind] = normalize_spec({}, policy[kind])
+        except ValueError:
+            policy[kind] = dict(_DEFAULTS["edited"])
+    return policy
+
+def _event_policy_path(event_id: int) -> str:
+    return os.path.join(EVENTS_BASE, str(event_id), "encoding.json")
+
+def _load_event_overrides(event_id: int) -> Dict[str, Any]:
+    path = _event_policy_path(event_id)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _cache_lock:
+        hit = _event_cache.get(int(event_id))
+        if hit and hit[0] == mtime:
+            return hit[1]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f) or {}
+    except Exception:
+        data = {}
+    with _cache_lock:
+        _event_cache[int(event_id)] = (mtime, data)
+    return data
+
+def get_policy(event_id: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """Política efetiva {tipo: spec} (global + overrides do evento)."""
+    policy = _global_policy()
+    if event_id is None:
+        return policy
+    for kind, spec in _load_event_overrides(event_id).items():
+        if kind in ENCODE_KINDS and isinstance(spec, dict):
+            try:
+                policy[kind] = normalize_spec(spec, policy[kind])
+            except ValueError:
+                pass
+    return policy
+
+def set_event_policy(event_id: int, policy: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Grava os overrides do evento ({tipo: spec parcial}; spec vazio/None remove o override do tipo).
+    Valida antes de gravar. Retorna a política efetiva.
+    """
+    current = dict(_load_event_overrides(event_id))
+    base = _global_policy()
+    for kind, spec in (policy or {}).items():
+        if kind not in ENCODE_KINDS:
+            raise ValueError(f"Tipo de saída desconhecido: {kind}")
+        if not spec:
+            current.pop(kind, None)
+            continue
+        if not isinstance(spec, dict):
+            raise ValueError(f"Configuração inválida para {kind}: esperado um objeto.")
+        normalize_spec(spec, base[kind])
+        current[kind] = dict(spec)
+    path = _event_policy_path(event_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    with _cache_lock:
+        _event_cache.pop(int(event_id), None)
+    return get_policy(event_id)
+
+def extension(spec: Dict[str, Any]) -> str:
+    return FORMATS[spec["format"]]
+
+def source_metadata(img: Image.Image, reset_orientation: bool = False) -> Dict[str, Any]:
+    """
+    ICC e EXIF de uma imagem aberta do disco, para repassar a encode().
+    reset_orientation: os pixels já foram girados para a orientação de exibição.
+    """
+    meta: Dict[str, Any] = {}
+    icc = img.info.get("icc_profile")
+    if icc:
+        meta["icc_profile"] = icc
+    try:
+        exif = img.getexif()
+        if exif:
+            if reset_orientation and exif.get(0x0112, 1) != 1:
+                # cópia: o Exif de getexif() é o cache da própria imagem
+                copy = Image.Exif()
+                copy.load(exif.tobytes())
+                copy[0x0112] = 1
+                exif = copy
+            meta["exif"] = exif.tobytes()
+    except Exception:
+        pass
+    return meta
+
+def encode(img: Image.Image, spec: Dict[str, Any], metadata: Optional[Dict[str, Any]] = None) -> bytes:
+    """Codifica a imagem conforme a spec, preservando ICC/EXIF de 'metadata' (ver source_metadata)."""
+    extra = {k: v for k, v in (metadata or {}).items() if v}
+    buf = io.BytesIO()
+    fmt = spec["format"]
+    if fmt == "jpeg":
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(buf, format="JPEG", quality=spec["quality"], subsampling=spec["subsampling"],
+                 progressive=spec["progressive"], optimize=True, **extra)
+    elif fmt == "webp":
+        # WebP com perdas é sempre 4:2:0
+        img.save(buf, format="WEBP", quality=spec["quality"], method=4, **extra)
+    else:
+        # compressão leve: PNG aqui é escolha por fidelidade, não por tamanho
+        img.save(buf, format="PNG", compress_level=1, **extra)
+    return buf.getvalue()
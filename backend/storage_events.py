@@ -6,6 +6,8 @@ import uuid
 from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 
+from storage_db import open_table
+
 EVENTS_CSV_PATH = os.environ.get(
     "EVENTS_CSV_PATH",
     os.path.join(os.path.dirname(__file__), "events.csv"),
@@ -60,19 +62,8 @@ def _ensure_csv():
                 }
                 writer.writerow(new_row)
 
-def _next_id() -> int:
-    _ensure_csv()
-    max_id = 0
-    with open(EVENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                rid = int(row.get("id", "0") or "0")
-                if rid > max_id:
-                    max_id = rid
-            except Exception:
-                continue
-    return max_id + 1
+# NOVO: tabela do backend configurado (CSV com cache ou SQLite, ver storage_db)
+_events = open_table("events", lambda: EVENTS_CSV_PATH, CSV_FIELDS, key="id", ensure=_ensure_csv)
 
 def _safe_filename(name: str) -> str:
     return "".join(ch if ch.isalnum() or ch in ("-", "_") else "_" for ch in name)
@@ -112,14 +103,12 @@ def add_event(
     photographers: List[str],
     photo_base64: Optional[str] = None,
 ) -> Dict:
-    _ensure_csv()
-    event_id = _next_id()
-    photo_path = _save_event_photo(event_id, photo_base64)
     created_at = datetime.utcnow().isoformat()
     import json as _json
-    with open(EVENTS_CSV_PATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writerow({
+    with _events.transaction():
+        event_id = _events.next_id()
+        photo_path = _save_event_photo(event_id, photo_base64)
+        _events.insert({
             "id": str(event_id),
             "name": name,
             "description": description,
@@ -141,60 +130,42 @@ def add_event(
         "photographers": photographers,
     }
 
+def _event_out(row: Dict[str, str]) -> Dict:
+    import json as _json
+    try:
+        members = _json.loads(row.get("photographers_json", "[]"))
+    except Exception:
+        members = []
+    return {
+        "id": int(row.get("id", "0") or "0"),
+        "name": row.get("name", ""),
+        "description": row.get("description", ""),
+        "start_date": row.get("start_date", ""),
+        "end_date": row.get("end_date", ""),
+        "owner_username": row.get("owner_username", ""),
+        "photo_path": row.get("photo_path") or None,
+        "photographers": members,
+    }
+
 def get_events_for_user(username: str) -> List[Dict]:
     """
     Lista eventos onde o usuário é dono ou participante.
     """
-    _ensure_csv()
-    import json as _json
     out: List[Dict] = []
-    with open(EVENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                members = _json.loads(row.get("photographers_json", "[]"))
-            except Exception:
-                members = []
-            owner = row.get("owner_username", "")
-            if username == owner or username in members:
-                out.append({
-                    "id": int(row.get("id", "0") or "0"),
-                    "name": row.get("name", ""),
-                    "description": row.get("description", ""),
-                    "start_date": row.get("start_date", ""),
-                    "end_date": row.get("end_date", ""),
-                    "owner_username": owner,
-                    "photo_path": row.get("photo_path") or None,
-                    "photographers": members,
-                })
+    for row in _events.rows():
+        try:
+            ev = _event_out(row)
+        except Exception:
+            continue
+        if username == ev["owner_username"] or username in ev["photographers"]:
+            out.append(ev)
     return out
 
 def get_event_by_id(event_id: int) -> Optional[Dict]:
-    _ensure_csv()
-    import json as _json
-    with open(EVENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                rid = int(row.get("id", "0") or "0")
-            except Exception:
-                continue
-            if rid == event_id:
-                try:
-                    members = _json.loads(row.get("photographers_json", "[]"))
-                except Exception:
-                    members = []
-                return {
-                    "id": rid,
-                    "name": row.get("name", ""),
-                    "description": row.get("description", ""),
-                    "start_date": row.get("start_date", ""),
-                    "end_date": row.get("end_date", ""),
-                    "owner_username": row.get("owner_username", ""),
-                    "photo_path": row.get("photo_path") or None,
-                    "photographers": members,
-                }
-    return None
+    row = _events.get(int(event_id))
+    if row is None:
+        return None
+    return _event_out(row)
 
 def update_event(
     event_id: int,
@@ -205,85 +176,34 @@ def update_event(
     photographers: Optional[List[str]] = None,
     photo_base64: Optional[str] = None,
 ) -> Optional[Dict]:
-    _ensure_csv()
     import json as _json
-    updated_row = None
-    rows = []
-    with open(EVENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rows.append(row)
-
-    for row in rows:
-        try:
-            rid = int(row.get("id", "0") or "0")
-        except Exception:
-            rid = 0
-        if rid == event_id:
-            # merge updates
-            row["name"] = name if name is not None else row.get("name", "")
-            row["description"] = description if description is not None else row.get("description", "")
-            row["start_date"] = start_date if start_date is not None else row.get("start_date", "")
-            row["end_date"] = end_date if end_date is not None else row.get("end_date", "")
-            if photographers is not None:
-                row["photographers_json"] = _json.dumps(photographers, ensure_ascii=False)
-            # photo update
-            if photo_base64 is not None:
-                # salva nova e substitui path
-                new_path = _save_event_photo(event_id, photo_base64)
-                row["photo_path"] = new_path or ""
-            updated_row = row
-            break
-
-    if not updated_row:
-        return None
-
-    with open(EVENTS_CSV_PATH, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
+    with _events.transaction():
+        row = _events.get(int(event_id))
+        if row is None:
+            return None
+        # merge updates
+        row["name"] = name if name is not None else row.get("name", "")
+        row["description"] = description if description is not None else row.get("description", "")
+        row["start_date"] = start_date if start_date is not None else row.get("start_date", "")
+        row["end_date"] = end_date if end_date is not None else row.get("end_date", "")
+        if photographers is not None:
+            row["photographers_json"] = _json.dumps(photographers, ensure_ascii=False)
+        # photo update
+        if photo_base64 is not None:
+            # salva nova e substitui path
+            new_path = _save_event_photo(event_id, photo_base64)
+            row["photo_path"] = new_path or ""
+        _events.put(row)
 
     # retorno normalizado
-    try:
-        members = _json.loads(updated_row.get("photographers_json", "[]"))
-    except Exception:
-        members = []
-    return {
-        "id": event_id,
-        "name": updated_row.get("name", ""),
-        "description": updated_row.get("description", ""),
-        "start_date": updated_row.get("start_date", ""),
-        "end_date": updated_row.get("end_date", ""),
-        "owner_username": updated_row.get("owner_username", ""),
-        "photo_path": updated_row.get("photo_path") or None,
-        "photographers": members,
-    }
+    return _event_out(row)
 
 def delete_event(event_id: int) -> bool:
-    _ensure_csv()
-    rows = []
-    deleted = False
-    photo_to_delete = None
-    with open(EVENTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                rid = int(row.get("id", "0") or "0")
-            except Exception:
-                rid = 0
-            if rid == event_id:
-                deleted = True
-                photo_to_delete = row.get("photo_path") or None
-                continue
-            rows.append(row)
-    if not deleted:
-        return False
-    with open(EVENTS_CSV_PATH, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
+    with _events.transaction():
+        row = _events.get(int(event_id))
+        if row is None or not _events.delete(int(event_id)):
+            return False
+    photo_to_delete = row.get("photo_path") or None
     # remover arquivo da foto, se existir
     if photo_to_delete:
         abs_path = os.path.join(os.path.dirname(__file__), photo_to_delete)
@@ -296,4 +216,4 @@ def delete_event(event_id: int) -> bool:
             shutil.rmtree(ev_dir, ignore_errors=True)
     except Exception:
         pass
-    return True
\ No newline at end of file
+    return True
@@ -4,6 +4,8 @@ import base64
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
+from storage_db import open_table
+
 EXPENSES_CSV_PATH = os.path.join(os.path.dirname(__file__), "expenses.csv")
 
 MEDIA_ROOT = os.path.join(os.path.dirname(__file__), "media")
@@ -59,51 +61,35 @@ def _ensure_csv():
                     "due_date": row.get("due_date", ""),  # migração suave
                 })
 
-def _next_id() -> int:
-    _ensure_csv()
-    max_id = 0
-    with open(EXPENSES_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                rid = int(row.get("id", "0") or 0)
-                if rid > max_id:
-                    max_id = rid
-            except Exception:
-                pass
-    return max_id + 1
+# NOVO: tabela do backend configurado (CSV com cache ou SQLite, ver storage_db)
+_expenses = open_table("expenses", EXPENSES_CSV_PATH, CSV_FIELDS, key="id", ensure=_ensure_csv)
 
 def get_all_expenses() -> List[Dict]:
-    _ensure_csv()
     out: List[Dict] = []
-    with open(EXPENSES_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            out.append({
-                "id": int(row.get("id", "0") or 0),
-                "name": row.get("name", ""),
-                "description": row.get("description", "") or "",
-                "price_brl": float(row.get("price_brl", "0") or 0),
-                "payment_type": row.get("payment_type", "avista"),
-                "installments_months": int(row.get("installments_months", "0") or 0),
-                "down_payment": float(row.get("down_payment", "0") or 0),
-                "status": row.get("status", "ativo"),
-                "created_at": row.get("created_at", "") or "",
-                "due_date": row.get("due_date", "") or "",
-            })
+    for row in _expenses.rows():
+        out.append({
+            "id": int(row.get("id", "0") or 0),
+            "name": row.get("name", ""),
+            "description": row.get("description", "") or "",
+            "price_brl": float(row.get("price_brl", "0") or 0),
+            "payment_type": row.get("payment_type", "avista"),
+            "installments_months": int(row.get("installments_months", "0") or 0),
+            "down_payment": float(row.get("down_payment", "0") or 0),
+            "status": row.get("status", "ativo"),
+            "created_at": row.get("created_at", "") or "",
+            "due_date": row.get("due_date", "") or "",
+        })
     return out
 
 def add_expense(name: str, description: str, price_brl: float, payment_type: str, installments_months: int, down_payment: float, status: str = "ativo", due_date: str = "") -> Dict:
-    _ensure_csv()
-    eid = _next_id()
     created_at = datetime.utcnow().isoformat()
     if payment_type not in ("avista", "parcelado", "recorrente"):
         payment_type = "avista"
     if status not in STATUS_VALUES:
         status = "ativo"
-    with open(EXPENSES_CSV_PATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writerow({
+    with _expenses.transaction():
+        eid = _expenses.next_id()
+        _expenses.insert({
             "id": str(eid),
             "name": name,
             "description": description or "",
@@ -129,67 +115,39 @@ def add_expense(name: str, description: str, price_brl: float, payment_type: str
     }
 
 def update_expense(expense_id: int, name: Optional[str] = None, description: Optional[str] = None, price_brl: Optional[float] = None, payment_type: Optional[str] = None, installments_months: Optional[int] = None, down_payment: Optional[float] = None, status: Optional[str] = None, due_date: Optional[str] = None) -> Optional[Dict]:
-    _ensure_csv()
-    updated = None
-    rows = []
-    with open(EXPENSES_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if int(row.get("id", "0") or 0) == int(expense_id):
-                new_row = {
-                    "id": row.get("id"),
-                    "name": name if name is not None else row.get("name", ""),
-                    "description": description if description is not None else row.get("description", "") or "",
-                    "price_brl": str(price_brl if price_brl is not None else float(row.get("price_brl", "0") or 0)),
-                    "payment_type": (payment_type if payment_type is not None else row.get("payment_type", "avista")),
-                    "installments_months": str(installments_months if installments_months is not None else int(row.get("installments_months", "0") or 0)),
-                    "down_payment": str(down_payment if down_payment is not None else float(row.get("down_payment", "0") or 0)),
-                    "status": (status if status is not None and status in STATUS_VALUES else row.get("status", "ativo")),
-                    "created_at": row.get("created_at", ""),
-                    "due_date": (due_date if due_date is not None else row.get("due_date", "")) or "",
-                }
-                rows.append(new_row)
-                updated = {
-                    "id": int(new_row["id"]),
-                    "name": new_row["name"],
-                    "description": new_row["description"],
-                    "price_brl": float(new_row["price_brl"]),
-                    "payment_type": new_row["payment_type"],
-                    "installments_months": int(new_row["installments_months"]),
-                    "down_payment": float(new_row["down_payment"]),
-                    "status": new_row["status"],
-                    "created_at": new_row["created_at"],
-                    "due_date": new_row["due_date"],
-                }
-            else:
-                rows.append(row)
-    if updated is None:
-        return None
-    with open(EXPENSES_CSV_PATH, "w", newline="", encoding="utf-8") as fw:
-        writer = csv.DictWriter(fw, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
-    return updated
+    with _expenses.transaction():
+        row = _expenses.get(int(expense_id))
+        if row is None:
+            return None
+        new_row = {
+            "id": row.get("id"),
+            "name": name if name is not None else row.get("name", ""),
+            "description": description if description is not None else row.get("description", "") or "",
+            "price_brl": str(price_brl if price_brl is not None else float(row.get("price_brl", "0") or 0)),
+            "payment_type": (payment_type if payment_type is not None else row.get("payment_type", "avista")),
+            "installments_months": str(installments_months if installments_months is not None else int(row.get("installments_months", "0") or 0)),
+            "down_payment": str(down_payment if down_payment is not None else float(row.get("down_payment", "0") or 0)),
+            "status": (status if status is not None and status in STATUS_VALUES else row.get("status", "ativo")),
+            "created_at": row.get("created_at", ""),
+            "due_date": (due_date if due_date is not None else row.get("due_date", "")) or "",
+        }
+        _expenses.put(new_row)
+    return {
+        "id": int(new_row["id"]),
+        "name": new_row["name"],
+        "description": new_row["description"],
+        "price_brl": float(new_row["price_brl"]),
+        "payment_type": new_row["payment_type"],
+        "installments_months": int(new_row["installments_months"]),
+        "down_payment": float(new_row["down_payment"]),
+        "status": new_row["status"],
+        "created_at": new_row["created_at"],
+        "due_date": new_row["due_date"],
+    }
 
 def delete_expense(expense_id: int) -> bool:
-    _ensure_csv()
-    rows = []
-    removed = False
-    with open(EXPENSES_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if int(row.get("id", "0") or 0) == int(expense_id):
-                removed = True
-                continue
-            rows.append(row)
-    if not removed:
+    if not _expenses.delete(int(expense_id)):
         return False
-    with open(EXPENSES_CSV_PATH, "w", newline="", encoding="utf-8") as fw:
-        writer = csv.DictWriter(fw, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
     try:
         # remover anexos do gasto
         base_dir = os.path.join(MEDIA_EXPENSES_FILES_DIR, str(expense_id))
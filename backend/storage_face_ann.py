@@ -0,0 +1,187 @@
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Backend da busca facial: "exact" (varredura completa) ou "ivf" (aproximado + rerank exato)
+FACE_SEARCH_BACKEND = os.environ.get("FACE_SEARCH_BACKEND", "exact").strip().lower()
+# abaixo deste tamanho a varredura exata é mais barata que manter o IVF
+FACE_IVF_MIN_VECTORS = int(os.environ.get("FACE_IVF_MIN_VECTORS", "20000"))
+# knobs de recall/latência
+FACE_IVF_NLIST = int(os.environ.get("FACE_IVF_NLIST", "0"))  # 0 = automático (~4*sqrt(N))
+FACE_IVF_NPROBE = int(os.environ.get("FACE_IVF_NPROBE", "8"))
+# candidatos reranqueados quando há top_k; sem top_k ("todas acima do limiar") reranqueia todos os sondados
+FACE_IVF_RERANK = int(os.environ.get("FACE_IVF_RERANK", "512"))
+FACE_IVF_PCA_DIM = int(os.environ.get("FACE_IVF_PCA_DIM", "64"))
+
+def exact_search(vectors: np.ndarray, query: np.ndarray, threshold: float, top_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Varredura completa (vetores L2-normalizados => cosseno = produto interno).
+    Retorna (linhas, scores) ordenados por score decrescente.
+    """
+    if vectors.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    scores = vectors @ query
+    rows = np.nonzero(scores >= threshold)[0]
+    if top_k is not None and rows.shape[0] > top_k:
+        part = np.argpartition(-scores[rows], top_k - 1)[:top_k]
+        rows = rows[part]
+    order = np.argsort(-scores[rows], kind="stable")
+    rows = rows[order]
+    return rows, scores[rows]
+
+def _auto_nlist(n: int) -> int:
+    return int(max(1, min(65536, round(4 * np.sqrt(max(n, 1))))))
+
+def _randomized_pca(sample: np.ndarray, dim: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """PCA aproximado (projeção aleatória + QR). Retorna (média, componentes dim x D)."""
+    rng = np.random.default_rng(seed)
+    mean = sample.mean(axis=0, dtype=np.float64).astype(np.float32)
+    xc = sample - mean
+    dim = int(max(1, min(dim, xc.shape[0], xc.shape[1])))
+    k = min(xc.shape[1], dim + 10)
+    omega = rng.standard_normal((xc.shape[1], k)).astype(np.float32)
+    y = xc @ omega
+    # uma iteração de potência melhora a separação dos autovalores
+    y = xc @ (xc.T @ y)
+    q, _ = np.linalg.qr(y)
+    b = q.T @ xc
+    _, _, vt = np.linalg.svd(b, full_matrices=False)
+    return mean, np.ascontiguousarray(vt[:dim].astype(np.float32))
+
+def _nearest_centroids(points: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    c_sq = (centroids * centroids).sum(axis=1)
+    out = np.empty(points.shape[0], dtype=np.int32)
+    for start in range(0, points.shape[0], chunk):
+        block = points[start:start + chunk]
+        d = c_sq[None, :] - 2.0 * (block @ centroids.T)
+        out[start:start + chunk] = np.argmin(d, axis=1)
+    return out
+
+def _kmeans(points: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    k = int(max(1, min(k, points.shape[0])))
+    centroids = points[rng.choice(points.shape[0], size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest_centroids(points, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, points)
+        counts = np.bincount(assign, minlength=k).astype(np.float32)
+        empty = counts == 0
+        centroids = np.where(empty[:, None], centroids, sums / np.maximum(counts, 1.0)[:, None])
+        if empty.any():
+            # reinicializa listas vazias com pontos aleatórios
+            centroids[empty] = points[rng.choice(points.shape[0], size=int(empty.sum()), replace=False)]
+    return centroids.astype(np.float32)
+
+class IVFIndex:
+    """
+    Índice IVF em NumPy: listas invertidas por k-means num espaço PCA reduzido.
+    Busca = sondar 'nprobe' listas, pontuar candidatos no espaço reduzido e
+    reranquear os 'rerank' melhores com os vetores completos.
+    Imutável depois de criado: add/keep devolvem um novo índice (cópia na escrita),
+    então quem está buscando com a instância antiga nunca vê um estado pela metade.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, centroids: np.ndarray, assign: np.ndarray, proj: np.ndarray, trained_n: int):
+        self.mean = mean
+        self.components = components
+        self.centroids = centroids
+        self.assign = assign
+        self.proj = proj
+        self.trained_n = int(trained_n)
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int = 0, pca_dim: int = FACE_IVF_PCA_DIM, sample_size: int = 50000, seed: int = 0) -> "IVFIndex":
+        n = vectors.shape[0]
+        rng = np.random.default_rng(seed)
+        sample_idx = rng.choice(n, size=min(n, sample_size), replace=False) if n > sample_size else np.arange(n)
+        sample = np.asarray(vectors[np.sort(sample_idx)], dtype=np.float32)
+        mean, components = _randomized_pca(sample, pca_dim, seed=seed)
+        nlist = nlist or _auto_nlist(n)
+        centroids = _kmeans((sample - mean) @ components.T, nlist, seed=seed)
+        index = cls(mean, components, centroids, np.zeros(0, dtype=np.int32), np.zeros((0, components.shape[0]), dtype=np.float32), n)
+        return index.add(vectors)
+
+    def _project(self, vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        out = np.empty((vectors.shape[0], self.components.shape[0]), dtype=np.float32)
+        for start in range(0, vectors.shape[0], chunk):
+            block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+            out[start:start + chunk] = (block - self.mean) @ self.components.T
+        return out
+
+    def add(self, vectors: np.ndarray) -> "IVFIndex":
+        """Novo índice com as linhas atribuídas às listas existentes (sem retreinar)."""
+        if vectors.shape[0] == 0:
+            return self
+        proj = self._project(vectors)
+        return IVFIndex(self.mean, self.components, self.centroids,
+                        np.concatenate([self.assign, _nearest_centroids(proj, self.centroids)]),
+                        np.vstack([self.proj, proj]), self.trained_n)
+
+    def keep(self, mask: np.ndarray) -> "IVFIndex":
+        """Novo índice compactado junto com a matriz de vetores (remoção de linhas)."""
+        return IVFIndex(self.mean, self.components, self.centroids, self.assign[mask], self.proj[mask], self.trained_n)
+
+    @property
+    def size(self) -> int:
+        return int(self.assign.shape[0])
+
+    def needs_retrain(self) -> bool:
+        # o k-means foi ajustado para trained_n; reequilibra quando o evento dobra de tamanho
+        return self.size > 2 * max(self.trained_n, 1)
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            offsets = np.searchsorted(self.assign[order], np.arange(self.centroids.shape[0] + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, threshold: float, top_k: Optional[int] = None,
+               nprobe: int = FACE_IVF_NPROBE, rerank: int = FACE_IVF_RERANK) -> Tuple[np.ndarray, np.ndarray]:
+        if self.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        q_full = self.components @ query           # ranking aproximado: proj · (P q)
+        q_centered = self.components @ (query - self.mean)
+        nprobe = int(max(1, min(nprobe, self.centroids.shape[0])))
+        d = ((self.centroids - q_centered) ** 2).sum(axis=1)
+        probe = np.argpartition(d, nprobe - 1)[:nprobe]
+        order, offsets = self._inverted_lists()
+        cand = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+        if cand.shape[0] == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # sem top_k o resultado é "tudo acima do limiar": não corta os candidatos sondados
+        limit = max(int(rerank), int(top_k)) if top_k is not None else cand.shape[0]
+        if cand.shape[0] > limit:
+            approx = self.proj[cand] @ q_full
+            cand = cand[np.argpartition(-approx, limit - 1)[:limit]]
+        # rerank exato com os vetores completos
+        cand = np.sort(cand)
+        exact = np.asarray(vectors[cand], dtype=np.float32) @ query
+        ok = exact >= threshold
+        rows, scores = cand[ok], exact[ok]
+        order_s = np.argsort(-scores, kind="stable")
+        if top_k is not None:
+            order_s = order_s[:top_k]
+        return rows[order_s], scores[order_s]
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, mean=self.mean, components=self.components, centroids=self.centroids,
+                 assign=self.assign, proj=self.proj, trained_n=np.array([self.trained_n]))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IVFIndex"]:
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path) as z:
+                return cls(z["mean"], z["components"], z["centroids"], z["assign"], z["proj"], int(z["trained_n"][0]))
+        except Exception:
+            return None
+
+def use_ivf(n_vectors: int, backend: Optional[str] = None) -> bool:
+    return (backend or FACE_SEARCH_BACKEND) == "ivf" and n_vectors >= FACE_IVF_MIN_VECTORS
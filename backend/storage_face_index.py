@@ -0,0 +1,226 @@
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from storage_face_ann import IVFIndex, exact_search, use_ivf, FACE_IVF_NLIST, FACE_IVF_NPROBE, FACE_IVF_RERANK
+
+MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
+EVENTS_BASE = os.path.join(MEDIA_DIR, "events")
+
+# patch cinza 64x64 achatado (ver storage_gallery._face_vector_from_roi)
+FACE_VEC_DIM = 64 * 64
+
+_locks: Dict[int, threading.Lock] = {}
+_locks_guard = threading.Lock()
+# IVF carregado em memória por evento: event_id -> (mtime do arquivo, índice)
+_ann_cache: Dict[int, Tuple[float, IVFIndex]] = {}
+
+def _event_lock(event_id: int) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(int(event_id))
+        if lock is None:
+            lock = threading.Lock()
+            _locks[int(event_id)] = lock
+        return lock
+
+def _index_paths(event_id: int) -> Tuple[str, str]:
+    """
+    Índice binário ao lado do índice da galeria (index.db):
+    - faces.npy: matriz float32 (N x FACE_VEC_DIM), uma linha por rosto, já normalizada (L2)
+    - faces_ids.json: lista com o image_id de cada linha da matriz
+    """
+    base = os.path.join(EVENTS_BASE, str(event_id), "gallery")
+    os.makedirs(base, exist_ok=True)
+    return os.path.join(base, "faces.npy"), os.path.join(base, "faces_ids.json")
+
+def _ann_path(event_id: int) -> str:
+    base = os.path.join(EVENTS_BASE, str(event_id), "gallery")
+    return os.path.join(base, "faces_ivf.npz")
+
+def _load_ann(event_id: int) -> Optional[IVFIndex]:
+    path = _ann_path(event_id)
+    if not os.path.isfile(path):
+        _ann_cache.pop(int(event_id), None)
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _ann_cache.get(int(event_id))
+    if cached and cached[0] == mtime:
+        return cached[1]
+    ann = IVFIndex.load(path)
+    if ann is not None:
+        _ann_cache[int(event_id)] = (mtime, ann)
+    return ann
+
+def _save_ann(event_id: int, ann: IVFIndex):
+    path = _ann_path(event_id)
+    ann.save(path)
+    _ann_cache[int(event_id)] = (os.path.getmtime(path), ann)
+
+def _drop_ann(event_id: int):
+    _ann_cache.pop(int(event_id), None)
+    try:
+        os.remove(_ann_path(event_id))
+    except FileNotFoundError:
+        pass
+
+def _empty() -> np.ndarray:
+    return np.zeros((0, FACE_VEC_DIM), dtype=np.float32)
+
+def _load(event_id: int, mmap: bool = False) -> Tuple[np.ndarray, List[str]]:
+    vec_path, ids_path = _index_paths(event_id)
+    if not os.path.isfile(vec_path) or not os.path.isfile(ids_path):
+        return _empty(), []
+    try:
+        with open(ids_path, "r", encoding="utf-8") as f:
+            ids = list(json.load(f))
+        vectors = np.load(vec_path, mmap_mode="r" if mmap else None)
+    except Exception:
+        return _empty(), []
+    if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+        # índice inconsistente (ex.: escrita interrompida); tratar como vazio até rebuild
+        return _empty(), []
+    return vectors, ids
+
+def _save(event_id: int, vectors: np.ndarray, ids: List[str]):
+    vec_path, ids_path = _index_paths(event_id)
+    # escrita atômica: grava em temporário e substitui
+    tmp_vec = vec_path + ".tmp.npy"
+    tmp_ids = ids_path + ".tmp"
+    np.save(tmp_vec, np.ascontiguousarray(vectors, dtype=np.float32))
+    with open(tmp_ids, "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    os.replace(tmp_vec, vec_path)
+    os.replace(tmp_ids, ids_path)
+
+def load_face_index(event_id: int) -> Tuple[np.ndarray, List[str]]:
+    """Retorna (matriz de vetores, ids por linha) do evento."""
+    return _load(event_id)
+
+def has_face_index(event_id: int) -> bool:
+    vec_path, ids_path = _index_paths(event_id)
+    return os.path.isfile(vec_path) and os.path.isfile(ids_path)
+
+def face_index_size(event_id: int) -> int:
+    _, ids = _load(event_id, mmap=True)
+    return len(ids)
+
+def append_faces(event_id: int, entries: List[Tuple[str, List[np.ndarray]]]) -> int:
+    """
+    Acrescenta vetores ao índice. entries: [(image_id, [vetores...]), ...]
+    Retorna a quantidade de rostos adicionados.
+    """
+    rows: List[np.ndarray] = []
+    new_ids: List[str] = []
+    for image_id, vectors in entries:
+        for vec in vectors or []:
+            rows.append(np.asarray(vec, dtype=np.float32).reshape(FACE_VEC_DIM))
+            new_ids.append(image_id)
+    if not rows:
+        return 0
+    with _event_lock(event_id):
+        vectors, ids = _load(event_id)
+        added = np.stack(rows)
+        merged = np.vstack([vectors, added]) if len(ids) else added
+        _save(event_id, merged, ids + new_ids)
+        # IVF (se existir) recebe as novas linhas sem retreinar
+        ann = _load_ann(event_id)
+        if ann is not None and ann.size == len(ids):
+            _save_ann(event_id, ann.add(added))
+        elif ann is not None:
+            _drop_ann(event_id)
+    return len(new_ids)
+
+def remove_images(event_id: int, image_ids: List[str]) -> int:
+    """Remove do índice todas as linhas das imagens informadas. Retorna linhas removidas."""
+    targets = set(image_ids or [])
+    if not targets:
+        return 0
+    with _event_lock(event_id):
+        vectors, ids = _load(event_id)
+        if not ids:
+            return 0
+        keep = np.array([iid not in targets for iid in ids], dtype=bool)
+        removed = int((~keep).sum())
+        if removed:
+            _save(event_id, vectors[keep], [iid for iid, k in zip(ids, keep) if k])
+            ann = _load_ann(event_id)
+            if ann is not None and ann.size == len(ids):
+                _save_ann(event_id, ann.keep(keep))
+            elif ann is not None:
+                _drop_ann(event_id)
+    return removed
+
+def replace_index(event_id: int, entries: List[Tuple[str, List[np.ndarray]]]) -> int:
+    """Reescreve o índice inteiro (usado pelo rebuild)."""
+    rows: List[np.ndarray] = []
+    ids: List[str] = []
+    for image_id, vectors in entries:
+        for vec in vectors or []:
+            rows.append(np.asarray(vec, dtype=np.float32).reshape(FACE_VEC_DIM))
+            ids.append(image_id)
+    with _event_lock(event_id):
+        _save(event_id, np.stack(rows) if rows else _empty(), ids)
+        _drop_ann(event_id)
+    return len(ids)
+
+def _snapshot(event_id: int, backend: Optional[str]) -> Tuple[np.ndarray, List[str], Optional[IVFIndex]]:
+    """
+    (vetores, ids, IVF ou None) lidos juntos sob o lock do evento. O IVF só é devolvido se
+    cobrir exatamente essas linhas (treina/retreina aqui quando preciso); como add/keep criam
+    um índice novo, a busca pode seguir fora do lock com este trio.
+    """
+    with _event_lock(event_id):
+        vectors, ids = _load(event_id, mmap=True)
+        if not ids or not use_ivf(len(ids), backend):
+            return vectors, ids, None
+        ann = _load_ann(event_id)
+        if ann is None or ann.size != len(ids) or ann.needs_retrain():
+            ann = IVFIndex.train(vectors, nlist=FACE_IVF_NLIST)
+            _save_ann(event_id, ann)
+    return vectors, ids, ann
+
+def search_faces(event_id: int, query_vec: np.ndarray, similarity_threshold: float, top_k: Optional[int] = None,
+                 backend: Optional[str] = None, nprobe: Optional[int] = None, rerank: Optional[int] = None) -> Dict[str, float]:
+    """
+    Similaridade cosseno entre a consulta e os rostos do evento.
+    - exact: um produto matriz-vetor sobre todos os rostos.
+    - ivf (eventos grandes): sonda 'nprobe' listas e reranqueia com o vetor completo os 'rerank'
+      melhores candidatos (com top_k) ou todos os candidatos sondados (sem top_k).
+    Retorna {image_id: melhor score} apenas para imagens acima do limiar.
+    """
+    vectors, ids, ann = _snapshot(event_id, backend)
+    if not ids:
+        return {}
+    q = np.asarray(query_vec, dtype=np.float32).reshape(FACE_VEC_DIM)
+    q = q / (np.linalg.norm(q) + 1e-6)
+    if ann is not None and ann.size == len(ids) == vectors.shape[0]:
+        rows, scores = ann.search(vectors, q, similarity_threshold, top_k=top_k,
+                                  nprobe=nprobe or FACE_IVF_NPROBE, rerank=rerank or FACE_IVF_RERANK)
+    else:
+        rows, scores = exact_search(vectors, q, similarity_threshold, top_k=top_k)
+    best: Dict[str, float] = {}
+    for row, score in zip(rows.tolist(), scores.tolist()):
+        iid = ids[row]
+        if score > best.get(iid, -1.0):
+            best[iid] = float(score)
+    return best
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manutenção do índice de rostos por evento.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("event_ids", nargs="*", type=int, help="IDs dos eventos (vazio = todos)")
+    args = parser.parse_args()
+
+    from storage_gallery import rebuild_face_index
+
+    targets: Optional[List[int]] = args.event_ids or None
+    if targets is None:
+        targets = sorted(int(d) for d in os.listdir(EVENTS_BASE) if d.isdigit()) if os.path.isdir(EVENTS_BASE) else []
+    for eid in targets:
+        n = rebuild_face_index(eid)
+        print(f"evento {eid}: {n} rostos indexados")
@@ -1,9 +1,8 @@
 import os
 import io
-import json
 import uuid
 import time
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
 
 from PIL import Image
@@ -19,12 +18,33 @@ from storage_image_editor import _apply_adjustments
 from storage_image_editor import _crop_normal, _crop_face
 # ADD: importar cálculo de nitidez do sujeito
 from storage_image_editor import _compute_subject_sharpness
-# ADD: importar auto-crop por pose/face
-from storage_image_editor import _auto_crop_by_pose
+# análise única por imagem (rostos, pose, ROI do sujeito)
+from storage_image_editor import analyze_image, _analysis_valid, _auto_crop_box, _shift_analysis
+from storage_image_editor import _detect_faces
+from vision import detect_faces
+# índice binário de rostos por evento
+from storage_face_index import append_faces, has_face_index, remove_images as remove_face_rows, replace_index as replace_face_index, search_faces
+# preset compilado (LUT 1D/3D) em cache por id
+from storage_luts import compiled_for_params, get_compiled_lut
+# pool de processos para a ingestão paralela
+from workers import map_bounded, WORKERS
+# NOVO: miniaturas/prévias endereçadas pelo conteúdo
+# NOVO: política de codificação (formato/qualidade) por evento e tipo de saída
+from storage_encoding import encode, extension, get_policy, source_metadata
+from storage_watermark import WATERMARK_SIZES, apply_center_watermark, render_watermarked
+from storage_derivatives import DERIVATIVE_SIZES, content_key, derivatives_current, ensure_derivatives, exif_orientation, generate_derivatives, remove_derivatives
+# jobs persistentes (aplicação de LUT em massa)
+from storage_jobs import JobContext, create_job, ensure_job, register_handler, submit_job
+# índice da galeria por evento (SQLite; substitui o index.json)
+import storage_gallery_index as gindex
+from storage_uploads import StagedUpload, commit_upload
 
 MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
 EVENTS_BASE = os.path.join(MEDIA_DIR, "events")
 
+# quantas imagens analisadas são gravadas no índice por vez durante o upload
+GALLERY_INGEST_BATCH = max(1, int(os.environ.get("GALLERY_INGEST_BATCH", "16")))
+
 def _ensure_event_dirs(event_id: int):
     base = os.path.join(EVENTS_BASE, str(event_id), "gallery")
     raw_dir = os.path.join(base, "raw")
@@ -35,49 +55,9 @@ def _ensure_event_dirs(event_id: int):
     os.makedirs(wm_dir, exist_ok=True)
     return base, raw_dir, edited_dir, wm_dir
 
-def _watermark_path() -> str:
-    return os.path.join(os.path.dirname(__file__), "media", "watermark", "watermark.png")
-
 def _apply_center_watermark(img: Image.Image) -> Image.Image:
-    """
-    Aplica PNG de marca d'água central, escalando para ~50% da largura da imagem (com limites).
-    """
-    wm_file = _watermark_path()
-    if not os.path.isfile(wm_file):
-        return img
-    wm = Image.open(wm_file).convert("RGBA")
-    W, H = img.width, img.height
-    # Escala alvo: 50% da largura da imagem (máx 80%, mín 20%)
-    target_w = max(int(W * 0.2), min(int(W * 0.5), int(W * 0.8)))
-    scale = target_w / wm.width
-    target_h = max(1, int(wm.height * scale))
-    wm_resized = wm.resize((target_w, target_h), Image.LANCZOS)
-    # Centro
-    x = (W - target_w) // 2
-    y = (H - target_h) // 2
-    # Composição
-    base = img.convert("RGBA")
-    base.alpha_composite(wm_resized, (x, y))
-    return base.convert("RGB")
-
-def _index_path(event_id: int) -> str:
-    base, _, _, _ = _ensure_event_dirs(event_id)
-    return os.path.join(base, "index.json")
-
-def _load_index(event_id: int) -> Dict[str, Any]:
-    path = _index_path(event_id)
-    if not os.path.isfile(path):
-        return {"images": []}
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"images": []}
-
-def _save_index(event_id: int, data: Dict[str, Any]):
-    path = _index_path(event_id)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """Marca d'água central (ver storage_watermark; a versão escalada fica em cache)."""
+    return apply_center_watermark(img)
 
 def _safe_filename(name: str) -> str:
     return "".join(ch if ch.isalnum() or ch in ("-", "_", ".", " ") else "_" for ch in name)
@@ -113,24 +93,16 @@ def _detect_largest_face_bbox(img: Image.Image) -> Optional[Tuple[int, int, int,
     """
     if cv2 is None:
         return None
-    arr = np.asarray(img.convert("RGB"))
-    gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-    faces = cascade.detectMultiScale(gray, 1.2, 6)
+    faces = detect_faces(np.asarray(img.convert("RGB")))
     if len(faces) == 0:
         return None
     x, y, w, h = sorted(faces, key=lambda f: f[2]*f[3], reverse=True)[0]
     return (int(x), int(y), int(w), int(h))
 
-def _extract_face_vector(img: Image.Image) -> Optional[np.ndarray]:
+def _face_vector_from_roi(img: Image.Image, bbox: Tuple[int, int, int, int]) -> np.ndarray:
     """
-    Extrai um vetor de características do rosto (maior rosto da imagem).
-    Preferência: OpenCV Haar para detectar; vetor = patch cinza 64x64 normalizado.
-    Retorna None se não detectar rosto.
+    Vetor = patch cinza 64x64 do rosto, normalizado por iluminação e por norma L2.
     """
-    bbox = _detect_largest_face_bbox(img)
-    if bbox is None:
-        return None
     x, y, w, h = bbox
     roi = img.crop((x, y, x + w, y + h)).convert("L")
     roi = roi.resize((64, 64))
@@ -142,16 +114,33 @@ def _extract_face_vector(img: Image.Image) -> Optional[np.ndarray]:
     norm = np.linalg.norm(vec) + 1e-6
     return vec / norm
 
-def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-    return float(np.dot(a, b) / ((np.linalg.norm(a) + 1e-6) * (np.linalg.norm(b) + 1e-6)))
+def _extract_face_vector(img: Image.Image) -> Optional[np.ndarray]:
+    """
+    Extrai um vetor de características do rosto (maior rosto da imagem).
+    Preferência: OpenCV Haar para detectar; vetor = patch cinza 64x64 normalizado.
+    Retorna None se não detectar rosto.
+    """
+    bbox = _detect_largest_face_bbox(img)
+    if bbox is None:
+        return None
+    return _face_vector_from_roi(img, bbox)
+
+def _extract_face_vectors(img: Image.Image) -> List[np.ndarray]:
+    """
+    Extrai vetores de TODOS os rostos detectados (usado na indexação da galeria).
+    """
+    return [_face_vector_from_roi(img, bbox) for bbox in _detect_faces(img)]
+
+def _face_vectors_from_boxes(img: Image.Image, boxes: List[Any]) -> List[np.ndarray]:
+    """Vetores dos rostos já detectados (caixas do registro de análise)."""
+    return [_face_vector_from_roi(img, tuple(int(v) for v in bbox)) for bbox in boxes]
 
 def face_search_in_event(event_id: int, query_bytes: bytes, similarity_threshold: float = 0.90) -> List[Dict[str, Any]]:
     """
     Compara o rosto da imagem de consulta contra as fotos RAW do evento e retorna
     matches com URL de versão COM MARCA D'ÁGUA. Exibe a EDITADA quando existir.
     """
-    index = _load_index(event_id)
-    if not index.get("images"):
+    if not gindex.count_images(event_id):
         return []
     try:
         qimg = Image.open(io.BytesIO(query_bytes)).convert("RGB")
@@ -161,79 +150,148 @@ def face_search_in_event(event_id: int, query_bytes: bytes, similarity_threshold
     if qvec is None:
         return []
 
+    # vetores pré-computados no upload (ver add_images_to_event / rebuild_face_index);
+    # eventos anteriores ao índice são indexados em segundo plano a partir da primeira busca
+    if face_index_pending(event_id):
+        return []
+    scores = search_faces(event_id, qvec, similarity_threshold)
+    if not scores:
+        return []
+
     matches: List[Dict[str, Any]] = []
-    for item in index.get("images", []):
-        original_rel = item.get("original_rel") or ""
-        edited_rel = item.get("edited_rel") or ""
-        if not original_rel:
-            continue
-        abs_path = os.path.join(os.path.dirname(__file__), original_rel)
-        if not os.path.isfile(abs_path):
+    for iid, item in gindex.get_images(event_id, scores.keys()).items():
+        sim = scores[iid]
+        if not item.get("original_rel"):
             continue
-        try:
-            img = Image.open(abs_path).convert("RGB")
-        except Exception:
-            continue
-        vec = _extract_face_vector(img)
-        if vec is None:
-            continue
-        sim = _cosine_similarity(qvec, vec)
-        if sim >= similarity_threshold:
-            uploader = item.get("uploader") or "unknown"
-            # Prioriza a versão EDITADA para exibição; fallback para original
-            src_rel = edited_rel if edited_rel else original_rel
-            wm_rel = _ensure_watermarked(event_id, src_rel, uploader, item.get("id") or "img")
-            url = f"static/{(wm_rel or src_rel).replace('media/', '')}"
-            matches.append({
-                "id": item.get("id"),
-                "url": url,
-                "uploader": uploader,
-                "score": sim,
-                "uploaded_at": item.get("uploaded_at"),
-                "meta": item.get("meta") or {},
-                "price_brl": item.get("price_brl"),
-            })
+        uploader = item.get("uploader") or "unknown"
+        # versão com marca d'água renderizada sob demanda (editada quando existir; ver watermarked_image_path)
+        url = f"public/events/{event_id}/gallery/{item.get('id')}/watermarked"
+        matches.append({
+            "id": item.get("id"),
+            "url": url,
+            "thumb_url": f"{url}?size={WATERMARK_SIZES[0]}",
+            "uploader": uploader,
+            "score": sim,
+            "uploaded_at": item.get("uploaded_at"),
+            "meta": item.get("meta") or {},
+            "price_brl": item.get("price_brl"),
+        })
     matches.sort(key=lambda m: m.get("score", 0.0), reverse=True)
     return matches
 
-def add_images_to_event(event_id: int, uploader: str, files: List[Tuple[str, bytes]], sharpness_threshold: Optional[float] = None, price_brl: Optional[float] = None) -> List[Dict[str, Any]]:
+def _analyze_upload(abs_path: str, key: Optional[str] = None) -> Dict[str, Any]:
     """
-    Salva originais organizados em: media/events/{event_id}/gallery/raw/{uploader}/<id>_<original_name.ext>
-    Atualiza index.json com metadados e retorna os registros criados.
+    Etapa pesada do upload, executada no pool de processos:
+    decode + miniatura/prévia + metadados + análise (rostos/pose/ROI, uma única vez) + nitidez do sujeito + vetores de rosto.
+    Retorna também o tempo gasto em cada etapa (segundos).
+    """
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    try:
+        with Image.open(abs_path) as src:
+            meta = _read_basic_meta(src)
+            orientation = exif_orientation(src)
+            img = src.convert("RGB")
+    except Exception:
+        timings["decode"] = time.perf_counter() - t0
+        return {"meta": {"Dimensions": "", "width": 0, "height": 0}, "sharpness": 0.0, "faces": None, "analysis": None, "derivatives": None, "timings": timings}
+    t1 = time.perf_counter()
+    timings["decode"] = t1 - t0
+    try:
+        derivatives = generate_derivatives(img, key or content_key(path=abs_path), orientation)
+    except Exception:
+        derivatives = None
+    t1b = time.perf_counter()
+    timings["derivatives"] = t1b - t1
+    t1 = t1b
+    try:
+        analysis = analyze_image(img)
+    except Exception:
+        analysis = None
+    t2 = time.perf_counter()
+    timings["detect"] = t2 - t1
+    try:
+        sharp_raw = float(_compute_subject_sharpness(img, analysis))
+    except Exception:
+        sharp_raw = 0.0
+    t3 = time.perf_counter()
+    timings["sharpness"] = t3 - t2
+    try:
+        boxes = analysis["faces"] if analysis is not None else _detect_faces(img)
+        faces = [v.astype(np.float32) for v in _face_vectors_from_boxes(img, boxes)]
+    except Exception:
+        faces = None
+    timings["faces"] = time.perf_counter() - t3
+    return {"meta": meta, "sharpness": sharp_raw, "faces": faces, "analysis": analysis, "derivatives": derivatives, "timings": timings}
+
+def ingest_images(event_id: int, uploader: str, files: List[Tuple[str, Union[bytes, StagedUpload]]], sharpness_threshold: Optional[float] = None, price_brl: Optional[float] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
     """
+    Pipeline de ingestão: grava os originais, distribui a análise pelo pool de
+    processos (fila limitada) e grava os resultados no índice em lotes de
+    GALLERY_INGEST_BATCH. Retorna (registros criados, estatísticas por etapa).
+    Cada arquivo vem como bytes ou como StagedUpload (já em disco: só é movido, com o hash pronto).
+    """
+    started = time.perf_counter()
     base, raw_dir, _, wm_dir = _ensure_event_dirs(event_id)
     user_raw_dir = os.path.join(raw_dir, uploader)
     os.makedirs(user_raw_dir, exist_ok=True)
-
-    index = _load_index(event_id)
-    created_records: List[Dict[str, Any]] = []
     threshold = float(sharpness_threshold) if sharpness_threshold is not None else 39.0
+    # valor financeiro
+    price_val = None
+    try:
+        if price_brl is not None:
+            price_val = float(price_brl)
+    except Exception:
+        price_val = None
 
+    # evento com fotos anteriores ao índice de rostos: indexa as existentes antes do primeiro
+    # append_faces, senão o índice nasceria só com as novas e o rebuild da busca nunca rodaria
+    if not has_face_index(event_id) and gindex.count_images(event_id):
+        rebuild_face_index(event_id)
+
+    # 1) gravação dos originais (I/O sequencial, barato)
+    stage_time: Dict[str, float] = {"write": 0.0, "decode": 0.0, "derivatives": 0.0, "detect": 0.0, "sharpness": 0.0, "faces": 0.0, "index": 0.0}
+    pending: List[Tuple[str, str, str]] = []  # (image_id, abs_path, hash do conteúdo) na ordem do upload
+    t0 = time.perf_counter()
     for filename, content in files:
         image_id = _gen_image_id()
         name = _safe_filename(filename)
-        _, ext = os.path.splitext(name)
-        ext = ext.lower() or ".jpg"
         stored_name = f"{image_id}_{name}"
         abs_path = os.path.join(user_raw_dir, stored_name)
-        with open(abs_path, "wb") as fw:
-            fw.write(content)
-        # metadados e nitidez do sujeito no RAW
-        try:
-            img = Image.open(io.BytesIO(content)).convert("RGB")
-            meta = _read_basic_meta(img)
-            sharp_raw = float(_compute_subject_sharpness(img))
-        except Exception:
-            meta = {"Dimensions": "", "width": 0, "height": 0}
-            sharp_raw = 0.0
+        if isinstance(content, StagedUpload):
+            commit_upload(content, abs_path)
+            key = content.sha256
+        else:
+            with open(abs_path, "wb") as fw:
+                fw.write(content)
+            key = content_key(data=content)
+        pending.append((image_id, abs_path, key))
+    stage_time["write"] = time.perf_counter() - t0
+
+    # 2) análise em paralelo + 3) gravação em lotes
+    created_records: List[Dict[str, Any]] = []
+    batch: List[Tuple[int, Dict[str, Any], Optional[List[np.ndarray]]]] = []
+
+    def _flush():
+        if not batch:
+            return
+        t = time.perf_counter()
+        batch.sort(key=lambda b: b[0])
+        records = [b[1] for b in batch]
+        gindex.insert_images(event_id, records)
+        append_faces(event_id, [(b[1]["id"], b[2]) for b in batch if b[2]])
+        created_records.extend(records)
+        batch.clear()
+        stage_time["index"] += time.perf_counter() - t
+
+    for pos, result, _err in map_bounded(_analyze_upload, [(p, k) for _, p, k in pending]):
+        image_id, abs_path, _ = pending[pos]
+        if result is None:
+            result = {"meta": {"Dimensions": "", "width": 0, "height": 0}, "sharpness": 0.0, "faces": None, "analysis": None, "derivatives": None, "timings": {}}
+        for stage, secs in (result.get("timings") or {}).items():
+            stage_time[stage] = stage_time.get(stage, 0.0) + float(secs)
+        sharp_raw = float(result.get("sharpness") or 0.0)
         rel = os.path.relpath(abs_path, os.path.dirname(__file__)).replace(os.sep, "/")
-        # valor financeiro
-        price_val = None
-        try:
-            if price_brl is not None:
-                price_val = float(price_brl)
-        except Exception:
-            price_val = None
         record = {
             "id": image_id,
             "uploader": uploader,
@@ -241,50 +299,113 @@ def add_images_to_event(event_id: int, uploader: str, files: List[Tuple[str, byt
             "edited_rel": "",
             "applied_lut_id": None,
             "uploaded_at": datetime.utcnow().isoformat(),
-            "meta": meta,
+            "meta": result.get("meta") or {},
             # marca descarte baseado no threshold do upload
             "sharpness": sharp_raw,
             "discarded": bool(sharp_raw < threshold),
             "price_brl": price_val if price_val is not None else None,
+            # rostos/pose/ROI do original (reutilizados em crop, nitidez, busca e reedições)
+            "analysis": result.get("analysis"),
+            # miniatura/prévia do original (a editada ganha as suas em _commit_lut_results)
+            "derivatives": {"original": result.get("derivatives")} if result.get("derivatives") else {},
         }
-        index["images"].append(record)
-        created_records.append(record)
+        batch.append((pos, record, result.get("faces")))
+        if len(batch) >= GALLERY_INGEST_BATCH:
+            _flush()
+    _flush()
+
+    # mantém a ordem do upload no retorno
+    order = {iid: i for i, (iid, _, _) in enumerate(pending)}
+    created_records.sort(key=lambda r: order.get(r["id"], 0))
+    wall = time.perf_counter() - started
+    n = len(created_records)
+    stats = {
+        "images": n,
+        "workers": WORKERS,
+        "wall_seconds": round(wall, 3),
+        "images_per_second": round(n / wall, 2) if wall > 0 else None,
+        # tempo acumulado por etapa (somado entre workers) e vazão equivalente de um núcleo
+        "stages": {
+            k: {"seconds": round(v, 3), "images_per_second": round(n / v, 2) if v > 0 else None}
+            for k, v in stage_time.items()
+        },
+    }
+    return created_records, stats
 
-    _save_index(event_id, index)
-    return created_records
+def add_images_to_event(event_id: int, uploader: str, files: List[Tuple[str, bytes]], sharpness_threshold: Optional[float] = None, price_brl: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Salva originais organizados em: media/events/{event_id}/gallery/raw/{uploader}/<id>_<original_name.ext>
+    Registra as imagens no índice da galeria e retorna os registros criados.
+    """
+    records, _ = ingest_images(event_id, uploader, files, sharpness_threshold=sharpness_threshold, price_brl=price_brl)
+    return records
 
-def _ensure_watermarked(event_id: int, original_rel: str, uploader: str, image_id: str) -> Optional[str]:
+def watermarked_image_path(event_id: int, image_id: str, size: Optional[int] = None) -> Optional[str]:
     """
-    Gera e retorna caminho relativo para a versão com marca d'água, salvando em gallery/wm/{uploader}/{id}_wm.png.
+    Versão com marca d'água (editada quando existir, senão o original) em tamanho limitado,
+    do cache em disco ou renderizada agora (ver storage_watermark). None se a imagem não existir.
     """
-    try:
-        base, _, _, wm_dir = _ensure_event_dirs(event_id)
-        user_wm_dir = os.path.join(wm_dir, uploader)
-        os.makedirs(user_wm_dir, exist_ok=True)
-        abs_original = os.path.join(os.path.dirname(__file__), original_rel)
-        if not os.path.isfile(abs_original):
-            return None
-        out_name = f"{image_id}_wm.png"
-        abs_out = os.path.join(user_wm_dir, out_name)
-        if os.path.isfile(abs_out):
-            return os.path.relpath(abs_out, os.path.dirname(__file__)).replace(os.sep, "/")
-        # gerar
-        img = Image.open(abs_original).convert("RGB")
-        wm_img = _apply_center_watermark(img)
-        wm_img.save(abs_out, format="PNG", compress_level=1)
-        return os.path.relpath(abs_out, os.path.dirname(__file__)).replace(os.sep, "/")
-    except Exception:
+    item = gindex.get_image(event_id, image_id)
+    if not item:
+        return None
+    for key in ("edited_rel", "original_rel"):
+        rel = item.get(key) or ""
+        abs_src = os.path.join(os.path.dirname(__file__), rel)
+        if rel and os.path.isfile(abs_src):
+            return render_watermarked(abs_src, size, get_policy(event_id)["watermark"])
+    return None
+
+def _derivative_urls(event_id: int, item: Dict[str, Any], variant: str) -> Dict[str, str]:
+    """
+    {"thumb_url", "preview_url"} da versão 'original' ou 'edited': arquivo estático quando já
+    gerado; senão a rota que gera sob demanda (GET /events/{id}/gallery/{image_id}/{kind}).
+    """
+    entry = (item.get("derivatives") or {}).get(variant)
+    current = derivatives_current(entry)
+    urls: Dict[str, str] = {}
+    for kind in DERIVATIVE_SIZES:
+        if current and os.path.isfile(os.path.join(os.path.dirname(__file__), entry[kind])):
+            urls[f"{kind}_url"] = f"static/{entry[kind].replace('media/', '')}"
+        else:
+            urls[f"{kind}_url"] = f"events/{event_id}/gallery/{item.get('id')}/{kind}?variant={variant}"
+    return urls
+
+def ensure_image_derivative(event_id: int, image_id: str, kind: str, variant: str = "original") -> Optional[str]:
+    """
+    Caminho absoluto da miniatura/prévia ('thumb' | 'preview') da versão 'original' ou 'edited',
+    gerando na primeira requisição (imagens anteriores aos derivados ou tamanho/formato alterado).
+    None se a imagem/versão não existir.
+    """
+    if kind not in DERIVATIVE_SIZES or variant not in ("original", "edited"):
         return None
+    src_key = "original_rel" if variant == "original" else "edited_rel"
+    item = gindex.get_image(event_id, image_id)
+    src_rel = (item or {}).get(src_key) or ""
+    abs_src = os.path.join(os.path.dirname(__file__), src_rel)
+    if not src_rel or not os.path.isfile(abs_src):
+        return None
+    entry = (item.get("derivatives") or {}).get(variant)
+    if derivatives_current(entry) and os.path.isfile(os.path.join(os.path.dirname(__file__), entry[kind])):
+        return os.path.join(os.path.dirname(__file__), entry[kind])
+    # o arquivo de origem nunca é sobrescrito (editadas ganham novo nome), então o hash salvo continua válido
+    entry = ensure_derivatives(abs_src, (entry or {}).get("key"))
+    with gindex.transaction(event_id) as conn:
+        current = gindex.get_image(event_id, image_id, conn)
+        if current is not None and (current.get(src_key) or "") == src_rel:
+            derivs = current.get("derivatives") or {}
+            derivs[variant] = entry
+            gindex.update_images(event_id, {image_id: {"derivatives": derivs}}, conn)
+    return os.path.join(os.path.dirname(__file__), entry[kind])
 
 def list_gallery_for_event(event_id: int) -> Dict[str, Any]:
     """
     Retorna duas listas: raw (originais) e edited (processadas).
+    Cada item traz a URL do arquivo completo e thumb_url/preview_url (derivados reduzidos).
     """
-    index = _load_index(event_id)
     raw_list: List[Dict[str, Any]] = []
     edited_list: List[Dict[str, Any]] = []
 
-    for item in index.get("images", []):
+    for item in gindex.list_images(event_id):
         original_rel = item.get("original_rel") or ""
         edited_rel = item.get("edited_rel") or ""
         # URL para servir via /static
@@ -301,6 +422,7 @@ def list_gallery_for_event(event_id: int) -> Dict[str, Any]:
             raw_list.append({
                 **common,
                 "url": original_url,
+                **_derivative_urls(event_id, item, "original"),
                 "discarded": bool(item.get("discarded", False)),
                 "sharpness": float(item.get("sharpness", 0.0)),
             })
@@ -308,6 +430,7 @@ def list_gallery_for_event(event_id: int) -> Dict[str, Any]:
             edited_list.append({
                 **common,
                 "url": edited_url,
+                **_derivative_urls(event_id, item, "edited"),
                 "lut_id": item.get("applied_lut_id"),
                 "discarded": bool(item.get("discarded", False)),
                 # nitidez (após LUT, se calculada; senão mantém a do raw)
@@ -315,111 +438,304 @@ def list_gallery_for_event(event_id: int) -> Dict[str, Any]:
             })
     return {"raw": raw_list, "edited": edited_list}
 
-def apply_lut_for_event_images(event_id: int, image_ids: List[str], lut_params: Dict[str, Any], lut_id: Optional[int]) -> int:
+# campos da listagem paginada; sem 'fields' vão todos menos os pesados (meta)
+GALLERY_FIELDS = ("id", "uploader", "uploaded_at", "price_brl", "discarded", "sharpness", "lut_id", "has_edit",
+                  "url", "thumb_url", "preview_url", "edited", "meta")
+GALLERY_DEFAULT_FIELDS = tuple(f for f in GALLERY_FIELDS if f != "meta")
+GALLERY_PAGE_MAX = 500
+
+def _gallery_item(event_id: int, item: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    original_rel = item.get("original_rel") or ""
+    edited_rel = item.get("edited_rel") or ""
+    out: Dict[str, Any] = {
+        "id": item.get("id"),
+        "uploader": item.get("uploader"),
+        "uploaded_at": item.get("uploaded_at"),
+        "price_brl": item.get("price_brl"),
+        "discarded": bool(item.get("discarded", False)),
+        "sharpness": float(item.get("sharpness", 0.0)),
+        "lut_id": item.get("applied_lut_id"),
+        "has_edit": bool(edited_rel),
+        "meta": item.get("meta") or {},
+    }
+    if "url" in fields or "thumb_url" in fields or "preview_url" in fields:
+        out["url"] = f"static/{original_rel.replace('media/', '')}" if original_rel else ""
+        out.update(_derivative_urls(event_id, item, "original"))
+    if "edited" in fields:
+        out["edited"] = {"url": f"static/{edited_rel.replace('media/', '')}", **_derivative_urls(event_id, item, "edited")} if edited_rel else None
+    return {k: out[k] for k in fields}
+
+def query_gallery_for_event(event_id: int, filters: Optional[Dict[str, Any]] = None, sort: str = "upload", descending: bool = False,
+                            limit: int = 100, cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                            with_total: bool = False) -> Dict[str, Any]:
     """
-    Aplica ajustes (LUT) sobre as originais e grava PNG em: edited/{uploader}/<id>_<timestamp>.png
-    Substitui a versão anterior se existir.
+    Listagem paginada (cursor) com filtros e ordenação feitos no índice da galeria
+    (ver storage_gallery_index.query_images). Um item por imagem, com a editada em 'edited'.
+    fields: projeção (subconjunto de GALLERY_FIELDS). ValueError em parâmetro inválido.
     """
-    base, _, edited_dir, _ = _ensure_event_dirs(event_id)
-    index = _load_index(event_id)
-    count = 0
-    now_tag = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    if fields:
+        unknown = [f for f in fields if f not in GALLERY_FIELDS]
+        if unknown:
+            raise ValueError(f"Campo desconhecido: {unknown[0]}")
+        proj = tuple(dict.fromkeys(fields))
+    else:
+        proj = GALLERY_DEFAULT_FIELDS
+    limit = max(1, min(int(limit), GALLERY_PAGE_MAX))
+    rows, next_cursor = gindex.query_images(event_id, filters, sort, descending, limit, cursor)
+    result: Dict[str, Any] = {"items": [_gallery_item(event_id, r, proj) for r in rows], "next_cursor": next_cursor}
+    if with_total:
+        result["total"] = gindex.count_matching(event_id, filters)
+    return result
+
+def _render_lut_image(abs_original: str, abs_out: str, lut_params: Dict[str, Any], lut_id: Optional[int] = None,
+                      analysis: Optional[Dict[str, Any]] = None, encoding: Optional[Dict[str, Any]] = None) -> Tuple[float, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Trabalho pesado por imagem (executado no pool de processos): auto-crop por pose,
+    ajustes do LUT, nitidez do sujeito, gravação (política 'edited' do evento, com ICC/EXIF
+    do original) e miniatura/prévia da editada.
+    Com o registro de análise do índice não roda nenhum detector; sem ele, analisa
+    o original uma vez. Retorna (nitidez, análise nova ou None se já existia, derivados).
+    O preset compilado fica em cache em cada processo (ver storage_luts.get_compiled_lut).
+    """
+    with Image.open(abs_original) as src:
+        metadata = source_metadata(src)
+        orientation = exif_orientation(src)
+        img = src.convert("RGB")
+    computed = None
+    if not _analysis_valid(analysis, img):
+        analysis = computed = analyze_image(img)
+    # AUTO-CROP por imagem:
+    crop_cfg = (lut_params or {}).get("crop") or {}
+    aspect = float(crop_cfg.get("aspect", 1.0))
+    scale = float(crop_cfg.get("scale", 1.0))
+    box = _auto_crop_box(img.width, img.height, analysis, aspect=aspect, scale=scale)
+    if box is not None:
+        img = img.crop(box)
+        # coordenadas da análise passam para o recorte
+        analysis = _shift_analysis(analysis, box)
+    # aplica ajustes do LUT (compilado em tabela quando habilitado)
+    compiled = get_compiled_lut(lut_id, lut_params or {}) if lut_id is not None else compiled_for_params(lut_params or {})
+    out_img = _apply_adjustments(img, lut_params or {}, compiled)
+    # nitidez do SUJEITO na imagem já ajustada (ROI da análise)
+    subject_sharpness = float(_compute_subject_sharpness(out_img, analysis))
+    # codificar em memória: o hash dos derivados sai do mesmo buffer
+    data = encode(out_img, encoding or get_policy()["edited"], metadata)
+    with open(abs_out, "wb") as fw:
+        fw.write(data)
+    try:
+        derivatives = generate_derivatives(out_img, content_key(data=data), orientation)
+    except Exception:
+        derivatives = None
+    return subject_sharpness, computed, derivatives
 
+def _lut_tasks(event_id: int, image_ids: List[str], lut_params: Dict[str, Any], lut_id: Optional[int] = None) -> List[Tuple[str, Tuple[Any, ...]]]:
+    """Monta (image_id, args de _render_lut_image) para as imagens existentes."""
+    _, _, edited_dir, _ = _ensure_event_dirs(event_id)
+    by_id = gindex.get_images(event_id, image_ids)
+    now_tag = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    encoding = get_policy(event_id)["edited"]
+    tasks: List[Tuple[str, Tuple[Any, ...]]] = []
     for iid in image_ids:
-        item = next((x for x in index.get("images", []) if x.get("id") == iid), None)
+        item = by_id.get(iid)
         if not item:
             continue
         original_rel = item.get("original_rel") or ""
         abs_original = os.path.join(os.path.dirname(__file__), original_rel)
-        if not os.path.isfile(abs_original):
+        if not original_rel or not os.path.isfile(abs_original):
             continue
         uploader = item.get("uploader") or "unknown"
         user_edited_dir = os.path.join(edited_dir, uploader)
         os.makedirs(user_edited_dir, exist_ok=True)
+        abs_out = os.path.join(user_edited_dir, f"{iid}_{now_tag}.{extension(encoding)}")
+        tasks.append((iid, (abs_original, abs_out, lut_params or {}, lut_id, item.get("analysis"), encoding)))
+    return tasks
 
-        # processar imagem
+def _commit_lut_results(event_id: int, results: List[Tuple[str, str, float, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]], lut_id: Optional[int]) -> int:
+    """
+    Grava no índice as editadas geradas: results = [(image_id, abs_out, nitidez, análise nova ou None, derivados)].
+    Substitui (e remove do disco) a versão editada anterior e a miniatura/prévia dela.
+    """
+    if not results:
+        return 0
+    stale: List[Dict[str, Any]] = []
+    stale_files: List[str] = []
+    with gindex.transaction(event_id) as conn:
+        by_id = gindex.get_images(event_id, [r[0] for r in results], conn)
+        updates: Dict[str, Dict[str, Any]] = {}
+        for iid, abs_out, subject_sharpness, analysis, derivatives in results:
+            item = by_id.get(iid)
+            if item is None:
+                # imagem excluída durante o processamento
+                stale_files.append(abs_out)
+                stale.append(derivatives)
+                continue
+            rel_out = os.path.relpath(abs_out, os.path.dirname(__file__)).replace(os.sep, "/")
+            # remover editada anterior (mantendo só a última)
+            prev_rel = item.get("edited_rel") or ""
+            if prev_rel and prev_rel != rel_out:
+                stale_files.append(os.path.join(os.path.dirname(__file__), prev_rel))
+            fields: Dict[str, Any] = {"edited_rel": rel_out, "applied_lut_id": lut_id, "sharpness": subject_sharpness}
+            if analysis is not None:
+                fields["analysis"] = analysis
+            # derivados da editada anterior deixam de valer (conteúdo novo -> hash novo)
+            derivs = item.get("derivatives") or {}
+            stale.append(derivs.pop("edited", None))
+            if derivatives:
+                derivs["edited"] = derivatives
+            fields["derivatives"] = derivs
+            updates[iid] = fields
+        count = gindex.update_images(event_id, updates, conn)
+        in_use = gindex.derivative_keys_in_use(event_id, conn)
+    # arquivos só saem do disco depois do commit
+    for abs_path in stale_files:
         try:
-            img = Image.open(abs_original).convert("RGB")
-            # AUTO-CROP por imagem:
-            crop_cfg = (lut_params or {}).get("crop") or {}
-            aspect = float(crop_cfg.get("aspect", 1.0))
-            scale = float(crop_cfg.get("scale", 1.0))
-            auto_cropped = _auto_crop_by_pose(img, aspect=aspect, scale=scale)
-            if auto_cropped is not None:
-                img = auto_cropped
-            # aplica ajustes do LUT
-            out_img = _apply_adjustments(img, lut_params or {})
-            # calcular nitidez do SUJEITO na imagem já ajustada
-            subject_sharpness = _compute_subject_sharpness(out_img)
+            if os.path.isfile(abs_path):
+                os.remove(abs_path)
         except Exception:
-            continue
+            pass
+    _remove_unused_derivatives(event_id, stale, in_use)
+    return count
 
-        out_name = f"{iid}_{now_tag}.png"
-        abs_out = os.path.join(user_edited_dir, out_name)
-        # salvar PNG leve
-        try:
-            out_img.save(abs_out, format="PNG", compress_level=1)
-        except Exception:
+def apply_lut_for_event_images(event_id: int, image_ids: List[str], lut_params: Dict[str, Any], lut_id: Optional[int]) -> int:
+    """
+    Aplica ajustes (LUT) sobre as originais e grava em: edited/{uploader}/<id>_<timestamp>.<ext>
+    (formato conforme a política 'edited' do evento, ver storage_encoding)
+    Substitui a versão anterior se existir.
+    """
+    tasks = _lut_tasks(event_id, image_ids, lut_params, lut_id)
+    results: List[Tuple[str, str, float, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = []
+    for pos, res, err in map_bounded(_render_lut_image, [args for _, args in tasks]):
+        if err is None:
+            results.append((tasks[pos][0], tasks[pos][1][1], res[0], res[1], res[2]))
+    return _commit_lut_results(event_id, results, lut_id)
+
+def _apply_lut_job(job: Dict[str, Any], items: List[Dict[str, Any]], ctx: JobContext):
+    """
+    Handler de jobs 'apply_lut' (ver storage_jobs): processa os itens pendentes no
+    pool de processos e grava no índice em lotes. Resultado por item: {"sharpness", "edited_url"}.
+    """
+    params = job.get("params") or {}
+    event_id = int(params["event_id"])
+    lut_id = params.get("lut_id")
+    seq_by_id = {it["item_key"]: it["seq"] for it in items}
+    tasks = _lut_tasks(event_id, list(seq_by_id.keys()), params.get("lut_params") or {}, lut_id)
+    found = {iid for iid, _ in tasks}
+    for iid, seq in seq_by_id.items():
+        if iid not in found:
+            ctx.item_failed(seq, "Imagem não encontrada.")
+
+    batch: List[Tuple[str, str, float, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = []
+
+    def _flush():
+        _commit_lut_results(event_id, batch, lut_id)
+        for iid, abs_out, sharp, _, _ in batch:
+            rel_out = os.path.relpath(abs_out, os.path.dirname(__file__)).replace(os.sep, "/")
+            ctx.item_done(seq_by_id[iid], {"sharpness": sharp, "edited_url": f"static/{rel_out.replace('media/', '')}"})
+        batch.clear()
+
+    for pos, res, err in map_bounded(_render_lut_image, [args for _, args in tasks], stop=ctx.is_cancelled):
+        iid, abs_out = tasks[pos][0], tasks[pos][1][1]
+        if err is not None:
+            ctx.item_failed(seq_by_id[iid], str(err) or err.__class__.__name__)
             continue
+        batch.append((iid, abs_out, res[0], res[1], res[2]))
+        if len(batch) >= GALLERY_INGEST_BATCH:
+            _flush()
+    if batch:
+        _flush()
+
+register_handler("apply_lut", _apply_lut_job)
 
-        # remover editada anterior se desejado (mantendo só última)
-        prev_rel = item.get("edited_rel") or ""
-        if prev_rel:
+def start_apply_lut_job(event_id: int, image_ids: List[str], lut_params: Dict[str, Any], lut_id: Optional[int], owner: Optional[str] = None) -> Dict[str, Any]:
+    """Cria e dispara um job persistente de aplicação de LUT. Retorna o job (sem itens)."""
+    job = create_job("apply_lut", {"event_id": int(event_id), "lut_id": lut_id, "lut_params": lut_params or {}}, list(image_ids), owner=owner)
+    submit_job(job["id"])
+    return job
+
+def delete_event_images(event_id: int, image_ids: List[str]) -> int:
+    """
+    Exclui imagens do índice e arquivos originais/editados (e seus derivados).
+    """
+    removed = gindex.delete_images(event_id, image_ids)
+    stale: List[Dict[str, Any]] = []
+    for item in removed:
+        stale.extend((item.get("derivatives") or {}).values())
+        # remover arquivos
+        for key in ("original_rel", "edited_rel"):
+            rel = (item.get(key) or "").strip()
+            if not rel:
+                continue
+            abs_path = os.path.join(os.path.dirname(__file__), rel)
             try:
-                abs_prev = os.path.join(os.path.dirname(__file__), prev_rel)
-                if os.path.isfile(abs_prev):
-                    os.remove(abs_prev)
+                if os.path.isfile(abs_path):
+                    os.remove(abs_path)
             except Exception:
                 pass
+    deleted = len(removed)
+    # conteúdo idêntico em outra imagem (deste ou de outro evento) mantém os arquivos
+    _remove_unused_derivatives(event_id, stale, gindex.derivative_keys_in_use(event_id))
+    remove_face_rows(event_id, image_ids)
+    return deleted
+
+def _remove_unused_derivatives(event_id: int, stale: List[Optional[Dict[str, Any]]], in_use: set):
+    """Remove do disco os derivados de 'stale' que nenhuma imagem de nenhum evento referencia mais."""
+    candidates = {e["key"] for e in stale if e and e.get("key") and e["key"] not in in_use}
+    if not candidates:
+        return
+    candidates -= gindex.derivative_keys_shared(candidates, exclude_event=event_id)
+    for entry in stale:
+        if entry and entry.get("key") in candidates:
+            remove_derivatives(entry)
+
+def rebuild_face_index(event_id: int) -> int:
+    """
+    Recalcula o índice de rostos do evento a partir dos originais (eventos anteriores
+    ao índice ou índice corrompido). Retorna a quantidade de rostos indexados.
+    """
+    entries: List[Tuple[str, List[np.ndarray]]] = []
+    for item in gindex.list_images(event_id):
+        original_rel = item.get("original_rel") or ""
+        if not original_rel:
+            continue
+        abs_path = os.path.join(os.path.dirname(__file__), original_rel)
+        if not os.path.isfile(abs_path):
+            continue
+        try:
+            img = Image.open(abs_path).convert("RGB")
+            # rostos da análise do upload, quando houver (sem rodar o detector)
+            analysis = item.get("analysis")
+            if _analysis_valid(analysis, img):
+                entries.append((item.get("id"), _face_vectors_from_boxes(img, analysis["faces"])))
+            else:
+                entries.append((item.get("id"), _extract_face_vectors(img)))
+        except Exception:
+            continue
+    return replace_face_index(event_id, entries)
 
-        rel_out = os.path.relpath(abs_out, os.path.dirname(__file__)).replace(os.sep, "/")
-        item["edited_rel"] = rel_out
-        item["applied_lut_id"] = lut_id
-        item["sharpness"] = subject_sharpness
-        count += 1
+def _face_index_job(job: Dict[str, Any], items: List[Dict[str, Any]], ctx: JobContext):
+    """Handler de jobs 'face_index': rebuild_face_index do evento (item único). Resultado: {"faces"}."""
+    event_id = int((job.get("params") or {})["event_id"])
+    for it in items:
+        ctx.item_done(it["seq"], {"faces": rebuild_face_index(event_id)})
 
-    _save_index(event_id, index)
-    return count
+register_handler("face_index", _face_index_job)
 
-def delete_event_images(event_id: int, image_ids: List[str]) -> int:
+def face_index_pending(event_id: int) -> bool:
     """
-    Exclui imagens do índice e arquivos originais/editados.
-    """
-    index = _load_index(event_id)
-    remaining: List[Dict[str, Any]] = []
-    deleted = 0
-    for item in index.get("images", []):
-        if item.get("id") in image_ids:
-            # remover arquivos
-            for key in ("original_rel", "edited_rel"):
-                rel = (item.get(key) or "").strip()
-                if not rel:
-                    continue
-                abs_path = os.path.join(os.path.dirname(__file__), rel)
-                try:
-                    if os.path.isfile(abs_path):
-                        os.remove(abs_path)
-                except Exception:
-                    pass
-            deleted += 1
-        else:
-            remaining.append(item)
-    index["images"] = remaining
-    _save_index(event_id, index)
-    return deleted
+    True enquanto o evento não tem índice de rostos: dispara o job de indexação (um só por
+    evento, mesmo com buscas simultâneas) em vez de reconstruir dentro da requisição.
+    """
+    if has_face_index(event_id) or not gindex.count_images(event_id):
+        return False
+    job, created = ensure_job("face_index", {"event_id": int(event_id)}, [str(event_id)])
+    if created:
+        submit_job(job["id"])
+    return True
 
 # NOVO: marcar imagens como descartadas ou não descartadas
 def set_event_images_discarded(event_id: int, image_ids: List[str], discarded: bool) -> int:
     """
-    Atualiza a flag 'discarded' das imagens listadas no index.json do evento.
+    Atualiza a flag 'discarded' das imagens listadas no índice da galeria do evento.
     Retorna a quantidade de registros atualizados.
     """
-    index = _load_index(event_id)
-    ids = set(image_ids or [])
-    updated = 0
-    for item in index.get("images", []):
-        if item.get("id") in ids:
-            item["discarded"] = bool(discarded)
-            updated += 1
-    _save_index(event_id, index)
-    return updated
\ No newline at end of file
+    return gindex.set_discarded(event_id, image_ids or [], discarded)
\ No newline at end of file
@@ -0,0 +1,376 @@
+import os
+import json
+import base64
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
+EVENTS_BASE = os.path.join(MEDIA_DIR, "events")
+
+# Índice da galeria por evento em SQLite (media/events/{id}/gallery/index.db, modo WAL):
+# uma linha por imagem, atualizações por linha e transações (uploads simultâneos no mesmo
+# evento não perdem registros). Eventos antigos são importados do index.json na primeira
+# abertura; o arquivo é renomeado para index.json.migrated.
+
+# colunas simples; meta/analysis/derivatives são JSON e chaves desconhecidas vão para 'extra'
+_COLUMNS = ("id", "uploader", "original_rel", "edited_rel", "applied_lut_id", "uploaded_at",
+            "sharpness", "discarded", "price_brl")
+_JSON_COLUMNS = ("meta", "analysis", "derivatives")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    uploader TEXT,
+    original_rel TEXT,
+    edited_rel TEXT,
+    applied_lut_id INTEGER,
+    uploaded_at TEXT,
+    sharpness REAL NOT NULL DEFAULT 0,
+    discarded INTEGER NOT NULL DEFAULT 0,
+    price_brl REAL,
+    meta TEXT,
+    analysis TEXT,
+    derivatives TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_uploaded_at ON images(uploaded_at, seq);
+CREATE INDEX IF NOT EXISTS idx_images_sharpness ON images(sharpness, seq);
+CREATE INDEX IF NOT EXISTS idx_images_uploader ON images(uploader, seq);
+CREATE INDEX IF NOT EXISTS idx_images_discarded ON images(discarded, seq);
+CREATE INDEX IF NOT EXISTS idx_images_lut ON images(applied_lut_id, seq);
+-- visão mais comum: só não descartadas, por nitidez ou data
+CREATE INDEX IF NOT EXISTS idx_images_discarded_sharpness ON images(discarded, sharpness, seq);
+CREATE INDEX IF NOT EXISTS idx_images_discarded_uploaded_at ON images(discarded, uploaded_at, seq);
+"""
+
+# chaves de ordenação da listagem paginada -> coluna ("upload" = ordem de upload)
+SORT_KEYS = {"upload": "seq", "uploaded_at": "uploaded_at", "sharpness": "sharpness"}
+
+_init_lock = threading.Lock()
+# (caminho, dispositivo, inode) já inicializados: um evento excluído e recriado com o mesmo id
+# tem outro arquivo index.db e volta a receber o schema
+_initialized: Set[Tuple[str, int, int]] = set()
+
+def _db_path(event_id: int) -> str:
+    return os.path.join(EVENTS_BASE, str(event_id), "gallery", "index.db")
+
+def _connect(event_id: int) -> sqlite3.Connection:
+    path = _db_path(event_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        st = os.stat(path)
+        ident = (path, st.st_dev, st.st_ino)
+    except OSError:
+        ident = None
+    if ident is None or ident not in _initialized:
+        with _init_lock:
+            if ident is None or ident not in _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                # ordenação por data exige valor não nulo (registros antigos sem uploaded_at)
+                conn.execute("UPDATE images SET uploaded_at = '' WHERE uploaded_at IS NULL")
+                _migrate_json(event_id, conn)
+                if ident is not None:
+                    _initialized.add(ident)
+    return conn
+
+def _migrate_json(event_id: int, conn: sqlite3.Connection):
+    legacy = os.path.join(os.path.dirname(_db_path(event_id)), "index.json")
+    if not os.path.isfile(legacy):
+        return
+    try:
+        with open(legacy, "r", encoding="utf-8") as f:
+            images = (json.load(f) or {}).get("images") or []
+    except Exception:
+        images = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _insert(conn, [x for x in images if x.get("id")])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    try:
+        os.replace(legacy, legacy + ".migrated")
+    except FileNotFoundError:
+        # outro processo migrou o mesmo evento ao mesmo tempo (INSERT OR REPLACE: mesmas linhas)
+        pass
+
+def _to_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    row = {k: record.get(k) for k in _COLUMNS}
+    row["edited_rel"] = row["edited_rel"] or ""
+    row["uploaded_at"] = row["uploaded_at"] or ""
+    row["sharpness"] = float(row["sharpness"] or 0.0)
+    row["discarded"] = 1 if record.get("discarded") else 0
+    for k in _JSON_COLUMNS:
+        row[k] = json.dumps(record[k], ensure_ascii=False) if record.get(k) is not None else None
+    extra = {k: v for k, v in record.items() if k not in _COLUMNS and k not in _JSON_COLUMNS and k != "seq"}
+    row["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+    return row
+
+def _from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    d = dict(row)
+    d.pop("seq", None)
+    extra = d.pop("extra", None)
+    d["discarded"] = bool(d.get("discarded"))
+    for k in _JSON_COLUMNS:
+        d[k] = json.loads(d[k]) if d.get(k) else None
+    d["meta"] = d["meta"] or {}
+    d["derivatives"] = d["derivatives"] or {}
+    if extra:
+        d.update(json.loads(extra))
+    return d
+
+def _insert(conn: sqlite3.Connection, records: List[Dict[str, Any]]):
+    if not records:
+        return
+    cols = list(_COLUMNS) + list(_JSON_COLUMNS) + ["extra"]
+    sql = f"INSERT OR REPLACE INTO images ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})"
+    conn.executemany(sql, [tuple(_to_row(r)[c] for c in cols) for r in records])
+
+def _has_index(event_id: int) -> bool:
+    base = os.path.dirname(_db_path(event_id))
+    return os.path.isfile(_db_path(event_id)) or os.path.isfile(os.path.join(base, "index.json"))
+
+def _empty_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+@contextmanager
+def _use(event_id: int, conn: Optional[sqlite3.Connection]) -> Iterator[sqlite3.Connection]:
+    # reaproveita a conexão de uma transação em andamento ou abre uma avulsa;
+    # leitura de evento sem índice usa um banco vazio em memória (não cria pastas nem index.db)
+    if conn is not None:
+        yield conn
+        return
+    own = _connect(event_id) if _has_index(event_id) else _empty_connection()
+    try:
+        yield own
+    finally:
+        own.close()
+
+@contextmanager
+def transaction(event_id: int) -> Iterator[sqlite3.Connection]:
+    """Transação de escrita (BEGIN IMMEDIATE): leituras e atualizações dentro dela são atômicas."""
+    conn = _connect(event_id)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+def _chunks(ids: List[str], size: int = 500) -> Iterable[List[str]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def list_images(event_id: int, conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+    """Todos os registros do evento, na ordem de upload."""
+    with _use(event_id, conn) as c:
+        return [_from_row(r) for r in c.execute("SELECT * FROM images ORDER BY seq")]
+
+def count_images(event_id: int) -> int:
+    with _use(event_id, None) as c:
+        return int(c.execute("SELECT COUNT(*) FROM images").fetchone()[0])
+
+def get_images(event_id: int, image_ids: Iterable[str], conn: Optional[sqlite3.Connection] = None) -> Dict[str, Dict[str, Any]]:
+    """Registros por id (busca pelo índice único; ids inexistentes ficam de fora)."""
+    ids = list(dict.fromkeys(i for i in image_ids if i))
+    out: Dict[str, Dict[str, Any]] = {}
+    with _use(event_id, conn) as c:
+        for part in _chunks(ids):
+            sql = f"SELECT * FROM images WHERE id IN ({', '.join('?' for _ in part)})"
+            for r in c.execute(sql, part):
+                out[r["id"]] = _from_row(r)
+    return out
+
+def get_image(event_id: int, image_id: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
+    return get_images(event_id, [image_id], conn).get(image_id)
+
+def insert_images(event_id: int, records: List[Dict[str, Any]], conn: Optional[sqlite3.Connection] = None):
+    """Insere registros novos numa única transação."""
+    if not records:
+        return
+    if conn is not None:
+        _insert(conn, records)
+        return
+    with transaction(event_id) as c:
+        _insert(c, records)
+
+def update_images(event_id: int, updates: Dict[str, Dict[str, Any]], conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Atualiza só os campos informados de cada imagem: {image_id: {campo: valor}}.
+    Retorna quantas linhas existiam.
+    """
+    def _apply(c: sqlite3.Connection) -> int:
+        n = 0
+        for image_id, fields in updates.items():
+            sets, args = [], []
+            for k, v in fields.items():
+                if k in _JSON_COLUMNS:
+                    sets.append(f"{k} = ?")
+                    args.append(json.dumps(v, ensure_ascii=False) if v is not None else None)
+                elif k in _COLUMNS and k != "id":
+                    sets.append(f"{k} = ?")
+                    args.append((1 if v else 0) if k == "discarded" else v)
+                else:
+                    raise ValueError(f"Campo desconhecido: {k}")
+            if not sets:
+                continue
+            cur = c.execute(f"UPDATE images SET {', '.join(sets)} WHERE id = ?", args + [image_id])
+            n += cur.rowcount
+        return n
+    if conn is not None:
+        return _apply(conn)
+    with transaction(event_id) as c:
+        return _apply(c)
+
+def delete_images(event_id: int, image_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """Remove as imagens e retorna os registros removidos (para limpar arquivos)."""
+    ids = list(dict.fromkeys(i for i in image_ids if i))
+    with transaction(event_id) as c:
+        removed = list(get_images(event_id, ids, c).values())
+        for part in _chunks(ids):
+            c.execute(f"DELETE FROM images WHERE id IN ({', '.join('?' for _ in part)})", part)
+    return removed
+
+def set_discarded(event_id: int, image_ids: Iterable[str], discarded: bool) -> int:
+    ids = list(dict.fromkeys(i for i in image_ids if i))
+    n = 0
+    with transaction(event_id) as c:
+        for part in _chunks(ids):
+            cur = c.execute(f"UPDATE images SET discarded = ? WHERE id IN ({', '.join('?' for _ in part)})",
+                            [1 if discarded else 0] + part)
+            n += cur.rowcount
+    return n
+
+def derivative_keys_in_use(event_id: int, conn: Optional[sqlite3.Connection] = None) -> Set[str]:
+    """Hashes de conteúdo referenciados pelos derivados (miniatura/prévia) do evento."""
+    keys: Set[str] = set()
+    with _use(event_id, conn) as c:
+        for (raw,) in c.execute("SELECT derivatives FROM images WHERE derivatives IS NOT NULL"):
+            for entry in (json.loads(raw) or {}).values():
+                if entry and entry.get("key"):
+                    keys.add(entry["key"])
+    return keys
+
+def derivative_keys_shared(keys: Iterable[str], exclude_event: Optional[int] = None) -> Set[str]:
+    """
+    Quais de 'keys' ainda são referenciadas por derivados de outros eventos (os derivados são
+    endereçados pelo conteúdo e compartilhados entre eventos). Para ao achar todas.
+    """
+    wanted = set(k for k in keys if k)
+    found: Set[str] = set()
+    if not wanted or not os.path.isdir(EVENTS_BASE):
+        return found
+    for name in os.listdir(EVENTS_BASE):
+        if not name.isdigit() or (exclude_event is not None and int(name) == int(exclude_event)):
+            continue
+        if not _has_index(int(name)):
+            continue
+        found |= derivative_keys_in_use(int(name)) & wanted
+        if found == wanted:
+            break
+    return found
+
+def _filter_sql(filters: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    """
+    Filtros da listagem -> cláusulas WHERE. Chaves aceitas: uploader (str ou lista),
+    discarded (bool), sharpness_min/sharpness_max, has_edit (bool), lut_id,
+    uploaded_from/uploaded_to (ISO 8601, inclusivos).
+    """
+    where: List[str] = []
+    args: List[Any] = []
+    f = {k: v for k, v in (filters or {}).items() if v is not None}
+    if "uploader" in f:
+        names = [f["uploader"]] if isinstance(f["uploader"], str) else list(f["uploader"])
+        if names:
+            where.append(f"uploader IN ({', '.join('?' for _ in names)})")
+            args.extend(names)
+    if "discarded" in f:
+        where.append("discarded = ?")
+        args.append(1 if f["discarded"] else 0)
+    if "sharpness_min" in f:
+        where.append("sharpness >= ?")
+        args.append(float(f["sharpness_min"]))
+    if "sharpness_max" in f:
+        where.append("sharpness <= ?")
+        args.append(float(f["sharpness_max"]))
+    if "has_edit" in f:
+        where.append("edited_rel != ''" if f["has_edit"] else "edited_rel = ''")
+    if "lut_id" in f:
+        where.append("applied_lut_id = ?")
+        args.append(int(f["lut_id"]))
+    if "uploaded_from" in f:
+        where.append("uploaded_at >= ?")
+        args.append(str(f["uploaded_from"]))
+    if "uploaded_to" in f:
+        # data sem hora inclui o dia inteiro
+        to = str(f["uploaded_to"])
+        where.append("uploaded_at <= ?")
+        args.append(to + "T99" if len(to) == 10 else to)
+    unknown = set(f) - {"uploader", "discarded", "sharpness_min", "sharpness_max", "has_edit", "lut_id", "uploaded_from", "uploaded_to"}
+    if unknown:
+        raise ValueError(f"Filtro desconhecido: {sorted(unknown)[0]}")
+    return where, args
+
+def _encode_cursor(sort: str, descending: bool, value: Any, seq: int) -> str:
+    raw = json.dumps([sort, 1 if descending else 0, value, seq], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str, sort: str, descending: bool) -> Tuple[Any, int]:
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        c_sort, c_desc, value, seq = json.loads(base64.urlsafe_b64decode(cursor + pad).decode("utf-8"))
+    except Exception:
+        raise ValueError("Cursor inválido.")
+    if c_sort != sort or bool(c_desc) != bool(descending):
+        raise ValueError("Cursor não corresponde à ordenação pedida.")
+    return value, int(seq)
+
+def query_images(event_id: int, filters: Optional[Dict[str, Any]] = None, sort: str = "upload", descending: bool = False,
+                 limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Página de registros filtrados e ordenados (paginação por cursor / keyset, usa os índices
+    da tabela). Retorna (registros, cursor da próxima página ou None). ValueError em parâmetro inválido.
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Ordenação deve ser uma de: {', '.join(SORT_KEYS)}.")
+    col = SORT_KEYS[sort]
+    where, args = _filter_sql(filters or {})
+    op, direction = ("<", "DESC") if descending else (">", "ASC")
+    if cursor:
+        value, seq = _decode_cursor(cursor, sort, descending)
+        if col == "seq":
+            where.append(f"seq {op} ?")
+            args.append(seq)
+        else:
+            where.append(f"({col}, seq) {op} (?, ?)")
+            args.extend([value, seq])
+    order = f"seq {direction}" if col == "seq" else f"{col} {direction}, seq {direction}"
+    sql = "SELECT * FROM images" + (f" WHERE {' AND '.join(where)}" if where else "") + f" ORDER BY {order} LIMIT ?"
+    with _use(event_id, None) as c:
+        rows = c.execute(sql, args + [int(limit) + 1]).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort, descending, last[col], last["seq"])
+    return [_from_row(r) for r in rows], next_cursor
+
+def count_matching(event_id: int, filters: Optional[Dict[str, Any]] = None) -> int:
+    where, args = _filter_sql(filters or {})
+    sql = "SELECT COUNT(*) FROM images" + (f" WHERE {' AND '.join(where)}" if where else "")
+    with _use(event_id, None) as c:
+        return int(c.execute(sql, args).fetchone()[0])
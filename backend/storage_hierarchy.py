@@ -1,14 +1,36 @@
 import os
+import copy
 import json
 import uuid
 import time
-from typing import Dict, Any, List, Optional
+import bisect
+import threading
+from typing import Dict, Any, List, Optional, Set
 
 STORE_DIR = os.path.join(os.path.dirname(__file__), "media", "hierarchy")
 STORE_PATH = os.path.join(STORE_DIR, "hierarchy.json")
 
+# NOVO: a árvore fica em memória por processo (recarregada só quando o arquivo muda), com índices
+# mantidos a cada alteração: nó por id, pai, caminho materializado ("raiz/.../id/") e a lista
+# ordenada dos caminhos — descendentes de um nó = faixa contígua (bisect) com o prefixo dele.
+_lock = threading.RLock()
+_data: Optional[Dict[str, Any]] = None
+_sig = None
+_nodes: Dict[str, Dict[str, Any]] = {}
+_parent: Dict[str, Optional[str]] = {}
+_paths: Dict[str, str] = {}
+_keys: List[str] = []
 
-def _ensure_store() -> Dict[str, Any]:
+
+def _signature():
+    try:
+        st = os.stat(STORE_PATH)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_store() -> Dict[str, Any]:
     os.makedirs(STORE_DIR, exist_ok=True)
     if not os.path.isfile(STORE_PATH):
         data = {"nodes": [], "categories": []}
@@ -27,10 +49,70 @@ def _ensure_store() -> Dict[str, Any]:
     return data
 
 
+def _index_add(node: Dict[str, Any], parent_id: Optional[str]):
+    """Indexa node e sua subárvore (iterativo) abaixo de parent_id."""
+    stack = [(node, parent_id)]
+    while stack:
+        n, pid = stack.pop()
+        nid = str(n.get("id"))
+        _nodes[nid] = n
+        _parent[nid] = pid
+        path = (_paths[pid] if pid is not None else "") + nid + "/"
+        _paths[nid] = path
+        bisect.insort(_keys, path)
+        for c in n.get("children") or []:
+            stack.append((c, nid))
+
+
+def _subtree_range(node_id: str):
+    prefix = _paths[node_id]
+    return bisect.bisect_left(_keys, prefix), bisect.bisect_left(_keys, prefix + "\uffff")
+
+
+def _index_remove(node_id: str) -> List[str]:
+    """Tira node_id e descendentes dos índices; retorna os ids removidos."""
+    lo, hi = _subtree_range(node_id)
+    removed = [k.rstrip("/").rsplit("/", 1)[-1] for k in _keys[lo:hi]]
+    del _keys[lo:hi]
+    for nid in removed:
+        _nodes.pop(nid, None)
+        _parent.pop(nid, None)
+        _paths.pop(nid, None)
+    return removed
+
+
+def _ensure_store() -> Dict[str, Any]:
+    """Árvore atual (em cache; relida e reindexada só se o arquivo mudou). Chamar com _lock."""
+    global _data, _sig
+    with _lock:
+        sig = _signature()
+        if _data is not None and sig is not None and sig == _sig:
+            return _data
+        data = _read_store()
+        _nodes.clear()
+        _parent.clear()
+        _paths.clear()
+        del _keys[:]
+        for n in data["nodes"]:
+            _index_add(n, None)
+        _data, _sig = data, _signature()
+        return data
+
+
 def _save_store(data: Dict[str, Any]) -> None:
+    global _sig
     os.makedirs(STORE_DIR, exist_ok=True)
-    with open(STORE_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    tmp = f"{STORE_PATH}.{os.getpid()}.tmp"
+    with _lock:
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, STORE_PATH)
+            # índices já foram atualizados por quem alterou: não relê o próprio arquivo
+            _sig = _signature()
+        except Exception:
+            _sig = None
+            raise
 
 
 def _gen_id() -> str:
@@ -41,7 +123,58 @@ def list_all() -> Dict[str, Any]:
     """
     Retorna {"nodes": [...], "categories": [...]}
     """
-    return _ensure_store()
+    with _lock:
+        return copy.deepcopy(_ensure_store())
+
+
+def node_ids() -> Set[str]:
+    """Ids de todos os nós (qualquer nível)."""
+    with _lock:
+        _ensure_store()
+        return set(_nodes)
+
+
+def get_path(node_id: str) -> Optional[List[str]]:
+    """Ids da raiz até node_id (inclusive) ou None."""
+    with _lock:
+        _ensure_store()
+        path = _paths.get(str(node_id))
+        return path.rstrip("/").split("/") if path else None
+
+
+def path_names(node_id: str, sep: str = " / ") -> str:
+    """Nomes da raiz até node_id (ex.: "Primeiro Andar / Banheiro")."""
+    with _lock:
+        ids = get_path(node_id) or []
+        return sep.join(str(_nodes[i].get("name") or "") for i in ids)
+
+
+def subtree_ids(node_id: str) -> Optional[List[str]]:
+    """node_id e todos os descendentes (faixa do índice de caminhos) ou None se não existir."""
+    with _lock:
+        _ensure_store()
+        if str(node_id) not in _paths:
+            return None
+        lo, hi = _subtree_range(str(node_id))
+        return [k.rstrip("/").rsplit("/", 1)[-1] for k in _keys[lo:hi]]
+
+
+def subtree_counts(node_id: str, own: Dict[str, int]) -> Optional[Dict[str, Dict[str, int]]]:
+    """
+    Para cada nó da subárvore: {"own": valor do próprio nó, "total": soma na subárvore dele}.
+    own: contagem por id (ex.: ativos por unidade). Uma passada de baixo para cima pelos caminhos.
+    """
+    with _lock:
+        ids = subtree_ids(node_id)
+        if ids is None:
+            return None
+        out = {nid: {"own": int(own.get(nid, 0)), "total": int(own.get(nid, 0))} for nid in ids}
+        # caminhos mais longos primeiro: cada nó soma no pai antes de o pai somar no avô
+        for nid in sorted(ids, key=lambda i: _paths[i].count("/"), reverse=True):
+            pid = _parent.get(nid)
+            if nid != str(node_id) and pid in out:
+                out[pid]["total"] += out[nid]["total"]
+        return out
 
 
 def ensure_category(name: Optional[str]) -> None:
@@ -50,68 +183,38 @@ def ensure_category(name: Optional[str]) -> None:
     name = str(name).strip()
     if not name:
         return
-    data = _ensure_store()
-    cats: List[str] = data.get("categories") or []
-    if not any(c.lower() == name.lower() for c in cats):
-        cats.append(name)
-        data["categories"] = cats
-        _save_store(data)
+    with _lock:
+        data = _ensure_store()
+        cats: List[str] = data.get("categories") or []
+        if not any(c.lower() == name.lower() for c in cats):
+            cats.append(name)
+            data["categories"] = cats
+            _save_store(data)
 
 
 def add_category(name: str) -> List[str]:
     nm = (name or "").strip()
     if not nm:
         return list_all().get("categories", [])
-    data = _ensure_store()
-    cats: List[str] = data.get("categories") or []
-    if not any(c.lower() == nm.lower() for c in cats):
-        cats.append(nm)
-        data["categories"] = cats
-        _save_store(data)
-    return data["categories"]
+    with _lock:
+        data = _ensure_store()
+        cats: List[str] = data.get("categories") or []
+        if not any(c.lower() == nm.lower() for c in cats):
+            cats.append(nm)
+            data["categories"] = cats
+            _save_store(data)
+        return list(data["categories"])
 
 
 def remove_category(name: str) -> List[str]:
     nm = (name or "").strip()
-    data = _ensure_store()
-    cats: List[str] = data.get("categories") or []
-    new_cats = [c for c in cats if c.lower() != nm.lower()]
-    data["categories"] = new_cats
-    _save_store(data)
-    return new_cats
-
-
-def _index_nodes(nodes: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    idx = {}
-    def visit(lst: List[Dict[str, Any]]):
-        for n in lst:
-            idx[str(n.get("id"))] = n
-            ch = n.get("children") or []
-            if ch:
-                visit(ch)
-    visit(nodes)
-    return idx
-
-
-def _delete_recursive(nodes: List[Dict[str, Any]], target_id: str) -> bool:
-    """
-    Remove target e sua subárvore. Retorna True se removeu.
-    """
-    removed = False
-    kept: List[Dict[str, Any]] = []
-    for n in nodes:
-        nid = str(n.get("id"))
-        if nid == target_id:
-            removed = True
-            continue
-        ch = n.get("children") or []
-        if ch:
-            rem_child = _delete_recursive(ch, target_id)
-            n["children"] = [c for c in ch if str(c.get("id")) != target_id]
-            removed = removed or rem_child
-        kept.append(n)
-    nodes[:] = kept
-    return removed
+    with _lock:
+        data = _ensure_store()
+        cats: List[str] = data.get("categories") or []
+        new_cats = [c for c in cats if c.lower() != nm.lower()]
+        data["categories"] = new_cats
+        _save_store(data)
+        return list(new_cats)
 
 
 def _sanitize_responsibles(responsibles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -139,7 +242,22 @@ def add_root(
     category: Optional[str],
     responsibles: List[Dict[str, Any]],
 ) -> Dict[str, Any]:
+    with _lock:
+        return copy.deepcopy(_add_node(None, name, description, color, category, responsibles))
+
+
+def _add_node(
+    parent_id: Optional[str],
+    name: str,
+    description: Optional[str],
+    color: Optional[str],
+    category: Optional[str],
+    responsibles: List[Dict[str, Any]],
+) -> Optional[Dict[str, Any]]:
     data = _ensure_store()
+    parent = _nodes.get(str(parent_id)) if parent_id is not None else None
+    if parent_id is not None and not parent:
+        return None
     ensure_category(category)
     node = {
         "id": _gen_id(),
@@ -149,9 +267,13 @@ def add_root(
         "category": (category or "").strip() or None,
         "responsibles": _sanitize_responsibles(responsibles),
         "children": [],
-        "parentId": None,
+        "parentId": str(parent_id) if parent_id is not None else None,
     }
-    data["nodes"].append(node)
+    if parent is None:
+        data["nodes"].append(node)
+    else:
+        parent.setdefault("children", []).append(node)
+    _index_add(node, node["parentId"])
     _save_store(data)
     return node
 
@@ -164,25 +286,9 @@ def add_child(
     category: Optional[str],
     responsibles: List[Dict[str, Any]],
 ) -> Optional[Dict[str, Any]]:
-    data = _ensure_store()
-    ensure_category(category)
-    idx = _index_nodes(data["nodes"])
-    parent = idx.get(str(parent_id))
-    if not parent:
-        return None
-    node = {
-        "id": _gen_id(),
-        "name": name.strip(),
-        "description": (description or "").strip() or None,
-        "color": (color or "").strip() or None,
-        "category": (category or "").strip() or None,
-        "responsibles": _sanitize_responsibles(responsibles),
-        "children": [],
-        "parentId": str(parent_id),
-    }
-    parent.setdefault("children", []).append(node)
-    _save_store(data)
-    return node
+    with _lock:
+        node = _add_node(str(parent_id), name, description, color, category, responsibles)
+        return copy.deepcopy(node) if node else None
 
 
 def update_node(
@@ -193,11 +299,17 @@ def update_node(
     category: Optional[str] = None,
     responsibles: Optional[List[Dict[str, Any]]] = None,
 ) -> Optional[Dict[str, Any]]:
-    data = _ensure_store()
-    idx = _index_nodes(data["nodes"])
-    node = idx.get(str(node_id))
-    if not node:
-        return None
+    with _lock:
+        data = _ensure_store()
+        node = _nodes.get(str(node_id))
+        if not node:
+            return None
+        _update_fields(node, name, description, color, category, responsibles)
+        _save_store(data)
+        return copy.deepcopy(node)
+
+
+def _update_fields(node, name, description, color, category, responsibles) -> None:
     if name is not None:
         node["name"] = str(name).strip()
     if description is not None:
@@ -211,13 +323,18 @@ def update_node(
             ensure_category(cat)
     if responsibles is not None:
         node["responsibles"] = _sanitize_responsibles(responsibles)
-    _save_store(data)
-    return node
 
 
 def delete_node(node_id: str) -> bool:
-    data = _ensure_store()
-    removed = _delete_recursive(data["nodes"], str(node_id))
-    if removed:
+    """Remove o nó e sua subárvore (pai pelo índice; sem percorrer a árvore)."""
+    nid = str(node_id)
+    with _lock:
+        data = _ensure_store()
+        if nid not in _nodes:
+            return False
+        pid = _parent.get(nid)
+        siblings = data["nodes"] if pid is None else _nodes[pid].get("children") or []
+        siblings[:] = [n for n in siblings if str(n.get("id")) != nid]
+        _index_remove(nid)
         _save_store(data)
-    return removed
\ No newline at end of file
+        return True
\ No newline at end of file
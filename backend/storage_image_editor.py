@@ -1,10 +1,11 @@
 import os
 import io
+import json
 import time
 import uuid
-from typing import Optional, Dict, Any, Tuple, List
+from typing import Optional, Dict, Any, Tuple, List, Union
 
-from PIL import Image, ExifTags
+from PIL import Image, ExifTags, ImageFilter
 import numpy as np
 
 try:
@@ -17,6 +18,11 @@ try:
 except Exception:
     mp = None
 
+# modelos (Haar/pose) carregados uma vez por processo
+from vision import detect_faces, detect_pose
+from storage_encoding import encode, extension, get_policy, source_metadata
+from storage_uploads import StagedUpload, discard
+
 MEDIA_ROOT = os.path.join(os.path.dirname(__file__), "media")
 EDITOR_DIR = os.path.join(MEDIA_ROOT, "editor")
 
@@ -36,30 +42,8 @@ def _from_array(arr: np.ndarray) -> Image.Image:
     arr = np.clip(arr, 0, 255).astype(np.uint8)
     return Image.fromarray(arr)
 
-def _apply_adjustments(
-    img: Image.Image,
-    params: Dict[str, Any],
-) -> Image.Image:
-    """
-    Aplica ajustes básicos:
-    brightness [-100..100]
-    exposure [-2..2] (multiplicador)
-    gamma [0.5..2.0]
-    shadows [-100..100] (ajuste em áreas escuras)
-    highlights [-100..100] (ajuste em áreas claras)
-    curves_strength [0..1] (S-curve)
-    temperature [-100..100]
-    saturation [-100..100]
-    vibrance [-100..100]
-    vignette [0..1]
-    contrast [-100..100]
-    """
-    arr = _to_array(img).copy()
-    if arr.ndim == 2:
-        arr = np.stack([arr, arr, arr], axis=-1)
-    h, w, _ = arr.shape
-    arr_norm = arr / 255.0
-
+def _chain_pre(arr_norm: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    """Etapas por canal antes de sombras/realces: exposure, gamma, brightness."""
     # Exposure (multiplicador)
     exposure = float(params.get("exposure", 0.0))
     if exposure != 0.0:
@@ -74,12 +58,50 @@ def _apply_adjustments(
     brightness = float(params.get("brightness", 0.0))  # -100..100
     if brightness != 0.0:
         arr_norm = np.clip(arr_norm + (brightness / 255.0), 0.0, 1.0)
+    return arr_norm
+
+def _rgb_to_hsv(rgb: np.ndarray) -> np.ndarray:
+    """colorsys.rgb_to_hsv vetorizado: (..., 3) float em 0..1 -> (..., 3) h, s, v em 0..1."""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    delta = maxc - minc
+    gray = delta == 0
+    safe = np.where(gray, 1.0, delta).astype(rgb.dtype)
+    s = np.where(gray, 0.0, delta / np.where(maxc == 0, 1.0, maxc).astype(rgb.dtype))
+    rc = (maxc - r) / safe
+    gc = (maxc - g) / safe
+    bc = (maxc - b) / safe
+    # mesma precedência do colorsys: r, depois g, depois b
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(gray, 0.0, (h / 6.0) % 1.0)
+    return np.stack([h, s, maxc], axis=-1).astype(rgb.dtype, copy=False)
+
+def _hsv_to_rgb(hsv: np.ndarray) -> np.ndarray:
+    """colorsys.hsv_to_rgb vetorizado: (..., 3) h, s, v em 0..1 -> (..., 3) rgb em 0..1."""
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    h6 = h * 6.0
+    i = np.floor(h6)
+    f = h6 - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i.astype(np.int32) % 6
+    # setor do matiz -> (r, g, b) entre v, t, p, q
+    r = np.choose(i, [v, q, p, p, t, v])
+    g = np.choose(i, [t, v, v, q, p, p])
+    b = np.choose(i, [p, p, t, v, v, q])
+    return np.stack([r, g, b], axis=-1).astype(hsv.dtype, copy=False)
+
+def _chain_post(arr_norm: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    """Etapas restantes da cadeia de cor: shadows/highlights, curves, temperature, saturation/vibrance, contrast."""
+    h, w = arr_norm.shape[0], arr_norm.shape[1]
 
     # Shadows/Highlights — compressão em direção aos médios (melhor resposta visual)
     shadows = float(params.get("shadows", 0.0))  # -100..100
     highlights = float(params.get("highlights", 0.0))  # -100..100
     if shadows != 0.0 or highlights != 0.0:
-        lum = np.dot(arr_norm[..., :3], np.array([0.299, 0.587, 0.114], dtype=np.float32))
+        lum = np.dot(arr_norm[..., :3], _LUM_WEIGHTS)
         shadow_mask = (lum < 0.5).astype(np.float32)
         highlight_mask = (lum >= 0.5).astype(np.float32)
         s_gain = shadows / 100.0
@@ -121,43 +143,209 @@ def _apply_adjustments(
         rgb_out = bgr_out[..., ::-1].astype(np.float32) / 255.0
         arr_norm = np.clip(rgb_out, 0.0, 1.0)
     elif saturation != 0.0 or vibrance != 0.0:
-        # Fallback: conversão por colorsys (mais lenta)
-        import colorsys
-        rgb = arr_norm.reshape(-1, 3)
-        hsv = np.zeros_like(rgb)
-        for i in range(rgb.shape[0]):
-            hsv[i] = colorsys.rgb_to_hsv(rgb[i, 0], rgb[i, 1], rgb[i, 2])
+        # Fallback sem OpenCV: HSV vetorizado em NumPy (mesma convenção do colorsys, tudo em 0..1)
+        hsv = _rgb_to_hsv(arr_norm[..., :3])
         if saturation != 0.0:
             s_gain = 1.0 + (saturation / 100.0)
-            hsv[:, 1] = np.clip(hsv[:, 1] * s_gain, 0.0, 1.0)
+            hsv[..., 1] = np.clip(hsv[..., 1] * s_gain, 0.0, 1.0)
         if vibrance != 0.0:
             vib = vibrance / 100.0
-            hsv[:, 1] = np.clip(hsv[:, 1] + vib * (1.0 - hsv[:, 1]), 0.0, 1.0)
-        for i in range(rgb.shape[0]):
-            rgb[i] = colorsys.hsv_to_rgb(hsv[i, 0], hsv[i, 1], hsv[i, 2])
-        arr_norm = rgb.reshape(h, w, 3)
+            hsv[..., 1] = np.clip(hsv[..., 1] + vib * (1.0 - hsv[..., 1]), 0.0, 1.0)
+        rgb = _hsv_to_rgb(hsv)
+        if arr_norm.shape[-1] > 3:
+            arr_norm = np.concatenate([rgb, arr_norm[..., 3:]], axis=-1)
+        else:
+            arr_norm = rgb
 
     # Contrast
     contrast = float(params.get("contrast", 0.0))
     if contrast != 0.0:
         k = 1.0 + (contrast / 100.0)
         arr_norm = np.clip((arr_norm - 0.5) * k + 0.5, 0.0, 1.0)
+    return arr_norm
+
+# Teto de memória temporária (MB) da cadeia de ajustes; imagens maiores são processadas em faixas
+ADJUST_MEMORY_MB = float(os.environ.get("ADJUST_MEMORY_MB", "64"))
+# pico aproximado de bytes por pixel da cadeia em float32 (cópias intermediárias, máscaras, vinheta)
+_CHAIN_BYTES_PER_PIXEL = 112
+
+def _strip_rows(w: int, bytes_per_pixel: int = _CHAIN_BYTES_PER_PIXEL) -> int:
+    """Linhas por faixa para caber em ADJUST_MEMORY_MB."""
+    budget = max(1.0, ADJUST_MEMORY_MB) * 1024 * 1024
+    return max(1, int(budget // (max(w, 1) * bytes_per_pixel)))
+
+def _vignette_mask(h: int, w: int, vignette: float, y0: int = 0, y1: Optional[int] = None) -> np.ndarray:
+    """Máscara elíptica da vinheta para as linhas [y0, y1) (float64, mesmo resultado por faixa ou inteira)."""
+    y1 = h if y1 is None else y1
+    yy = np.arange(y0, y1)[:, None]
+    xx = np.arange(w)[None, :]
+    cx, cy = w / 2.0, h / 2.0
+    rx = (xx - cx) / max(cx, 1e-6)
+    ry = (yy - cy) / max(cy, 1e-6)
+    dist = np.sqrt(rx**2 + ry**2)
+    dist = np.clip(dist, 0.0, 1.0)
+    # força e suavização com potência 2
+    mask = 1.0 - vignette * (dist ** 2)
+    return np.clip(mask, 0.0, 1.0)
 
-    # Vignette — máscara elíptica que respeita proporção da imagem
+def _apply_adjustments(
+    img: Image.Image,
+    params: Dict[str, Any],
+    compiled: Optional["CompiledAdjustments"] = None,
+) -> Image.Image:
+    """
+    Aplica ajustes básicos:
+    brightness [-100..100]
+    exposure [-2..2] (multiplicador)
+    gamma [0.5..2.0]
+    shadows [-100..100] (ajuste em áreas escuras)
+    highlights [-100..100] (ajuste em áreas claras)
+    curves_strength [0..1] (S-curve)
+    temperature [-100..100]
+    saturation [-100..100]
+    vibrance [-100..100]
+    vignette [0..1]
+    contrast [-100..100]
+    'compiled' (opcional): preset pré-compilado (ver compile_adjustments) para a cadeia de cor.
+    """
+    if compiled is not None and img.mode in ("RGB", "L"):
+        return _apply_compiled(img, params, compiled)
+    # processamento em faixas de linhas: todas as etapas são por pixel (e a vinheta é
+    # calculada por faixa), então o resultado é idêntico ao da imagem inteira
+    arr = np.asarray(img)
+    h, w = arr.shape[0], arr.shape[1]
+    channels = 3 if arr.ndim == 2 else arr.shape[2]
     vignette = float(params.get("vignette", 0.0))
-    if vignette > 0.0:
-        yy, xx = np.mgrid[0:h, 0:w]
-        cx, cy = w / 2.0, h / 2.0
-        rx = (xx - cx) / max(cx, 1e-6)
-        ry = (yy - cy) / max(cy, 1e-6)
-        dist = np.sqrt(rx**2 + ry**2)
-        dist = np.clip(dist, 0.0, 1.0)
-        # força e suavização com potência 2
-        mask = 1.0 - vignette * (dist ** 2)
-        mask = np.clip(mask, 0.0, 1.0)
-        arr_norm *= mask[..., None]
-
-    return _from_array((arr_norm * 255.0))
+    out = np.empty((h, w, channels), dtype=np.uint8)
+    rows = _strip_rows(w)
+    for y0 in range(0, h, rows):
+        y1 = min(h, y0 + rows)
+        block = arr[y0:y1].astype(np.float32)
+        if block.ndim == 2:
+            block = np.stack([block, block, block], axis=-1)
+        arr_norm = block / 255.0
+
+        arr_norm = _chain_post(_chain_pre(arr_norm, params), params)
+
+        # Vignette — máscara elíptica que respeita proporção da imagem
+        if vignette > 0.0:
+            arr_norm *= _vignette_mask(h, w, vignette, y0, y1)[..., None]
+
+        out[y0:y1] = np.clip(arr_norm * 255.0, 0, 255).astype(np.uint8)
+    return Image.fromarray(out)
+
+# --------- Preset compilado (LUT 1D/3D) ---------
+_LUM_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+# pico aproximado de bytes por pixel da aplicação do LUT com vinheta/células exatas
+_LUT_BYTES_PER_PIXEL = 48
+
+class CompiledAdjustments:
+    """
+    Cadeia de cor (tudo menos a vinheta) avaliada uma única vez:
+    - "1d": uma tabela 256x3 por canal (exata) quando só há ajustes por canal;
+    - "3d": grade size³ aplicada com interpolação trilinear (ImageFilter.Color3DLUT)
+      quando há mistura de canais (shadows/highlights, saturation/vibrance).
+      Células onde a cadeia é descontínua (limiar de luminância de shadows/highlights,
+      eixo neutro na saturação/vibrance) são recalculadas de forma exata.
+    """
+
+    def __init__(self, kind: str, table: np.ndarray, size: int = 256, exact_cells: Optional[np.ndarray] = None, params: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.table = table
+        self.size = size
+        self.exact_cells = exact_cells
+        self.params = dict(params or {})
+        # tabela final uint8 (mesma conversão de _from_array)
+        self.table_u8 = np.clip(table * 255.0, 0, 255).astype(np.uint8) if kind == "1d" else None
+        # Color3DLUT arredonda para 8 bits; _from_array trunca: desloca meio nível para coincidir
+        self.filter = ImageFilter.Color3DLUT(size, table - np.float32(0.5 / 255.0)) if kind == "3d" else None
+        if exact_cells is not None:
+            pos = np.arange(256, dtype=np.float32) * np.float32((size - 1) / 255.0)
+            self._cell = np.minimum(pos.astype(np.int32), size - 2)
+
+    def _exact_hits(self, block: np.ndarray) -> Optional[np.ndarray]:
+        if self.exact_cells is None:
+            return None
+        n = self.size - 1
+        cell = (self._cell[block[..., 2]] * n + self._cell[block[..., 1]]) * n + self._cell[block[..., 0]]
+        hit = self.exact_cells[cell]
+        return hit if hit.any() else None
+
+    def _exact(self, pixels: np.ndarray) -> np.ndarray:
+        px = pixels.astype(np.float32)[None, ...] / 255.0
+        return _chain_post(_chain_pre(px, self.params), self.params)[0]
+
+    def apply(self, arr: np.ndarray, vignette: float = 0.0) -> np.ndarray:
+        """arr: (h, w, 3) uint8 -> (h, w, 3) uint8 com a cadeia de cor e a vinheta."""
+        h, w, _ = arr.shape
+        if self.kind == "1d" and vignette <= 0.0:
+            out = np.empty_like(arr)
+            for c in range(3):
+                out[..., c] = self.table_u8[:, c][arr[..., c]]
+            return out
+        base = np.asarray(Image.fromarray(arr).filter(self.filter)) if self.kind == "3d" else None
+        if base is not None and vignette <= 0.0 and self.exact_cells is None:
+            return base
+        out = np.empty((h, w, 3), dtype=np.uint8)
+        rows = _strip_rows(w, _LUT_BYTES_PER_PIXEL)
+        for y0 in range(0, h, rows):
+            y1 = min(h, y0 + rows)
+            block = arr[y0:y1]
+            hit = self._exact_hits(block) if base is not None else None
+            if vignette <= 0.0:
+                # só 3D com células exatas chega aqui
+                out[y0:y1] = base[y0:y1]
+                if hit is not None:
+                    out[y0:y1][hit] = np.clip(self._exact(block[hit]) * 255.0, 0, 255).astype(np.uint8)
+                continue
+            if base is None:
+                vals = np.empty(block.shape, dtype=np.float32)
+                for c in range(3):
+                    vals[..., c] = self.table[:, c][block[..., c]]
+            else:
+                # centro do nível de 8 bits: após *255 e truncamento volta ao mesmo valor
+                vals = (base[y0:y1].astype(np.float32) + np.float32(0.5)) / np.float32(255.0)
+                if hit is not None:
+                    vals[hit] = self._exact(block[hit])
+            vals *= _vignette_mask(h, w, vignette, y0, y1)[..., None]
+            out[y0:y1] = np.clip(vals * 255.0, 0, 255).astype(np.uint8)
+        return out
+
+def _needs_3d(params: Dict[str, Any]) -> bool:
+    return any(float(params.get(k, 0.0)) != 0.0 for k in ("shadows", "highlights", "saturation", "vibrance"))
+
+def compile_adjustments(params: Dict[str, Any], size: int = 33) -> CompiledAdjustments:
+    """Compila os ajustes de cor de um preset em LUT (1D exata ou 3D size³, size entre 2 e 65)."""
+    params = dict(params or {})
+    if not _needs_3d(params):
+        ramp = np.arange(256, dtype=np.float32) / 255.0
+        grid = np.repeat(ramp[:, None], 3, axis=1)[None, ...]  # (1, 256, 3)
+        table = _chain_post(_chain_pre(grid, params), params)[0]
+        return CompiledAdjustments("1d", np.ascontiguousarray(table, dtype=np.float32), params=params)
+    size = int(max(2, min(65, size)))
+    axis = np.arange(size, dtype=np.float32) / np.float32(size - 1)
+    # ordem do Color3DLUT: R varia mais rápido, B mais devagar
+    bb, gg, rr = np.meshgrid(axis, axis, axis, indexing="ij")
+    grid = np.stack([rr, gg, bb], axis=-1).reshape(size * size, size, 3)
+    pre = _chain_pre(grid, params)
+    exact = np.zeros((size - 1,) * 3, dtype=bool)  # índices [b, g, r]
+    if float(params.get("shadows", 0.0)) != 0.0 or float(params.get("highlights", 0.0)) != 0.0:
+        # lum(pre(rgb)) é monótona por canal: a célula cruza o limiar 0.5 se os cantos (0,0,0) e (1,1,1) discordam
+        side = (np.dot(pre, _LUM_WEIGHTS) < 0.5).reshape(size, size, size)
+        exact |= side[:-1, :-1, :-1] != side[1:, 1:, 1:]
+    if float(params.get("saturation", 0.0)) != 0.0 or float(params.get("vibrance", 0.0)) != 0.0:
+        # perto do eixo neutro o matiz é indefinido (a vibrance colore cinzas): células vizinhas da diagonal
+        ib, ig, ir = np.meshgrid(*(np.arange(size - 1),) * 3, indexing="ij")
+        spread = np.maximum(np.maximum(ir, ig), ib) - np.minimum(np.minimum(ir, ig), ib)
+        exact |= spread <= 1
+    table = _chain_post(pre, params).reshape(-1, 3)
+    return CompiledAdjustments("3d", np.ascontiguousarray(table, dtype=np.float32), size=size,
+                               exact_cells=exact.reshape(-1) if exact.any() else None, params=params)
+
+def _apply_compiled(img: Image.Image, params: Dict[str, Any], compiled: CompiledAdjustments) -> Image.Image:
+    arr = np.asarray(img.convert("RGB") if img.mode != "RGB" else img)
+    return Image.fromarray(compiled.apply(arr, float(params.get("vignette", 0.0))))
+
 
 def _compute_histogram_rgb(img: Image.Image) -> Dict[str, List[int]]:
     if img.mode != "RGB":
@@ -210,16 +398,15 @@ def _detect_pose_landmarks(img: Image.Image) -> List[Dict[str, Any]]:
     if mp is None:
         return []
     arr = np.asarray(img.convert("RGB"))
-    mp_pose = mp.solutions.pose
-    with mp_pose.Pose(static_image_mode=True, model_complexity=1, enable_segmentation=False) as pose:
-        res = pose.process(arr)
-        if not res.pose_landmarks:
-            return []
-        landmarks = []
-        for i, lm in enumerate(res.pose_landmarks.landmark):
-            name = _POSE_NAMES[i] if i < len(_POSE_NAMES) else f"lm_{i}"
-            landmarks.append({"name": name, "x": float(lm.x), "y": float(lm.y), "visibility": float(getattr(lm, "visibility", 0.0))})
-        return landmarks
+    # grafo da pose reutilizado (ver vision.py)
+    pose_landmarks = detect_pose(arr)
+    if not pose_landmarks:
+        return []
+    landmarks = []
+    for i, lm in enumerate(pose_landmarks.landmark):
+        name = _POSE_NAMES[i] if i < len(_POSE_NAMES) else f"lm_{i}"
+        landmarks.append({"name": name, "x": float(lm.x), "y": float(lm.y), "visibility": float(getattr(lm, "visibility", 0.0))})
+    return landmarks
 
 def _max_aspect_rect(w: int, h: int, aspect: float) -> Tuple[int, int]:
     if aspect <= 0:
@@ -245,20 +432,9 @@ def _crop_normal(img: Image.Image, rect: Optional[Dict[str, int]]) -> Image.Imag
     h = max(1, min(h, img.height - y))
     return img.crop((x, y, x + w, y + h))
 
-def _crop_face(img: Image.Image, aspect: float = 1.0, scale: float = 1.0, anchor: str = "center") -> Image.Image:
-    """
-    Recorta um retângulo com aspecto 'aspect' centrado na âncora.
-    Escala funciona como zoom: 1.0 = área máxima, 2.0 = área metade (zoom-in).
-    """
-    # Primeiro tenta âncora da pose; se não houver, tenta face; senão, centro
-    pt = _detect_pose_anchor(img, anchor) if anchor else None
-    if pt is None:
-        pt = _detect_face_anchor(img, anchor=anchor)
-    if pt is None:
-        pt = (img.width // 2, img.height // 2)
+def _crop_rect_at(w: int, h: int, pt: Tuple[int, int], aspect: float = 1.0, scale: float = 1.0) -> Tuple[int, int, int, int]:
+    """Retângulo (x0, y0, x1, y1) com aspecto 'aspect' centrado em 'pt' (ver _crop_face)."""
     cx, cy = pt
-
-    w, h = img.width, img.height
     aspect = float(aspect) if aspect > 0 else 1.0
     # rect máximo que respeita aspecto
     max_w, max_h = _max_aspect_rect(w, h, aspect)
@@ -274,15 +450,45 @@ def _crop_face(img: Image.Image, aspect: float = 1.0, scale: float = 1.0, anchor
     # clamp dentro da imagem
     x = max(0, min(x, w - final_w))
     y = max(0, min(y, h - final_h))
+    return (x, y, x + final_w, y + final_h)
 
-    return img.crop((x, y, x + final_w, y + final_h))
-
-def save_original(file_bytes: bytes, filename: str) -> Dict[str, Any]:
+def _crop_face(img: Image.Image, aspect: float = 1.0, scale: float = 1.0, anchor: str = "center", analysis: Optional[Dict[str, Any]] = None) -> Image.Image:
+    """
+    Recorta um retângulo com aspecto 'aspect' centrado na âncora.
+    Escala funciona como zoom: 1.0 = área máxima, 2.0 = área metade (zoom-in).
+    'analysis' (opcional, ver analyze_image) evita rodar os detectores de novo.
+    """
+    if not _analysis_valid(analysis, img):
+        analysis = None
+    # Primeiro tenta âncora da pose; se não houver, tenta face; senão, centro
+    if analysis is not None:
+        lms = _analysis_landmarks(analysis)
+        pt = _pose_anchor_from(lms, img.width, img.height, anchor) if anchor else None
+        if pt is None:
+            pt = _face_anchor_from(analysis.get("faces") or [], anchor)
+    else:
+        pt = _detect_pose_anchor(img, anchor) if anchor else None
+        if pt is None:
+            pt = _detect_face_anchor(img, anchor=anchor)
+    if pt is None:
+        pt = (img.width // 2, img.height // 2)
+    return img.crop(_crop_rect_at(img.width, img.height, pt, aspect, scale))
+
+def save_original(file_bytes: Union[bytes, StagedUpload], filename: str) -> Dict[str, Any]:
+    """Grava a cópia de trabalho (PNG, até 1920x1080). Aceita bytes ou upload em disco (decodificado do arquivo)."""
+    if isinstance(file_bytes, StagedUpload):
+        try:
+            with Image.open(file_bytes.path) as src:
+                return _save_original_image(src)
+        finally:
+            discard(file_bytes.path)
+    return _save_original_image(Image.open(io.BytesIO(file_bytes)))
+
+def _save_original_image(img: Image.Image) -> Dict[str, Any]:
     _ensure_dir(EDITOR_DIR)
     image_id = _gen_id()
     img_dir = os.path.join(EDITOR_DIR, image_id)
     _ensure_dir(img_dir)
-    img = Image.open(io.BytesIO(file_bytes))
 
     # RESIZE: limitar a imagem a um bounding box de 1920x1080 mantendo proporção
     if hasattr(Image, "Resampling"):
@@ -290,13 +496,15 @@ def save_original(file_bytes: bytes, filename: str) -> Dict[str, Any]:
     else:
         resample = getattr(Image, "LANCZOS", Image.ANTIALIAS)
     max_w, max_h = 1920, 1080
+    # ICC/EXIF seguem até as prévias (orientação zerada: o editor trabalha nos pixels como estão)
+    metadata = source_metadata(img, reset_orientation=True)
     img = img.convert("RGB")
     img.thumbnail((max_w, max_h), resample)
 
     orig_name = _unique_name("original", "png")
     orig_path = os.path.join(img_dir, orig_name)
     # salvar com compressão leve para velocidade
-    img.save(orig_path, format="PNG", compress_level=1)
+    img.save(orig_path, format="PNG", compress_level=1, **metadata)
 
     rel = os.path.relpath(orig_path, MEDIA_ROOT).replace(os.sep, "/")
     return {"image_id": image_id, "original_rel": rel, "original_url": f"static/{rel}", "meta": _read_metadata(img)}
@@ -304,13 +512,13 @@ def save_original(file_bytes: bytes, filename: str) -> Dict[str, Any]:
 def _detect_face_anchor(img: Image.Image, anchor: str = "center") -> Optional[Tuple[int, int]]:
     if cv2 is None:
         return None
-    arr = np.asarray(img.convert("RGB"))
-    gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-    faces = cascade.detectMultiScale(gray, 1.2, 6)
+    return _face_anchor_from(detect_faces(np.asarray(img.convert("RGB"))), anchor)
+
+def _face_anchor_from(faces: List[Any], anchor: str = "center") -> Optional[Tuple[int, int]]:
+    """Âncora no maior rosto da lista (x, y, w, h)."""
     if len(faces) == 0:
         return None
-    x, y, w, h = sorted(faces, key=lambda f: f[2]*f[3], reverse=True)[0]
+    x, y, w, h = (int(v) for v in sorted(faces, key=lambda f: f[2]*f[3], reverse=True)[0])
     cx, cy = x + w // 2, y + h // 2
     if anchor == "eyes":
         cy = y + int(h * 0.36)
@@ -323,10 +531,7 @@ def _detect_face_anchor(img: Image.Image, anchor: str = "center") -> Optional[Tu
 def _detect_face_bbox(img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
     if cv2 is None:
         return None
-    arr = np.asarray(img.convert("RGB"))
-    gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-    faces = cascade.detectMultiScale(gray, 1.2, 6)
+    faces = detect_faces(np.asarray(img.convert("RGB")))
     if len(faces) == 0:
         return None
     # maior rosto
@@ -337,21 +542,19 @@ def _detect_face_bbox(img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
 def _detect_faces(img: Image.Image) -> List[Tuple[int, int, int, int]]:
     if cv2 is None:
         return []
-    arr = np.asarray(img.convert("RGB"))
-    gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-    faces = cascade.detectMultiScale(gray, 1.2, 6)
-    return [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in faces]
+    return detect_faces(np.asarray(img.convert("RGB")))
 
 def _detect_pose_anchor(img: Image.Image, anchor: str) -> Optional[Tuple[int, int]]:
     """Usa landmarks da pose para obter a âncora. Coordenadas normalizadas -> pixels."""
     if mp is None:
         return None
-    lms = _detect_pose_landmarks(img)
+    return _pose_anchor_from(_detect_pose_landmarks(img), img.width, img.height, anchor)
+
+def _pose_anchor_from(lms: List[Dict[str, Any]], w: int, h: int, anchor: str) -> Optional[Tuple[int, int]]:
+    """Âncora a partir de landmarks normalizados (0..1) numa imagem w x h."""
     if not lms:
         return None
     # Se pedirem 'center', usa o centro entre quadris; caso contrário, usa ponto específico
-    w, h = img.width, img.height
     name_map = {lm["name"]: lm for lm in lms}
     if anchor in name_map:
         lm = name_map[anchor]
@@ -370,7 +573,7 @@ def _detect_pose_anchor(img: Image.Image, anchor: str) -> Optional[Tuple[int, in
     return None
 
 # ADD: auto-crop por pose/face com âncora dinâmica; retorna imagem cortada ou None para não cortar
-def _auto_crop_by_pose(img: Image.Image, aspect: float = 1.0, scale: float = 1.0) -> Optional[Image.Image]:
+def _auto_crop_by_pose(img: Image.Image, aspect: float = 1.0, scale: float = 1.0, analysis: Optional[Dict[str, Any]] = None) -> Optional[Image.Image]:
     """
     Regra:
     - Se houver >1 faces detectadas: não corta.
@@ -378,24 +581,99 @@ def _auto_crop_by_pose(img: Image.Image, aspect: float = 1.0, scale: float = 1.0
     - Se houver pose: ancora em 'shoulders_center'.
     - Caso contrário, se houver exatamente 1 face: ancora no centro da face.
     Usa a proporção 'aspect' e zoom 'scale' (1.0 = máximo, 2.0 = zoom-in).
+    'analysis' (opcional, ver analyze_image) evita rodar os detectores de novo.
     """
-    faces = _detect_faces(img)
+    if not _analysis_valid(analysis, img):
+        analysis = analyze_image(img)
+    box = _auto_crop_box(img.width, img.height, analysis, aspect=aspect, scale=scale)
+    return img.crop(box) if box is not None else None
+
+def _auto_crop_box(w: int, h: int, analysis: Dict[str, Any], aspect: float = 1.0, scale: float = 1.0) -> Optional[Tuple[int, int, int, int]]:
+    """Mesma regra de _auto_crop_by_pose sobre uma análise pronta; retorna o retângulo ou None."""
+    faces = analysis.get("faces") or []
     if len(faces) > 1:
         return None
 
     # Se pose disponível, preferir âncora pelos ombros
-    pose_anchor = _detect_pose_anchor(img, "shoulders_center")
+    pose_anchor = _pose_anchor_from(_analysis_landmarks(analysis), w, h, "shoulders_center")
     if pose_anchor is not None:
-        return _crop_face(img, aspect=aspect, scale=scale, anchor="shoulders_center")
+        return _crop_rect_at(w, h, pose_anchor, aspect, scale)
 
     # Sem pose: se exatamente 1 face, ancora no centro da face
     if len(faces) == 1:
-        return _crop_face(img, aspect=aspect, scale=scale, anchor="center")
+        return _crop_rect_at(w, h, _face_anchor_from(faces, "center"), aspect, scale)
 
     # Sem pessoas detectadas
     return None
 
-def process_image(image_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+# --------- Análise única por imagem (rostos, pose, ROI do sujeito) ---------
+ANALYSIS_VERSION = 1
+
+def analyze_image(img: Image.Image) -> Dict[str, Any]:
+    """
+    Roda os detectores uma única vez e devolve um registro serializável (JSON):
+    - faces: [[x, y, w, h], ...] em pixels
+    - pose: [[x, y, visibility], ...] normalizados (ordem de _POSE_NAMES)
+    - subject_roi: [x0, y0, x1, y1] usado na nitidez do sujeito
+    Reutilizado por crop, nitidez, busca facial e reedições (ver storage_gallery).
+    """
+    w, h = img.width, img.height
+    faces = [list(f) for f in _detect_faces(img)]
+    lms = _detect_pose_landmarks(img) if mp is not None else []
+    analysis = {
+        "v": ANALYSIS_VERSION,
+        "size": [w, h],
+        "faces": faces,
+        "pose": [[round(lm["x"], 5), round(lm["y"], 5), round(lm["visibility"], 4)] for lm in lms],
+    }
+    analysis["subject_roi"] = list(_subject_roi(w, h, faces, lms))
+    return analysis
+
+def _analysis_valid(analysis: Optional[Dict[str, Any]], img: Image.Image) -> bool:
+    return bool(analysis) and analysis.get("v") == ANALYSIS_VERSION and list(analysis.get("size") or []) == [img.width, img.height]
+
+def _analysis_landmarks(analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out = []
+    for i, (x, y, vis) in enumerate(analysis.get("pose") or []):
+        name = _POSE_NAMES[i] if i < len(_POSE_NAMES) else f"lm_{i}"
+        out.append({"name": name, "x": float(x), "y": float(y), "visibility": float(vis)})
+    return out
+
+def _shift_analysis(analysis: Dict[str, Any], box: Tuple[int, int, int, int]) -> Dict[str, Any]:
+    """Converte a análise para as coordenadas do recorte 'box' (x0, y0, x1, y1)."""
+    W, H = analysis["size"]
+    x0, y0, x1, y1 = box
+    cw, ch = max(1, x1 - x0), max(1, y1 - y0)
+    faces = []
+    for fx, fy, fw, fh in analysis.get("faces") or []:
+        ax, ay = max(fx, x0), max(fy, y0)
+        bx, by = min(fx + fw, x1), min(fy + fh, y1)
+        if bx > ax and by > ay:
+            faces.append([ax - x0, ay - y0, bx - ax, by - ay])
+    pose = [[(x * W - x0) / cw, (y * H - y0) / ch, vis] for x, y, vis in analysis.get("pose") or []]
+    shifted = {"v": analysis.get("v"), "size": [cw, ch], "faces": faces, "pose": pose}
+    shifted["subject_roi"] = list(_subject_roi(cw, ch, faces, _analysis_landmarks(shifted)))
+    return shifted
+
+def _editor_analysis(img_dir: str, original_name: str, img: Image.Image) -> Dict[str, Any]:
+    """Análise do original do editor, calculada uma vez e guardada em analysis.json (reedições não redetectam)."""
+    path = os.path.join(img_dir, "analysis.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("original") == original_name and _analysis_valid(cached.get("analysis"), img):
+            return cached["analysis"]
+    except Exception:
+        pass
+    analysis = analyze_image(img)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"original": original_name, "analysis": analysis}, f)
+    except Exception:
+        pass
+    return analysis
+
+def process_image(image_id: str, params: Dict[str, Any], compiled: Optional[CompiledAdjustments] = None) -> Dict[str, Any]:
     img_dir = os.path.join(EDITOR_DIR, image_id)
     if not os.path.isdir(img_dir):
         raise FileNotFoundError("Imagem não encontrada.")
@@ -405,6 +683,7 @@ def process_image(image_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
     candidates.sort()
     orig_path = os.path.join(img_dir, candidates[-1])
     img = Image.open(orig_path)
+    metadata = source_metadata(img)
 
     # Crop
     crop_mode = params.get("crop", {}).get("mode", "none")
@@ -415,15 +694,17 @@ def process_image(image_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
         aspect = float(params.get("crop", {}).get("aspect", 1.0))
         scale = float(params.get("crop", {}).get("scale", 1.0))
         anchor = str(params.get("crop", {}).get("anchor", "center"))
-        img = _crop_face(img, aspect=aspect, scale=scale, anchor=anchor)
+        img = _crop_face(img, aspect=aspect, scale=scale, anchor=anchor, analysis=_editor_analysis(img_dir, candidates[-1], img))
 
-    # Ajustes
-    out = _apply_adjustments(img, params)
+    # Ajustes (preset compilado quando disponível)
+    out = _apply_adjustments(img, params, compiled)
 
-    out_name = _unique_name("preview", "png")
+    # formato/qualidade da política 'preview' (ver storage_encoding)
+    encoding = get_policy()["preview"]
+    out_name = _unique_name("preview", extension(encoding))
     out_path = os.path.join(img_dir, out_name)
-    # salvar preview com compressão leve para reduzir latência
-    out.save(out_path, format="PNG", compress_level=1)
+    with open(out_path, "wb") as fw:
+        fw.write(encode(out, encoding, metadata))
 
     rel = os.path.relpath(out_path, MEDIA_ROOT).replace(os.sep, "/")
     hist = _compute_histogram_rgb(out)
@@ -449,7 +730,7 @@ def get_metadata(image_id: str) -> Dict[str, Any]:
 
 def get_histogram_and_sharpness(image_id: str) -> Dict[str, Any]:
     img_dir = os.path.join(EDITOR_DIR, image_id)
-    previews = [f for f in os.listdir(img_dir) if f.startswith("preview_") and f.endswith(".png")]
+    previews = [f for f in os.listdir(img_dir) if f.startswith("preview_") and f.endswith((".png", ".jpg", ".webp"))]
     if previews:
         previews.sort()
         path = os.path.join(img_dir, previews[-1])
@@ -474,54 +755,69 @@ def get_pose_landmarks(image_id: str) -> Dict[str, Any]:
     lms = _detect_pose_landmarks(img)
     return {"landmarks": lms, "dimensions": {"width": img.width, "height": img.height}}
 
-def _compute_subject_sharpness(img: Image.Image) -> float:
+def _pose_roi(w: int, h: int, lms: List[Dict[str, Any]]) -> Optional[Tuple[int, int, int, int]]:
+    """ROI ao redor do tronco (ombros): distância entre ombros dimensiona a ROI."""
+    if not lms:
+        return None
+    name_map = {lm["name"]: lm for lm in lms}
+    ls, rs = name_map.get("left_shoulder"), name_map.get("right_shoulder")
+    if not (ls and rs):
+        return None
+    cx = int((ls["x"] + rs["x"]) * 0.5 * w)
+    cy = int((ls["y"] + rs["y"]) * 0.5 * h)
+    dist = int(np.hypot((ls["x"] - rs["x"]) * w, (ls["y"] - rs["y"]) * h))
+    roi_w = max(80, min(w, int(dist * 1.2)))
+    roi_h = max(80, min(h, int(dist * 1.6)))
+    # desce um pouco para pegar o tórax
+    cy_offset = int(0.4 * dist)
+    x = max(0, min(w - roi_w, cx - roi_w // 2))
+    y = max(0, min(h - roi_h, cy + cy_offset - roi_h // 2))
+    return (x, y, x + roi_w, y + roi_h)
+
+def _face_roi(w: int, h: int, bbox: Optional[Tuple[int, int, int, int]]) -> Optional[Tuple[int, int, int, int]]:
+    """ROI ao redor da face ampliada."""
+    if not bbox:
+        return None
+    x, y, fw, fh = bbox
+    cx, cy = x + fw // 2, y + fh // 2
+    roi_w = max(80, int(fw * 1.6))
+    roi_h = max(80, int(fh * 2.0))
+    x = max(0, min(w - roi_w, cx - roi_w // 2))
+    y = max(0, min(h - roi_h, cy - roi_h // 2))
+    return (x, y, x + roi_w, y + roi_h)
+
+def _center_roi(w: int, h: int) -> Tuple[int, int, int, int]:
+    roi_w = int(w * 0.4)
+    roi_h = int(h * 0.6)
+    x = (w - roi_w) // 2
+    y = (h - roi_h) // 2
+    return (x, y, x + roi_w, y + roi_h)
+
+def _subject_roi(w: int, h: int, faces: List[Any], lms: List[Dict[str, Any]]) -> Tuple[int, int, int, int]:
+    largest = tuple(int(v) for v in sorted(faces, key=lambda f: f[2] * f[3], reverse=True)[0]) if faces else None
+    return _pose_roi(w, h, lms) or _face_roi(w, h, largest) or _center_roi(w, h)
+
+def _compute_subject_sharpness(img: Image.Image, analysis: Optional[Dict[str, Any]] = None) -> float:
     """
     Calcula a nitidez do SUJEITO:
     - Se pose disponível: ROI ao redor do tronco (ombros).
     - Se face disponível: ROI ao redor da face ampliada.
     - Fallback: ROI central.
     Métrica: variância do Laplaciano (OpenCV) na ROI, ou gradiente (fallback).
+    'analysis' (opcional, nas coordenadas de 'img'): usa a ROI já calculada, sem detectores.
     """
     w, h = img.width, img.height
 
-    # 1) Tenta pose: usa distância entre ombros para dimensionar ROI
-    roi = None
-    if mp is not None:
-        lms = _detect_pose_landmarks(img)
-        if lms:
-            name_map = {lm["name"]: lm for lm in lms}
-            ls, rs = name_map.get("left_shoulder"), name_map.get("right_shoulder")
-            if ls and rs:
-                cx = int((ls["x"] + rs["x"]) * 0.5 * w)
-                cy = int((ls["y"] + rs["y"]) * 0.5 * h)
-                dist = int(np.hypot((ls["x"] - rs["x"]) * w, (ls["y"] - rs["y"]) * h))
-                roi_w = max(80, min(w, int(dist * 1.2)))
-                roi_h = max(80, min(h, int(dist * 1.6)))
-                # desce um pouco para pegar o tórax
-                cy_offset = int(0.4 * dist)
-                x = max(0, min(w - roi_w, cx - roi_w // 2))
-                y = max(0, min(h - roi_h, cy + cy_offset - roi_h // 2))
-                roi = img.crop((x, y, x + roi_w, y + roi_h))
-
-    # 2) Tenta face
-    if roi is None:
-        bbox = _detect_face_bbox(img)
-        if bbox:
-            x, y, fw, fh = bbox
-            cx, cy = x + fw // 2, y + fh // 2
-            roi_w = max(80, int(fw * 1.6))
-            roi_h = max(80, int(fh * 2.0))
-            x = max(0, min(w - roi_w, cx - roi_w // 2))
-            y = max(0, min(h - roi_h, cy - roi_h // 2))
-            roi = img.crop((x, y, x + roi_w, y + roi_h))
-
-    # 3) Fallback central
-    if roi is None:
-        roi_w = int(w * 0.4)
-        roi_h = int(h * 0.6)
-        x = (w - roi_w) // 2
-        y = (h - roi_h) // 2
-        roi = img.crop((x, y, x + roi_w, y + roi_h))
+    if _analysis_valid(analysis, img):
+        box = tuple(analysis["subject_roi"])
+    else:
+        # 1) Tenta pose; 2) Tenta face; 3) Fallback central
+        box = _pose_roi(w, h, _detect_pose_landmarks(img)) if mp is not None else None
+        if box is None:
+            box = _face_roi(w, h, _detect_face_bbox(img))
+        if box is None:
+            box = _center_roi(w, h)
+    roi = img.crop(box)
 
     # Métrica na ROI
     if cv2 is not None:
@@ -532,4 +828,4 @@ def _compute_subject_sharpness(img: Image.Image) -> float:
     arr = np.asarray(roi.convert("L")).astype(np.float32)
     gy, gx = np.gradient(arr)
     grad_mag = np.sqrt(gx**2 + gy**2)
-    return float(np.var(grad_mag))
\ No newline at end of file
+    return float(np.var(grad_mag))
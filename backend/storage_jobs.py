@@ -0,0 +1,308 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
+JOBS_DIR = os.path.join(MEDIA_DIR, "jobs")
+JOBS_DB = os.path.join(JOBS_DIR, "jobs.db")
+
+# status de job: queued -> running -> completed | failed | cancelled
+# status de item: pending -> done | failed | cancelled
+FINAL_STATUSES = ("completed", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    runner TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    item_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+_db_lock = threading.Lock()
+_initialized = False
+# kind -> handler(job, items_pendentes, ctx)
+_handlers: Dict[str, Callable[[Dict[str, Any], List[Dict[str, Any]], "JobContext"], None]] = {}
+# threads deste processo; quem executa um job é decidido no banco (ver _claim)
+_running: Dict[str, threading.Thread] = {}
+_running_lock = threading.Lock()
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    if not _initialized:
+        with _db_lock:
+            if not _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                cols = {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}
+                if "runner" not in cols:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN runner TEXT")
+                conn.commit()
+                _initialized = True
+    return conn
+
+def _job_row(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["params"] = json.loads(job.get("params") or "{}")
+    job["cancel_requested"] = bool(job.get("cancel_requested"))
+    return job
+
+def _item_row(row: sqlite3.Row) -> Dict[str, Any]:
+    item = dict(row)
+    item.pop("job_id", None)
+    item["result"] = json.loads(item["result"]) if item.get("result") else None
+    return item
+
+def register_handler(kind: str, handler: Callable[[Dict[str, Any], List[Dict[str, Any]], "JobContext"], None]):
+    """Registra a função que executa jobs de um tipo (ex.: 'apply_lut')."""
+    _handlers[kind] = handler
+
+def _insert_job(conn: sqlite3.Connection, kind: str, params: Dict[str, Any], item_keys: List[str], owner: Optional[str]) -> str:
+    job_id = f"job_{uuid.uuid4().hex[:16]}"
+    now = _now()
+    conn.execute(
+        "INSERT INTO jobs (id, kind, owner, status, params, total, created_at) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+        (job_id, kind, owner, json.dumps(params, ensure_ascii=False, sort_keys=True), len(item_keys), now),
+    )
+    conn.executemany(
+        "INSERT INTO job_items (job_id, seq, item_key, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+        [(job_id, i, str(k), now) for i, k in enumerate(item_keys)],
+    )
+    return job_id
+
+def create_job(kind: str, params: Dict[str, Any], item_keys: List[str], owner: Optional[str] = None) -> Dict[str, Any]:
+    conn = _connect()
+    try:
+        with conn:
+            job_id = _insert_job(conn, kind, params, item_keys, owner)
+    finally:
+        conn.close()
+    return get_job(job_id, include_items=False)
+
+def ensure_job(kind: str, params: Dict[str, Any], item_keys: List[str], owner: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+    """
+    Job ativo (queued/running) do mesmo tipo e parâmetros ou um novo, numa única transação:
+    chamadas concorrentes (threads ou workers) compartilham o mesmo job. Retorna (job, criado).
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND params = ? AND status IN ('queued', 'running') ORDER BY created_at LIMIT 1",
+                (kind, json.dumps(params, ensure_ascii=False, sort_keys=True)),
+            ).fetchone()
+            job_id = row["id"] if row else _insert_job(conn, kind, params, item_keys, owner)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+    return get_job(job_id, include_items=False), row is None
+
+def get_job(job_id: str, include_items: bool = True) -> Optional[Dict[str, Any]]:
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        job = _job_row(row)
+        if include_items:
+            rows = conn.execute("SELECT * FROM job_items WHERE job_id = ? ORDER BY seq", (job_id,)).fetchall()
+            job["items"] = [_item_row(r) for r in rows]
+    finally:
+        conn.close()
+    job["progress"] = round((job["done"] + job["failed"]) / job["total"], 4) if job["total"] else 1.0
+    return job
+
+def request_cancel(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Pede cancelamento. Jobs ainda na fila são cancelados na hora; em execução,
+    o worker para de enviar itens novos e termina os que já estão em andamento.
+    """
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status NOT IN ('completed', 'failed', 'cancelled')", (job_id,))
+            # ainda na fila: ninguém reivindicou, cancela aqui (e _claim não pega mais)
+            _finish_cancelled(conn, job_id, only_queued=True)
+    finally:
+        conn.close()
+    return get_job(job_id, include_items=False)
+
+def _finish_cancelled(conn: sqlite3.Connection, job_id: str, only_queued: bool = False):
+    now = _now()
+    cond = "status = 'queued'" if only_queued else "status NOT IN ('completed', 'failed', 'cancelled')"
+    cur = conn.execute(f"UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND cancel_requested = 1 AND {cond}", (now, job_id))
+    if cur.rowcount:
+        conn.execute("UPDATE job_items SET status = 'cancelled', updated_at = ? WHERE job_id = ? AND status = 'pending'", (now, job_id))
+
+def _claim(conn: sqlite3.Connection, job_id: str) -> bool:
+    """queued -> running numa única instrução: só um processo/thread executa cada job."""
+    with conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'running', runner = ?, started_at = COALESCE(started_at, ?) WHERE id = ? AND status = 'queued'",
+            (_process_token(os.getpid()), _now(), job_id),
+        )
+    return cur.rowcount == 1
+
+def _process_token(pid: int) -> Optional[str]:
+    """"pid:início" do processo (Linux: /proc/<pid>/stat), para não confundir um pid reaproveitado após reinício."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            start = f.read().rsplit(")", 1)[1].split()[19]
+        return f"{pid}:{start}"
+    except (OSError, IndexError):
+        pass
+    if os.path.isdir("/proc"):
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return None
+    except OSError:
+        pass
+    return str(pid)
+
+def _runner_alive(runner: Optional[str]) -> bool:
+    if not runner:
+        return False
+    try:
+        return _process_token(int(str(runner).split(":")[0])) == runner
+    except ValueError:
+        return False
+
+class JobContext:
+    """Interface do handler com o banco: progresso por item e checagem de cancelamento."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._conn = _connect()
+
+    def is_cancelled(self) -> bool:
+        row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def item_done(self, seq: int, result: Optional[Dict[str, Any]] = None):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE job_items SET status = 'done', result = ?, error = NULL, updated_at = ? WHERE job_id = ? AND seq = ?",
+                (json.dumps(result, ensure_ascii=False) if result is not None else None, _now(), self.job_id, seq),
+            )
+            self._conn.execute("UPDATE jobs SET done = done + 1 WHERE id = ?", (self.job_id,))
+
+    def item_checkpoint(self, seq: int, data: Dict[str, Any]):
+        """Grava dados de um item ainda pendente (ex.: o que está para ser escrito); a retomada os recebe em item["result"]."""
+        with self._conn:
+            self._conn.execute(
+                "UPDATE job_items SET result = ?, updated_at = ? WHERE job_id = ? AND seq = ? AND status = 'pending'",
+                (json.dumps(data, ensure_ascii=False), _now(), self.job_id, seq),
+            )
+
+    def item_failed(self, seq: int, error: str):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE job_items SET status = 'failed', error = ?, updated_at = ? WHERE job_id = ? AND seq = ?",
+                (str(error)[:500], _now(), self.job_id, seq),
+            )
+            self._conn.execute("UPDATE jobs SET failed = failed + 1 WHERE id = ?", (self.job_id,))
+
+    def close(self):
+        self._conn.close()
+
+def _run(job_id: str):
+    conn = _connect()
+    ctx = JobContext(job_id)
+    try:
+        if not _claim(conn, job_id):
+            return
+        job = get_job(job_id, include_items=True)
+        handler = _handlers.get(job["kind"])
+        if handler is None:
+            with conn:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                             (f"Tipo de job desconhecido: {job['kind']}", _now(), job_id))
+            return
+        pending = [it for it in job.pop("items") if it["status"] == "pending"]
+        try:
+            handler(job, pending, ctx)
+        except Exception as e:
+            with conn:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?", (str(e)[:500], _now(), job_id))
+            return
+        with conn:
+            if ctx.is_cancelled():
+                _finish_cancelled(conn, job_id)
+            else:
+                conn.execute("UPDATE jobs SET status = 'completed', finished_at = ? WHERE id = ?", (_now(), job_id))
+    finally:
+        ctx.close()
+        conn.close()
+        with _running_lock:
+            _running.pop(job_id, None)
+
+def submit_job(job_id: str):
+    """Executa o job em uma thread de fundo (o trabalho pesado vai para o pool de processos)."""
+    with _running_lock:
+        if job_id in _running:
+            return
+        t = threading.Thread(target=_run, args=(job_id,), name=f"job-{job_id}", daemon=True)
+        _running[job_id] = t
+    t.start()
+
+def resume_jobs() -> int:
+    """
+    Retoma jobs interrompidos (reinício do servidor): itens 'pending' voltam a
+    ser processados; itens já concluídos não são refeitos. Roda em cada worker do
+    uvicorn: jobs 'running' de processo morto voltam para a fila uma única vez e
+    cada job é reivindicado por um só processo (_claim).
+    """
+    conn = _connect()
+    try:
+        with conn:
+            rows = conn.execute("SELECT id, status, runner, cancel_requested FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at").fetchall()
+            for r in rows:
+                if r["status"] == "running" and not _runner_alive(r["runner"]):
+                    conn.execute("UPDATE jobs SET status = 'queued', runner = NULL WHERE id = ? AND status = 'running' AND runner IS ?", (r["id"], r["runner"]))
+                if r["cancel_requested"]:
+                    _finish_cancelled(conn, r["id"], only_queued=True)
+    finally:
+        conn.close()
+    resumed = 0
+    for r in rows:
+        if not r["cancel_requested"] and (r["status"] == "queued" or not _runner_alive(r["runner"])):
+            submit_job(r["id"])
+            resumed += 1
+    return resumed
@@ -1,12 +1,32 @@
 import os
 import json
+import threading
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 
+from storage_image_editor import CompiledAdjustments, compile_adjustments, _needs_3d
+
 LUTS_JSON_PATH = os.path.join(os.path.dirname(__file__), "luts.json")
 MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
 MEDIA_LUTS_DIR = os.path.join(MEDIA_DIR, "luts")
 
+# Preset compilado (LUT 1D/3D) no lugar da cadeia de ajustes em float; LUT_COMPILE=0 desliga
+LUT_COMPILE = os.environ.get("LUT_COMPILE", "1").strip().lower() not in ("0", "false", "no")
+# LUT 3D (shadows/highlights, saturation/vibrance) só sob demanda: não é idêntica à cadeia em float
+# (saturation/vibrance: até ~14 níveis em ~40% dos pixels, sem ganho de tempo; ver
+# benchmarks/bench_compiled_lut.py). Desligada, esses presets usam a cadeia em float.
+LUT_COMPILE_3D = os.environ.get("LUT_COMPILE_3D", "0").strip().lower() in ("1", "true", "yes")
+# resolução da grade 3D (33 ou 65)
+LUT_GRID_SIZE = int(os.environ.get("LUT_GRID_SIZE", "33"))
+
+# cache de presets compilados: por id do LUT e por parâmetros (editor)
+_COLOR_KEYS = ("exposure", "gamma", "brightness", "shadows", "highlights", "curves_strength", "temperature", "saturation", "vibrance", "contrast")
+_compiled_by_id: Dict[int, Tuple[str, CompiledAdjustments]] = {}
+_compiled_by_params: "OrderedDict[str, CompiledAdjustments]" = OrderedDict()
+_compiled_lock = threading.Lock()
+_COMPILED_PARAMS_MAX = 32
+
 def _ensure_json():
     os.makedirs(os.path.dirname(LUTS_JSON_PATH), exist_ok=True)
     os.makedirs(MEDIA_LUTS_DIR, exist_ok=True)
@@ -53,6 +73,51 @@ def _copy_thumb_from_static(static_url: Optional[str], username: str, lut_id: in
     # URL servida
     return f"static/luts/{fname}"
 
+def _color_key(params: Dict[str, Any]) -> str:
+    # só os ajustes de cor entram no LUT (crop e vinheta são aplicados à parte)
+    return json.dumps({k: (params or {}).get(k) for k in _COLOR_KEYS}, sort_keys=True, default=str)
+
+def compiled_for_params(params: Dict[str, Any]) -> Optional[CompiledAdjustments]:
+    """Preset compilado para parâmetros avulsos (editor); None quando o modo compilado está desligado."""
+    if not LUT_COMPILE or (_needs_3d(params or {}) and not LUT_COMPILE_3D):
+        return None
+    key = _color_key(params)
+    with _compiled_lock:
+        hit = _compiled_by_params.get(key)
+        if hit is not None:
+            _compiled_by_params.move_to_end(key)
+            return hit
+    compiled = compile_adjustments(params or {}, size=LUT_GRID_SIZE)
+    with _compiled_lock:
+        _compiled_by_params[key] = compiled
+        while len(_compiled_by_params) > _COMPILED_PARAMS_MAX:
+            _compiled_by_params.popitem(last=False)
+    return compiled
+
+def get_compiled_lut(lut_id: int, params: Optional[Dict[str, Any]] = None) -> Optional[CompiledAdjustments]:
+    """
+    Preset compilado do LUT (cache por id). 'params' evita reler o luts.json quando o
+    chamador já tem os parâmetros; se o preset mudar, a chave de parâmetros invalida o cache.
+    """
+    if not LUT_COMPILE:
+        return None
+    if params is None:
+        preset = get_lut_by_id(lut_id)
+        if not preset:
+            return None
+        params = dict(preset.get("params") or {})
+    if _needs_3d(params) and not LUT_COMPILE_3D:
+        return None
+    key = _color_key(params)
+    with _compiled_lock:
+        hit = _compiled_by_id.get(int(lut_id))
+        if hit is not None and hit[0] == key:
+            return hit[1]
+    compiled = compile_adjustments(params, size=LUT_GRID_SIZE)
+    with _compiled_lock:
+        _compiled_by_id[int(lut_id)] = (key, compiled)
+    return compiled
+
 def get_luts_for_user(username: str) -> List[Dict[str, Any]]:
     data = _load()
     out: List[Dict[str, Any]] = []
@@ -125,6 +190,8 @@ def delete_lut(lut_id: int, username: str) -> bool:
     if deleted:
         data["presets"] = new_list
         _save(data)
+        with _compiled_lock:
+            _compiled_by_id.pop(int(lut_id), None)
         if thumb_to_delete and os.path.isfile(thumb_to_delete):
             try:
                 os.remove(thumb_to_delete)
@@ -4,6 +4,8 @@ import json
 import base64
 from typing import Optional, Dict, List, Tuple
 
+from storage_db import open_table
+
 PROJECTS_CSV_PATH = os.environ.get(
     "PROJECTS_CSV_PATH",
     os.path.join(os.path.dirname(__file__), "projects.csv"),
@@ -71,19 +73,8 @@ def _safe_filename(name: str) -> str:
     return "".join(ch if ch.isalnum() or ch in ("-", "_", ".", " ") else "_" for ch in name).strip().replace(" ", "_")
 
 
-def _next_id() -> int:
-    _ensure_csv()
-    max_id = 0
-    with open(PROJECTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                rid = int(row.get("id", "0") or "0")
-                if rid > max_id:
-                    max_id = rid
-            except Exception:
-                continue
-    return max_id + 1
+# NOVO: tabela do backend configurado (CSV com cache ou SQLite, ver storage_db)
+_projects = open_table("projects", lambda: PROJECTS_CSV_PATH, CSV_FIELDS, key="id", ensure=_ensure_csv)
 
 
 # ---------- Cálculo de itens e totais ----------
@@ -113,27 +104,24 @@ def _calc_items_and_totals(items: List[Dict], discount_percent: float) -> Tuple[
 # ---------- CRUD Projetos ----------
 
 def get_all_projects() -> List[Dict]:
-    _ensure_csv()
     result: List[Dict] = []
-    with open(PROJECTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                items = json.loads(row.get("items_json", "[]"))
-            except Exception:
-                items = []
-            result.append({
-                "id": int(row.get("id", "0") or "0"),
-                "name": row.get("name", ""),
-                "description": row.get("description", ""),
-                "client_id": int(row.get("client_id", "0") or "0"),
-                "client_name": row.get("client_name", ""),
-                "status": row.get("status", "Pendente"),
-                "discount_percent": float(row.get("discount_percent", "0") or 0),
-                "items": items,
-                "total_value": float(row.get("total_value", "0") or 0),
-                "discounted_total_value": float(row.get("discounted_total_value", "0") or 0),
-            })
+    for row in _projects.rows():
+        try:
+            items = json.loads(row.get("items_json", "[]"))
+        except Exception:
+            items = []
+        result.append({
+            "id": int(row.get("id", "0") or "0"),
+            "name": row.get("name", ""),
+            "description": row.get("description", ""),
+            "client_id": int(row.get("client_id", "0") or "0"),
+            "client_name": row.get("client_name", ""),
+            "status": row.get("status", "Pendente"),
+            "discount_percent": float(row.get("discount_percent", "0") or 0),
+            "items": items,
+            "total_value": float(row.get("total_value", "0") or 0),
+            "discounted_total_value": float(row.get("discounted_total_value", "0") or 0),
+        })
     return result
 
 
@@ -146,14 +134,12 @@ def add_project(
     discount_percent: float,
     items: List[Dict],
 ) -> Dict:
-    _ensure_csv()
     if status not in STATUS_VALUES:
         status = "Pendente"
-    project_id = _next_id()
     calc_items, total, discounted_total = _calc_items_and_totals(items or [], discount_percent or 0)
-    with open(PROJECTS_CSV_PATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writerow({
+    with _projects.transaction():
+        project_id = _projects.next_id()
+        _projects.insert({
             "id": str(project_id),
             "name": name,
             "description": description,
@@ -189,83 +175,52 @@ def update_project(
     discount_percent: Optional[float] = None,
     items: Optional[List[Dict]] = None,
 ) -> Optional[Dict]:
-    _ensure_csv()
-    updated = None
-    rows = []
-    with open(PROJECTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("id") == str(project_id):
-                new_name = name if name is not None else row.get("name", "")
-                new_desc = description if description is not None else row.get("description", "")
-                new_client_id = client_id if client_id is not None else int(row.get("client_id", "0") or 0)
-                new_client_name = client_name if client_name is not None else row.get("client_name", "")
-                new_status = status if status is not None else row.get("status", "Pendente")
-                new_discount = discount_percent if discount_percent is not None else float(row.get("discount_percent", "0") or 0)
-                # itens
-                try:
-                    prev_items = json.loads(row.get("items_json", "[]"))
-                except Exception:
-                    prev_items = []
-                new_items = items if items is not None else prev_items
-                calc_items, total, discounted_total = _calc_items_and_totals(new_items or [], new_discount or 0)
-                new_row = {
-                    "id": str(project_id),
-                    "name": new_name,
-                    "description": new_desc,
-                    "client_id": str(new_client_id),
-                    "client_name": new_client_name,
-                    "status": new_status if new_status in STATUS_VALUES else "Pendente",
-                    "discount_percent": str(new_discount or 0),
-                    "items_json": json.dumps(calc_items, ensure_ascii=False),
-                    "total_value": str(total),
-                    "discounted_total_value": str(discounted_total),
-                }
-                rows.append(new_row)
-                updated = {
-                    "id": project_id,
-                    "name": new_name,
-                    "description": new_desc,
-                    "client_id": new_client_id,
-                    "client_name": new_client_name,
-                    "status": new_row["status"],
-                    "discount_percent": float(new_discount or 0),
-                    "items": calc_items,
-                    "total_value": total,
-                    "discounted_total_value": discounted_total,
-                }
-            else:
-                rows.append(row)
-    if updated is None:
-        return None
-    with open(PROJECTS_CSV_PATH, "w", newline="", encoding="utf-8") as fw:
-        writer = csv.DictWriter(fw, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
-    return updated
+    with _projects.transaction():
+        row = _projects.get(project_id)
+        if row is None:
+            return None
+        new_name = name if name is not None else row.get("name", "")
+        new_desc = description if description is not None else row.get("description", "")
+        new_client_id = client_id if client_id is not None else int(row.get("client_id", "0") or 0)
+        new_client_name = client_name if client_name is not None else row.get("client_name", "")
+        new_status = status if status is not None else row.get("status", "Pendente")
+        new_discount = discount_percent if discount_percent is not None else float(row.get("discount_percent", "0") or 0)
+        # itens
+        try:
+            prev_items = json.loads(row.get("items_json", "[]"))
+        except Exception:
+            prev_items = []
+        new_items = items if items is not None else prev_items
+        calc_items, total, discounted_total = _calc_items_and_totals(new_items or [], new_discount or 0)
+        new_row = {
+            "id": str(project_id),
+            "name": new_name,
+            "description": new_desc,
+            "client_id": str(new_client_id),
+            "client_name": new_client_name,
+            "status": new_status if new_status in STATUS_VALUES else "Pendente",
+            "discount_percent": str(new_discount or 0),
+            "items_json": json.dumps(calc_items, ensure_ascii=False),
+            "total_value": str(total),
+            "discounted_total_value": str(discounted_total),
+        }
+        _projects.put(new_row)
+    return {
+        "id": project_id,
+        "name": new_name,
+        "description": new_desc,
+        "client_id": new_client_id,
+        "client_name": new_client_name,
+        "status": new_row["status"],
+        "discount_percent": float(new_discount or 0),
+        "items": calc_items,
+        "total_value": total,
+        "discounted_total_value": discounted_total,
+    }
 
 
 def delete_project(project_id: int) -> bool:
-    _ensure_csv()
-    before = 0
-    rows = []
-    removed = False
-    with open(PROJECTS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            before += 1
-            if row.get("id") == str(project_id):
-                removed = True
-                continue
-            rows.append(row)
-    if removed:
-        with open(PROJECTS_CSV_PATH, "w", newline="", encoding="utf-8") as fw:
-            writer = csv.DictWriter(fw, fieldnames=CSV_FIELDS)
-            writer.writeheader()
-            for row in rows:
-                writer.writerow(row)
-    return removed
+    return _projects.delete(project_id)
 
 
 # ---------- Anexos por projeto (limite 50 MB por projeto) ----------
@@ -0,0 +1,72 @@
+import os
+import uuid
+import shutil
+import hashlib
+from typing import Any, NamedTuple, Optional
+
+# Uploads em streaming: o corpo de cada arquivo é copiado em blocos de UPLOAD_CHUNK_BYTES
+# para um arquivo temporário em backend/.uploads (ao lado de media/: mesmo disco do destino ->
+# os.replace barato, mas fora do que é servido em /static), com sha256 e tamanho calculados durante
+# a cópia. Nenhuma rota mantém o arquivo inteiro em memória.
+
+UPLOAD_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR") or os.path.join(os.path.dirname(__file__), ".uploads")
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", str(1 << 20)))
+
+
+class StagedUpload(NamedTuple):
+    """Arquivo recebido e já gravado em disco (caminho temporário, bytes, sha256 hex)."""
+    path: str
+    size: int
+    sha256: str
+
+
+class UploadTooLarge(ValueError):
+    """O arquivo passou do limite informado (a cópia é interrompida e o temporário removido)."""
+
+
+async def stage_upload(file: Any, limit: Optional[int] = None) -> StagedUpload:
+    """
+    Copia um UploadFile em blocos para um temporário, calculando hash e tamanho.
+    Com limit, aborta com UploadTooLarge assim que o tamanho o ultrapassa.
+    """
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}.part")
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    raise UploadTooLarge(f"arquivo maior que {limit} bytes")
+                h.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        discard(path)
+        raise
+    finally:
+        # libera o arquivo temporário do multipart assim que copiado
+        try:
+            await file.close()
+        except Exception:
+            pass
+    return StagedUpload(path, size, h.hexdigest())
+
+
+def commit_upload(staged: StagedUpload, dest: str) -> None:
+    """Move o temporário para o destino final (rename; cópia se estiver em outro disco)."""
+    try:
+        os.replace(staged.path, dest)
+    except OSError:
+        shutil.move(staged.path, dest)
+
+
+def discard(path: str) -> None:
+    """Remove um temporário que sobrou (erro no meio do upload ou na ingestão)."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
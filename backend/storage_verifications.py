@@ -1,12 +1,29 @@
 import os
+import copy
 import json
+import time
 import uuid
-from typing import Dict, Any, List, Optional
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 from datetime import datetime
 
+try:
+    import fcntl  # trava entre processos (workers do uvicorn); ausente no Windows
+except ImportError:  # pragma: no cover
+    fcntl = None
+
 VERIFICATIONS_DIR = os.path.join(os.path.dirname(__file__), "media", "verifications")
 LISTS_PATH = os.path.join(VERIFICATIONS_DIR, "lists.json")
 SESSIONS_PATH = os.path.join(VERIFICATIONS_DIR, "sessions.json")
+# NOVO: sessions.json é o snapshot; cada alteração vira uma linha no diário (append-only),
+# reaplicado sobre o snapshot. Acima de VERIFY_COMPACT_BYTES o diário é compactado no snapshot.
+JOURNAL_PATH = os.path.join(VERIFICATIONS_DIR, "sessions.journal")
+LOCK_PATH = os.path.join(VERIFICATIONS_DIR, "sessions.lock")
+VERIFY_COMPACT_BYTES = int(os.environ.get("VERIFY_COMPACT_BYTES", str(4 << 20)))
+# leitura repetida do mesmo código dentro da janela (segundos desde a última leitura) é descartada
+VERIFY_DEDUP_SECONDS = float(os.environ.get("VERIFY_DEDUP_SECONDS", "2.0"))
+VERIFY_BATCH_MAX = int(os.environ.get("VERIFY_BATCH_MAX", "5000"))
 
 def _ensure_store():
     os.makedirs(VERIFICATIONS_DIR, exist_ok=True)
@@ -29,18 +46,6 @@ def _save_lists(data: Dict[str, Any]):
     with open(LISTS_PATH, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
-def _load_sessions() -> Dict[str, Any]:
-    _ensure_store()
-    try:
-        with open(SESSIONS_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"sessions": []}
-
-def _save_sessions(data: Dict[str, Any]):
-    with open(SESSIONS_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
 # --- Listas de Verificação Personalizadas ---
 
 def get_custom_lists() -> List[Dict[str, Any]]:
@@ -68,14 +73,259 @@ def delete_custom_list(list_id: str) -> bool:
         return True
     return False
 
+# --- Estado das sessões (em memória, por processo) ---
+# _sessions: todas as sessões (ordem de criação); _codes: código -> índice do ativo, só das
+# sessões ativas; _recent: última leitura de cada código (supressão de duplicadas).
+
+_lock = threading.RLock()
+_sessions: List[Dict[str, Any]] = []
+_by_id: Dict[str, Dict[str, Any]] = {}
+_codes: Dict[str, Dict[str, int]] = {}
+_recent: Dict[str, Dict[str, float]] = {}
+_loaded_sig: Optional[Tuple[str, int, int]] = None
+_generation = 0
+_offset = 0
+_stats: Dict[str, Any] = {"reads": 0, "accepted": 0, "duplicates": 0, "unknown": 0, "appends": 0, "compactions": 0, "replayed": 0}
+
+
+def _norm(code: Any) -> str:
+    return str(code or "").strip().lower()
+
+
+def _file_sig(path: str) -> Optional[Tuple[str, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+@contextmanager
+def _locked():
+    """Trava do processo + trava de arquivo (os demais workers gravam no mesmo diário)."""
+    with _lock:
+        _ensure_store()
+        if fcntl is None:
+            yield
+            return
+        with open(LOCK_PATH, "a") as fl:
+            fcntl.flock(fl, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fl, fcntl.LOCK_UN)
+
+
+def _index_session(session: Dict[str, Any]):
+    sid = session.get("id")
+    if session.get("status") != "active":
+        _codes.pop(sid, None)
+        _recent.pop(sid, None)
+        return
+    codes: Dict[str, int] = {}
+    for i, asset in enumerate(session.get("assets") or []):
+        for field in ("item_code", "qr_code", "rfid_code"):
+            c = _norm(asset.get(field))
+            if c:
+                codes.setdefault(c, i)  # código repetido: vale o primeiro ativo (como na busca linear)
+    _codes[sid] = codes
+    _recent.setdefault(sid, {})
+
+
+def _add_quantity(asset: Dict[str, Any], quantity: float):
+    asset["verified_quantity"] = (asset.get("verified_quantity") or 0) + quantity
+    if asset["verified_quantity"] >= (asset.get("expected_quantity") or 1):
+        asset["verified"] = True
+
+
+def _apply(entry: Dict[str, Any]):
+    op = entry.get("op")
+    if op == "start":
+        session = entry["session"]
+        _sessions.append(session)
+        _by_id[session["id"]] = session
+        _index_session(session)
+    elif op == "status":
+        session = _by_id.get(entry.get("id"))
+        if session:
+            session["status"] = entry["status"]
+            session["end_time"] = entry.get("end_time")
+            _index_session(session)
+    elif op == "verify":
+        session = _by_id.get(entry.get("id"))
+        if not session:
+            return
+        assets = session.get("assets") or []
+        recent = _recent.get(session["id"])
+        ts = float(entry.get("ts") or 0.0)
+        for idx, quantity, code in entry.get("items") or []:
+            if 0 <= idx < len(assets):
+                _add_quantity(assets[idx], quantity)
+            if recent is not None and code:
+                recent[code] = max(recent.get(code, 0.0), ts)
+
+
+def _reload():
+    """Snapshot + diário (se for da mesma geração do snapshot)."""
+    global _sessions, _by_id, _codes, _recent, _loaded_sig, _generation, _offset
+    try:
+        with open(SESSIONS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        data = {"sessions": []}
+    _sessions, _by_id, _codes, _recent = [], {}, {}, {}
+    _generation = int(data.get("generation") or 0)
+    _offset = 0
+    for session in data.get("sessions", []):
+        _sessions.append(session)
+        _by_id[session.get("id")] = session
+        _index_session(session)
+    _loaded_sig = _file_sig(SESSIONS_PATH)
+    _replay()
+
+
+def _replay():
+    """Aplica as linhas do diário gravadas (por este ou outro processo) desde a última leitura."""
+    global _offset
+    try:
+        f = open(JOURNAL_PATH, "rb+")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(_offset)
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # linha incompleta (queda no meio de uma gravação): descarta antes de continuar
+            f.truncate(_offset + end)
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "generation" in entry:
+                if int(entry["generation"]) != _generation:
+                    # diário anterior à última compactação (queda entre as duas gravações): já está no snapshot
+                    f.truncate(0)
+                    _offset = 0
+                    return
+                continue
+            _apply(entry)
+            _stats["replayed"] += 1
+        _offset += end
+
+
+def _sync():
+    """Atualiza o estado em memória com o que estiver em disco (chamado com a trava)."""
+    if _loaded_sig is None or _file_sig(SESSIONS_PATH) != _loaded_sig:
+        _reload()
+        return
+    try:
+        size = os.path.getsize(JOURNAL_PATH)
+    except OSError:
+        size = 0
+    if size < _offset:
+        _reload()
+    elif size > _offset:
+        _replay()
+
+
+def _append(entries: Iterable[Dict[str, Any]]):
+    """Grava no diário e aplica no estado em memória (chamado com a trava, após _sync)."""
+    global _offset
+    entries = list(entries)
+    if not entries:
+        return
+    lines = []
+    if _offset == 0:
+        lines.append(json.dumps({"generation": _generation}))
+    lines.extend(json.dumps(e, ensure_ascii=False) for e in entries)
+    payload = ("\n".join(lines) + "\n").encode("utf-8")
+    with open(JOURNAL_PATH, "ab") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    _offset += len(payload)
+    for e in entries:
+        _apply(e)
+    _stats["appends"] += 1
+    if _offset > VERIFY_COMPACT_BYTES:
+        _compact()
+
+
+def _write_atomic(path: str, text: str):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _compact():
+    """Grava o estado atual como snapshot da próxima geração e recomeça o diário."""
+    global _generation, _offset, _loaded_sig
+    _generation += 1
+    _write_atomic(SESSIONS_PATH, json.dumps({"generation": _generation, "sessions": _sessions}, ensure_ascii=False, indent=2))
+    header = json.dumps({"generation": _generation}) + "\n"
+    _write_atomic(JOURNAL_PATH, header)
+    _offset = len(header.encode("utf-8"))
+    _loaded_sig = _file_sig(SESSIONS_PATH)
+    _stats["compactions"] += 1
+
+
+def compact_sessions():
+    """Compacta o diário no snapshot (também ocorre sozinho acima de VERIFY_COMPACT_BYTES)."""
+    with _locked():
+        _sync()
+        _compact()
+
+
+def _progress(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Ativos verificados/esperados no total e por unidade."""
+    units: Dict[str, Dict[str, int]] = {}
+    verified = 0
+    for asset in session.get("assets") or []:
+        u = units.setdefault(str(asset.get("unit_id") or ""), {"verified": 0, "expected": 0})
+        u["expected"] += 1
+        if asset.get("verified"):
+            u["verified"] += 1
+            verified += 1
+    return {"verified_count": verified, "total": len(session.get("assets") or []), "units": units}
+
+
+def session_progress(session_id: str) -> Optional[Dict[str, Any]]:
+    with _locked():
+        _sync()
+        session = _by_id.get(session_id)
+        if not session:
+            return None
+        return {"status": session.get("status"), **_progress(session)}
+
+
+def verification_stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            **_stats,
+            "sessions": len(_sessions),
+            "active_sessions": len(_codes),
+            "indexed_codes": sum(len(c) for c in _codes.values()),
+            "journal_bytes": _offset,
+            "generation": _generation,
+            "dedup_seconds": VERIFY_DEDUP_SECONDS,
+        }
+
 # --- Sessões de Verificação ---
 
 def get_sessions() -> List[Dict[str, Any]]:
-    return _load_sessions().get("sessions", [])
+    with _locked():
+        _sync()
+        return copy.deepcopy(_sessions)
 
 def get_session(session_id: str) -> Optional[Dict[str, Any]]:
-    sessions = get_sessions()
-    return next((s for s in sessions if s.get("id") == session_id), None)
+    with _locked():
+        _sync()
+        session = _by_id.get(session_id)
+        return copy.deepcopy(session) if session else None
 
 def start_session(
     user: str,
@@ -85,7 +335,6 @@ def start_session(
     target_id: str, # unit_id or custom_list_id
     assets_to_verify: List[Dict[str, Any]]
 ) -> Dict[str, Any]:
-    data = _load_sessions()
     session = {
         "id": f"session_{uuid.uuid4().hex[:8]}",
         "user": user,
@@ -101,6 +350,9 @@ def start_session(
                 "id": asset["id"],
                 "name": asset["name"],
                 "item_code": asset["item_code"],
+                # NOVO: QR/RFID acompanham o ativo (leitores enviam esses códigos)
+                "qr_code": asset.get("qr_code", ""),
+                "rfid_code": asset.get("rfid_code", ""),
                 "unit_id": asset["unit_id"],
                 "unit_path": asset.get("unit_path", ""),
                 "expected_quantity": asset.get("quantity", 1),
@@ -110,41 +362,81 @@ def start_session(
             for asset in assets_to_verify
         ],
     }
-    data["sessions"].append(session)
-    _save_sessions(data)
-    return session
+    with _locked():
+        _sync()
+        _append([{"op": "start", "session": session}])
+    return copy.deepcopy(session)
 
 def update_session_status(session_id: str, status: str) -> Optional[Dict[str, Any]]:
-    data = _load_sessions()
-    session = next((s for s in data["sessions"] if s.get("id") == session_id), None)
-    if not session:
-        return None
-    session["status"] = status
-    session["end_time"] = datetime.utcnow().isoformat()
-    _save_sessions(data)
-    return session
+    with _locked():
+        _sync()
+        if session_id not in _by_id:
+            return None
+        _append([{"op": "status", "id": session_id, "status": status, "end_time": datetime.utcnow().isoformat()}])
+        return copy.deepcopy(_by_id[session_id])
 
 def verify_item_in_session(session_id: str, item_code: str, quantity: float) -> Optional[Dict[str, Any]]:
-    data = _load_sessions()
-    session = next((s for s in data["sessions"] if s.get("id") == session_id), None)
-    if not session or session["status"] != "active":
-        return None
-    
-    found_item = None
-    code_lower = item_code.lower()
-    for asset in session["assets"]:
-        item_c = (asset.get("item_code") or "").lower()
-        qr_c = (asset.get("qr_code") or "").lower()
-        rfid_c = (asset.get("rfid_code") or "").lower()
-
-        if code_lower in [item_c, qr_c, rfid_c] and code_lower != "":
-            asset["verified_quantity"] += quantity
-            if asset["verified_quantity"] >= asset.get("expected_quantity", 1):
-                asset["verified"] = True
-            found_item = asset
-            break
-            
-    if found_item:
-        _save_sessions(data)
-        return found_item
-    return None
\ No newline at end of file
+    """Leitura manual (sem supressão de duplicadas): soma quantity ao ativo do código."""
+    code = _norm(item_code)
+    with _locked():
+        _sync()
+        codes = _codes.get(session_id)
+        if not codes or code not in codes:
+            return None
+        idx = codes[code]
+        _append([{"op": "verify", "id": session_id, "ts": time.time(), "items": [[idx, quantity, code]]}])
+        return copy.deepcopy(_by_id[session_id]["assets"][idx])
+
+def verify_batch_in_session(session_id: str, reads: List[Any]) -> Optional[Dict[str, Any]]:
+    """
+    Lote de leituras de um leitor (códigos ou {"code", "quantity"}), gravado numa única linha do diário.
+    Leituras do mesmo código a menos de VERIFY_DEDUP_SECONDS da anterior são descartadas.
+    None se a sessão não existir ou não estiver ativa.
+    """
+    if len(reads) > VERIFY_BATCH_MAX:
+        raise ValueError(f"Lote maior que {VERIFY_BATCH_MAX} leituras.")
+    now = time.time()
+    with _locked():
+        _sync()
+        codes = _codes.get(session_id)
+        if codes is None:
+            return None
+        recent = _recent.setdefault(session_id, {})
+        items: List[List[Any]] = []
+        unknown: Dict[str, None] = {}
+        duplicates = 0
+        for read in reads:
+            code, quantity = _norm(read), 1.0
+            if isinstance(read, dict):
+                code = _norm(read.get("code"))
+                try:
+                    quantity = float(read.get("quantity") or 1.0)
+                except (TypeError, ValueError):
+                    pass
+            if not code:
+                continue
+            last = recent.get(code)
+            recent[code] = now
+            if last is not None and now - last < VERIFY_DEDUP_SECONDS:
+                duplicates += 1
+                continue
+            idx = codes.get(code)
+            if idx is None:
+                unknown[code] = None
+                continue
+            items.append([idx, quantity, code])
+        if items:
+            _append([{"op": "verify", "id": session_id, "ts": now, "items": items}])
+        assets = _by_id[session_id]["assets"]
+        touched = sorted({i for i, _, _ in items})
+        _stats["reads"] += len(reads)
+        _stats["accepted"] += len(items)
+        _stats["duplicates"] += duplicates
+        _stats["unknown"] += len(unknown)
+        return {
+            "accepted": len(items),
+            "duplicates": duplicates,
+            "unknown": list(unknown),
+            "items": [copy.deepcopy(assets[i]) for i in touched],
+            **_progress(_by_id[session_id]),
+        }
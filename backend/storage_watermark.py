@@ -0,0 +1,232 @@
+import os
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from storage_derivatives import display_oriented, exif_orientation
+from storage_encoding import encode, extension, get_policy, source_metadata
+
+# Versões com marca d'água servidas na busca pública: renderizadas sob demanda em tamanho
+# limitado (formato da política 'watermark', ver storage_encoding) e guardadas num cache em disco LRU com orçamento de bytes.
+# A marca d'água já escalada fica em memória por largura alvo (não reabre/reescala o PNG a cada foto).
+
+MEDIA_DIR = os.path.join(os.path.dirname(__file__), "media")
+WM_CACHE_DIR = os.path.join(MEDIA_DIR, "wm_cache")
+
+# tamanhos servidos (lado maior, px): o pedido é arredondado para o próximo degrau
+WATERMARK_SIZES: List[int] = sorted(int(v) for v in os.environ.get("WATERMARK_SIZES", "512,1024,1600").split(",") if v.strip())
+# orçamento do cache em disco (MB); acima disso os menos usados são removidos
+WATERMARK_CACHE_MB = float(os.environ.get("WATERMARK_CACHE_MB", "512"))
+# marcas d'água escaladas mantidas em memória (uma por largura)
+WATERMARK_SCALED_MAX = 64
+
+_lock = threading.Lock()
+_base: Optional[Tuple[float, Image.Image]] = None  # (mtime, RGBA original)
+_scaled: "OrderedDict[Tuple[float, int], Image.Image]" = OrderedDict()
+_disk: Optional["OrderedDict[str, int]"] = None  # caminho -> bytes, do menos para o mais usado
+_disk_bytes = 0
+_stats: Dict[str, Any] = {
+    "hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0,
+    "scaled_hits": 0, "scaled_misses": 0, "render_seconds": [],
+}
+_RENDER_SAMPLES = 512
+
+def _watermark_path() -> str:
+    return os.path.join(MEDIA_DIR, "watermark", "watermark.png")
+
+def _watermark_mtime() -> Optional[float]:
+    try:
+        return os.path.getmtime(_watermark_path())
+    except OSError:
+        return None
+
+def _scaled_watermark(target_w: int) -> Optional[Image.Image]:
+    """Marca d'água RGBA com largura target_w (cache em memória; recarrega se o PNG mudar)."""
+    global _base
+    mtime = _watermark_mtime()
+    if mtime is None:
+        return None
+    key = (mtime, int(target_w))
+    with _lock:
+        wm = _scaled.get(key)
+        if wm is not None:
+            _scaled.move_to_end(key)
+            _stats["scaled_hits"] += 1
+            return wm
+        _stats["scaled_misses"] += 1
+        if _base is None or _base[0] != mtime:
+            with Image.open(_watermark_path()) as f:
+                _base = (mtime, f.convert("RGBA"))
+            _scaled.clear()
+        base = _base[1]
+    scale = target_w / base.width
+    wm = base.resize((int(target_w), max(1, int(base.height * scale))), Image.LANCZOS)
+    with _lock:
+        _scaled[key] = wm
+        while len(_scaled) > WATERMARK_SCALED_MAX:
+            _scaled.popitem(last=False)
+    return wm
+
+def apply_center_watermark(img: Image.Image) -> Image.Image:
+    """
+    Aplica PNG de marca d'água central, escalando para ~50% da largura da imagem (com limites).
+    """
+    W, H = img.width, img.height
+    # Escala alvo: 50% da largura da imagem (máx 80%, mín 20%)
+    target_w = max(int(W * 0.2), min(int(W * 0.5), int(W * 0.8)))
+    wm = _scaled_watermark(max(1, target_w))
+    if wm is None:
+        return img
+    # Centro
+    x = (W - wm.width) // 2
+    y = (H - wm.height) // 2
+    # Composição
+    base = img.convert("RGBA")
+    base.alpha_composite(wm, (max(0, x), max(0, y)))
+    return base.convert("RGB")
+
+def bucket_size(size: Optional[int]) -> int:
+    """Degrau de WATERMARK_SIZES que atende o tamanho pedido (o maior, se passar de todos)."""
+    if not size:
+        return WATERMARK_SIZES[-1]
+    for s in WATERMARK_SIZES:
+        if s >= int(size):
+            return s
+    return WATERMARK_SIZES[-1]
+
+def _load_disk_index():
+    # primeira chamada no processo: reconstrói a ordem LRU pelo mtime dos arquivos
+    global _disk, _disk_bytes
+    entries = []
+    for root, _, names in os.walk(WM_CACHE_DIR):
+        for n in names:
+            if n.endswith(".tmp"):
+                continue
+            p = os.path.join(root, n)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, p, st.st_size))
+    entries.sort()
+    _disk = OrderedDict((p, size) for _, p, size in entries)
+    _disk_bytes = sum(size for _, _, size in entries)
+
+def _touch(path: str):
+    with _lock:
+        if _disk is None:
+            _load_disk_index()
+        if path in _disk:
+            _disk.move_to_end(path)
+    try:
+        # mtime marca o último uso (ordem LRU sobrevive a reinícios)
+        os.utime(path, None)
+    except OSError:
+        pass
+
+def _admit(path: str, size: int):
+    global _disk_bytes
+    budget = int(WATERMARK_CACHE_MB * 1024 * 1024)
+    victims = []
+    with _lock:
+        if _disk is None:
+            _load_disk_index()
+        _disk_bytes -= _disk.pop(path, 0)
+        _disk[path] = size
+        _disk_bytes += size
+        while _disk_bytes > budget and len(_disk) > 1:
+            victim, vsize = _disk.popitem(last=False)
+            _disk_bytes -= vsize
+            _stats["evictions"] += 1
+            _stats["evicted_bytes"] += vsize
+            victims.append(victim)
+    for v in victims:
+        try:
+            os.remove(v)
+        except OSError:
+            pass
+
+def render_watermarked(abs_src: str, size: Optional[int] = None, encoding: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """
+    Caminho absoluto da versão com marca d'água de abs_src (lado maior <= degrau de 'size'),
+    do cache em disco ou renderizada agora. None se o arquivo de origem não existir.
+    encoding: spec de storage_encoding (padrão: política global 'watermark').
+    """
+    spec = encoding or get_policy()["watermark"]
+    try:
+        st = os.stat(abs_src)
+    except OSError:
+        return None
+    side = bucket_size(size)
+    sig = f"{os.path.abspath(abs_src)}|{st.st_mtime_ns}|{st.st_size}|{side}|{_watermark_mtime()}|{json.dumps(spec, sort_keys=True)}"
+    key = hashlib.sha256(sig.encode("utf-8")).hexdigest()
+    abs_out = os.path.join(WM_CACHE_DIR, key[:2], f"{key}_{side}.{extension(spec)}")
+    if os.path.isfile(abs_out):
+        with _lock:
+            _stats["hits"] += 1
+        _touch(abs_out)
+        return abs_out
+
+    t0 = time.perf_counter()
+    with Image.open(abs_src) as src:
+        orientation = exif_orientation(src)
+        # pixels saem girados para a orientação de exibição
+        metadata = source_metadata(src, reset_orientation=True)
+        # JPEG: decodifica já reduzido (DCT)
+        src.draft("RGB", (side, side))
+        img = src.convert("RGB")
+    img.thumbnail((side, side), Image.LANCZOS, reducing_gap=3.0)
+    out = apply_center_watermark(display_oriented(img, orientation))
+    os.makedirs(os.path.dirname(abs_out), exist_ok=True)
+    tmp = f"{abs_out}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as fw:
+        fw.write(encode(out, spec, metadata))
+    os.replace(tmp, abs_out)
+    elapsed = time.perf_counter() - t0
+    with _lock:
+        _stats["misses"] += 1
+        samples = _stats["render_seconds"]
+        samples.append(elapsed)
+        if len(samples) > _RENDER_SAMPLES:
+            del samples[0]
+    _admit(abs_out, os.path.getsize(abs_out))
+    return abs_out
+
+def watermark_cache_stats() -> Dict[str, Any]:
+    """Acertos do cache em disco e da marca escalada, tempos de renderização e ocupação."""
+    with _lock:
+        if _disk is None:
+            _load_disk_index()
+        hits, misses = _stats["hits"], _stats["misses"]
+        s_hits, s_misses = _stats["scaled_hits"], _stats["scaled_misses"]
+        renders = sorted(_stats["render_seconds"])
+        out = {
+            "pid": os.getpid(),
+            "disk": {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+                "files": len(_disk),
+                "bytes": _disk_bytes,
+                "budget_bytes": int(WATERMARK_CACHE_MB * 1024 * 1024),
+                "evictions": _stats["evictions"],
+                "evicted_bytes": _stats["evicted_bytes"],
+            },
+            "scaled_watermark": {
+                "hits": s_hits,
+                "misses": s_misses,
+                "hit_ratio": round(s_hits / (s_hits + s_misses), 4) if s_hits + s_misses else None,
+                "entries": len(_scaled),
+            },
+            "render_ms": {
+                "samples": len(renders),
+                "avg": round(1000.0 * sum(renders) / len(renders), 2) if renders else None,
+                "p95": round(1000.0 * renders[min(len(renders) - 1, int(0.95 * len(renders)))], 2) if renders else None,
+            },
+        }
+    return out
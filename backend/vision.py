@@ -0,0 +1,158 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import cv2  # Haar cascade para rostos
+except Exception:
+    cv2 = None
+
+try:
+    import mediapipe as mp  # pose (esqueleto)
+except Exception:
+    mp = None
+
+# Modelos de visão mantidos "quentes" por processo:
+# - CascadeClassifier: uma instância por thread (detectMultiScale não é thread-safe)
+# - Pose do MediaPipe: um grafo por processo, serializado por lock
+# Carregamento preguiçoso; warmup() antecipa o custo para o startup (API e workers do pool).
+
+FACE_CASCADE_FILE = "haarcascade_frontalface_default.xml"
+
+# Resolução de detecção: rostos e esqueleto são detectados numa cópia reduzida com no
+# máximo DETECT_MAX_PIXELS e as coordenadas voltam para a resolução original. 0 = resolução cheia.
+# (ver benchmarks/bench_detection.py para escolher o valor por implantação)
+DETECT_MAX_PIXELS = int(os.environ.get("DETECT_MAX_PIXELS", "2000000"))
+
+_local = threading.local()
+_pose = None
+_pose_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {
+    "face_cascade": {"loads": 0, "init_seconds": 0.0, "calls": 0, "infer_seconds": 0.0},
+    "pose": {"loads": 0, "init_seconds": 0.0, "calls": 0, "infer_seconds": 0.0},
+}
+
+def _record(model: str, key: str, seconds: float):
+    with _stats_lock:
+        st = _stats[model]
+        if key == "init":
+            st["loads"] += 1
+            st["init_seconds"] += seconds
+        else:
+            st["calls"] += 1
+            st["infer_seconds"] += seconds
+
+def face_cascade():
+    """CascadeClassifier de rostos da thread atual (None sem OpenCV)."""
+    if cv2 is None:
+        return None
+    cascade = getattr(_local, "face_cascade", None)
+    if cascade is None:
+        t0 = time.perf_counter()
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + FACE_CASCADE_FILE)
+        _record("face_cascade", "init", time.perf_counter() - t0)
+        _local.face_cascade = cascade
+    return cascade
+
+def _get_pose():
+    global _pose
+    if _pose is None and mp is not None:
+        t0 = time.perf_counter()
+        _pose = mp.solutions.pose.Pose(static_image_mode=True, model_complexity=1, enable_segmentation=False)
+        _record("pose", "init", time.perf_counter() - t0)
+    return _pose
+
+def _proxy(arr: np.ndarray, max_pixels: Optional[int]) -> Tuple[np.ndarray, float]:
+    """Cópia reduzida (INTER_AREA) com no máximo max_pixels; retorna (array, escala aplicada)."""
+    limit = DETECT_MAX_PIXELS if max_pixels is None else int(max_pixels)
+    h, w = arr.shape[0], arr.shape[1]
+    if limit <= 0 or h * w <= limit:
+        return arr, 1.0
+    scale = (limit / float(h * w)) ** 0.5
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    if cv2 is not None:
+        small = cv2.resize(arr, size, interpolation=cv2.INTER_AREA)
+    else:
+        from PIL import Image
+        small = np.asarray(Image.fromarray(arr).resize(size, Image.BOX))
+    # escala efetiva (arredondamento do tamanho)
+    return small, small.shape[1] / float(w)
+
+def detect_faces(arr_rgb: np.ndarray, scale_factor: float = 1.2, min_neighbors: int = 6,
+                 max_pixels: Optional[int] = None) -> List[Tuple[int, int, int, int]]:
+    """
+    Rostos (x, y, w, h) numa imagem RGB uint8, em coordenadas da imagem original.
+    Detecta na cópia reduzida (max_pixels, padrão DETECT_MAX_PIXELS). Lista vazia sem OpenCV.
+    """
+    cascade = face_cascade()
+    if cascade is None:
+        return []
+    t0 = time.perf_counter()
+    gray = cv2.cvtColor(arr_rgb, cv2.COLOR_RGB2GRAY) if arr_rgb.ndim == 3 else arr_rgb
+    small, scale = _proxy(gray, max_pixels)
+    faces = cascade.detectMultiScale(small, scale_factor, min_neighbors)
+    _record("face_cascade", "infer", time.perf_counter() - t0)
+    if scale == 1.0:
+        return [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in faces]
+    H, W = gray.shape[0], gray.shape[1]
+    out = []
+    for (x, y, w, h) in faces:
+        x0, y0 = int(round(x / scale)), int(round(y / scale))
+        out.append((x0, y0, min(int(round(w / scale)), W - x0), min(int(round(h / scale)), H - y0)))
+    return out
+
+def detect_pose(arr_rgb: np.ndarray, max_pixels: Optional[int] = None) -> Optional[Any]:
+    """
+    Landmarks da pose (resultado do MediaPipe) ou None se não houver pessoa / MediaPipe.
+    Landmarks são normalizados (0..1), então valem para a imagem original sem conversão.
+    """
+    if mp is None:
+        return None
+    small, _ = _proxy(arr_rgb, max_pixels)
+    with _pose_lock:
+        pose = _get_pose()
+        t0 = time.perf_counter()
+        res = pose.process(np.ascontiguousarray(small))
+        _record("pose", "infer", time.perf_counter() - t0)
+    return res.pose_landmarks
+
+def warmup() -> Dict[str, Any]:
+    """Carrega os modelos disponíveis agora (custo único de inicialização)."""
+    face_cascade()
+    if mp is not None:
+        with _pose_lock:
+            _get_pose()
+    return vision_stats()
+
+def _reset_after_fork():
+    # processos filhos (pool de workers) não herdam o grafo do MediaPipe do pai:
+    # recriam os modelos; a referência antiga é mantida só para não ser finalizada no filho
+    global _pose, _local, _inherited, _pose_lock, _stats_lock
+    _inherited = _pose
+    _pose = None
+    _local = threading.local()
+    # locks podem ter sido copiados "travados" por outra thread do pai
+    _pose_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    for st in _stats.values():
+        for k in st:
+            st[k] = 0
+
+_inherited = None
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def vision_stats() -> Dict[str, Any]:
+    """Tempos de inicialização e de inferência dos modelos neste processo."""
+    with _stats_lock:
+        models = {k: dict(v) for k, v in _stats.items()}
+    for name, st in models.items():
+        st["available"] = (cv2 is not None) if name == "face_cascade" else (mp is not None)
+        st["init_seconds"] = round(st["init_seconds"], 4)
+        st["infer_seconds"] = round(st["infer_seconds"], 4)
+        st["avg_infer_ms"] = round(1000.0 * st["infer_seconds"] / st["calls"], 2) if st["calls"] else None
+    return {"pid": os.getpid(), "models": models}
@@ -0,0 +1,106 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+# Pool de processos compartilhado para trabalho pesado de imagem (decode, detectores, ajustes), um por
+# worker do uvicorn. WORKER_PROCESSES=0 divide os núcleos entre os workers web (WEB_CONCURRENCY, o mesmo
+# que o uvicorn lê para --workers), para a máquina toda não passar de ~1 processo de análise por núcleo;
+# 1 desliga o pool (execução inline)
+WEB_WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", "1") or 1))
+WORKERS = int(os.environ.get("WORKER_PROCESSES", "0")) or max(1, (os.cpu_count() or 1) // WEB_WORKERS)
+# carrega os modelos de visão ao subir cada worker (custo único, fora das requisições)
+VISION_WARMUP = os.environ.get("VISION_WARMUP", "1").strip().lower() not in ("0", "false", "no")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _init_worker():
+    if VISION_WARMUP:
+        from vision import warmup
+        warmup()
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool global (lazy). Retorna None quando configurado para 1 worker (execução inline)."""
+    global _pool
+    if WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, initializer=_init_worker)
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def shutdown_pool():
+    _reset_pool()
+
+def map_bounded(fn: Callable[..., Any], items: Iterable[Tuple[Any, ...]], max_inflight: Optional[int] = None,
+                stop: Optional[Callable[[], bool]] = None) -> Iterator[Tuple[int, Any, Optional[BaseException]]]:
+    """
+    Executa fn(*args) para cada item no pool de processos, mantendo no máximo
+    'max_inflight' tarefas pendentes (fila limitada: o chamador não materializa
+    todas as tarefas de uma vez). Gera (posição, resultado, erro) na ordem de conclusão.
+    Sem pool (1 worker) ou com pool quebrado, executa inline.
+    'stop' (opcional): quando retorna True, nada novo é enviado; as tarefas em voo terminam normalmente.
+    """
+    pool = get_process_pool()
+    limit = max_inflight or max(2, WORKERS * 2)
+    pending: Dict[Future, Tuple[int, Tuple[Any, ...]]] = {}
+    iterator = iter(enumerate(items))
+    exhausted = False
+
+    def _inline(pos: int, args: Tuple[Any, ...]):
+        try:
+            return pos, fn(*args), None
+        except Exception as e:
+            return pos, None, e
+
+    while True:
+        if stop is not None and not exhausted and stop():
+            exhausted = True
+            iterator = iter(())
+        while pool is not None and not exhausted and len(pending) < limit:
+            try:
+                pos, args = next(iterator)
+            except StopIteration:
+                exhausted = True
+                break
+            try:
+                pending[pool.submit(fn, *args)] = (pos, args)
+            except (BrokenProcessPool, RuntimeError):
+                _reset_pool()
+                pool = None
+                yield _inline(pos, args)
+        if pool is None:
+            # modo inline: drena o que sobrou do pool e segue serialmente
+            for fut, (pos, args) in list(pending.items()):
+                try:
+                    yield pos, fut.result(), None
+                except Exception:
+                    yield _inline(pos, args)
+            pending.clear()
+            for pos, args in iterator:
+                if stop is not None and stop():
+                    return
+                yield _inline(pos, args)
+            return
+        if not pending:
+            return
+        done, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+        for fut in done:
+            pos, args = pending.pop(fut)
+            try:
+                yield pos, fut.result(), None
+            except BrokenProcessPool:
+                _reset_pool()
+                pool = None
+                yield _inline(pos, args)
+            except Exception as e:
+                yield pos, None, e